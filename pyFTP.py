@@ -5,11 +5,23 @@
 # which does not support Passive mode or Secure FTP over SSL/TLS (FTPS). This Python implementation
 # can work in passive mode as well as over SSL/TLS (FTPS).
 #
+# Modules only needed by some commands (e.g. cProfile/pstats for profile, sqlite3 for index, hashlib for manifests,
+# json for the state files, getpass for passwords) are imported where they are used, so that short scripted runs
+# don't pay for them at startup.
+#
+import time
+startupClock = time.perf_counter()
+startupCpu = time.process_time()
+
 import os
+import posixpath
 import re
+import sys
 import argparse
 import ftplib
-import getpass
+import queue
+import socket
+import threading
 from datetime import datetime, timedelta
 
 class ftpProcess():
@@ -22,38 +34,50 @@ class ftpProcess():
         'active'        : {'avail':  1, 'func': 'active'    },
         'append'        : {'avail':  1, 'func': 'appe'      },
         'ascii'         : {'avail':  1, 'func': 'ascii'     },
+        'bandwidth'     : {'avail':  0, 'func': 'bandwidth' },
         'binary'        : {'avail':  1, 'func': 'binary'    },
         'bye'           : {'avail':  0, 'func': 'quit'      },
         'cd'            : {'avail':  1, 'func': 'cwd'       },
         'cdup'          : {'avail':  1, 'func': 'cdup'      },
         'close'         : {'avail':  1, 'func': 'close'     },
+        'cmdpipeline'   : {'avail':  0, 'func': 'cmdpipeline'},
         'datasecure'    : {'avail':  1, 'func': 'datasecure'},
         'debug'         : {'avail':  0, 'func': 'debug'     },
         'del'           : {'avail':  1, 'func': 'dele'      },
         'delete'        : {'avail':  1, 'func': 'dele'      },
         'dir'           : {'avail':  1, 'func': 'nlist'     },
         'disconnect'    : {'avail':  1, 'func': 'close'     },
+        'du'            : {'avail':  1, 'func': 'du'        },
         'exit'          : {'avail':  0, 'func': 'quit'      },
+        'fanout'        : {'avail':  0, 'func': 'fanout'    },
+        'find'          : {'avail':  1, 'func': 'find'      },
         'help'          : {'avail':  0, 'func': 'help'      },
+        'index'         : {'avail':  1, 'func': 'index'     },
         'quit'          : {'avail':  0, 'func': 'quit'      },
         'get'           : {'avail':  1, 'func': 'retr'      },
         'lcd'           : {'avail':  0, 'func': 'lcd'       },
+        'manifesthash'  : {'avail':  0, 'func': 'manifesthash'},
         'literal'       : {'avail':  1, 'func': 'remotecmd' },
         'ls'            : {'avail':  1, 'func': 'nlist'     },
         'mdir'          : {'avail':  1, 'func': 'mlsdir'    },
         'mdelete'       : {'avail':  1, 'func': 'mdelete'   },
+        'metrics'       : {'avail':  0, 'func': 'metrics'   },
         'mget'          : {'avail':  1, 'func': 'mget'      },
         'mls'           : {'avail':  1, 'func': 'mlsdir'    },
         'mput'          : {'avail':  1, 'func': 'mput'      },
         'mk'            : {'avail':  1, 'func': 'mkd'       },
         'mkdir'         : {'avail':  1, 'func': 'mkd'       },
+        'modtime'       : {'avail':  1, 'func': 'mdtm'      },
         'open'          : {'avail': -1, 'func': 'open'      },
         'passive'       : {'avail':  1, 'func': 'passive'   },
+        'pipeline'      : {'avail':  0, 'func': 'pipeline'  },
+        'profile'       : {'avail':  0, 'func': 'profile'   },
         'prompt'        : {'avail':  0, 'func': 'prompt'    },
         'put'           : {'avail':  1, 'func': 'stor'      },
         'pwd'           : {'avail':  1, 'func': 'pwd'       },
         'quote'         : {'avail':  1, 'func': 'remotecmd' },
         'recv'          : {'avail':  1, 'func': 'retr'      },
+        'refresh'       : {'avail':  1, 'func': 'refresh'   },
         'remotehelp'    : {'avail':  1, 'func': 'remotehelp'},
         'ren'           : {'avail':  1, 'func': 'rnfr'      },
         'rename'        : {'avail':  1, 'func': 'rnfr'      },
@@ -61,7 +85,14 @@ class ftpProcess():
         'rmdir'         : {'avail':  1, 'func': 'rmd'       },
         'send'          : {'avail':  1, 'func': 'stor'      },
         'secure'        : {'avail': -1, 'func': 'secure'    },
+        'sent'          : {'avail':  1, 'func': 'sent'      },
+        'senthash'      : {'avail':  0, 'func': 'senthash'  },
+        'set'           : {'avail':  0, 'func': 'set'       },
+        'size'          : {'avail':  1, 'func': 'size'      },
+        'skipsent'      : {'avail':  0, 'func': 'skipsent'  },
         'status'        : {'avail':  0, 'func': 'status'    },
+        'tail'          : {'avail':  1, 'func': 'tail'      },
+        'tuning'        : {'avail':  0, 'func': 'tuning'    },
         'type'          : {'avail':  1, 'func': 'type'      },
         'user'          : {'avail':  1, 'func': 'user'      },
         'verbose'       : {'avail':  0, 'func': 'verbose'   },
@@ -71,34 +102,53 @@ class ftpProcess():
         'active'        : {'args': 0, 'help': 'Change data transfer mode to active'},
         'appe'          : {'args': 1, 'help': 'Append to a file'}, 
         'ascii'         : {'args': 0, 'help': 'Set ascii transfer type'},
+        'bandwidth'     : {'args': 1, 'help': 'Limit transfer rate (bandwidth [rate] [HH:MM-HH:MM=rate ...] | -file name | -transfer rate | -weight n | off)'},
         'binary'        : {'args': 0, 'help': 'Set binary transfer type'},
         'close'         : {'args': 0, 'help': 'Terminate ftp session'},
+        'cmdpipeline'   : {'args': 0, 'help': 'Toggle pipelined commands (mdelete, mkdir, size, modtime) for servers which allow it'},
         'cwd'           : {'args': 1, 'help': 'Change remote working directory'},
         'cdup'          : {'args': 0, 'help': 'Change remote to parent directory'},
         'datasecure'    : {'args': 0, 'help': 'Toggle data channel protection'},
         'debug'         : {'args': 0, 'help': 'Toggle debugging mode'},
         'dele'          : {'args': 1, 'help': 'Delete remote file'},
+        'du'            : {'args': 1, 'help': 'Size of remote directory trees (du [dir] [-maxdepth n])'},
+        'fanout'        : {'args': 1, 'help': 'Send one file to all hosts of a hosts file at the same time (fanout hosts-file local-file [remote-file])'},
+        'find'          : {'args': 1, 'help': 'Find remote files (find [dir] [-name pattern] [-type f|d] [-minsize n] [-maxsize n] [-newer days] [-older days] [-maxdepth n])'},
         'help'          : {'args': 1, 'help': 'Print local help information'},
+        'index'         : {'args': 0, 'help': 'Toggle use of local index of remote listings (see refresh) by ls, dir, mget and mdelete'},
         'lcd'           : {'args': 1, 'help': 'Change local working directory'},
+        'manifesthash'  : {'args': 0, 'help': 'Toggle sha256 of files recorded in mget/mput manifests (reads each file again)'},
         'mdelete'       : {'args': 1, 'help': 'Delete multiple files'},
-        'mget'          : {'args': 1, 'help': 'Get multiple files'},
-        'mkd'           : {'args': 1, 'help': 'Make directory on the remote machine'},
+        'metrics'       : {'args': 0, 'help': 'Show metrics status and write Prometheus metrics file'},
+        'mget'          : {'args': 1, 'help': 'Get multiple files (-continue skips files received by the last run)'},
+        'mdtm'          : {'args': 1, 'help': 'Show modification time of remote files'},
+        'mkd'           : {'args': 1, 'help': 'Make directories on the remote machine'},
         'mlsdir'        : {'args': 1, 'help': 'List contents of multiple remote directories'},
-        'mput'          : {'args': 1, 'help': 'Send multiple files'},
+        'mput'          : {'args': 1, 'help': 'Send multiple files (-continue skips files sent by the last run)'},
         'nlist'         : {'args': 1, 'help': 'List contents of remote directory'},
         'open'          : {'args': 1, 'help': 'Connect to remote ftp'},
         'passive'       : {'args': 0, 'help': 'Change data transfer mode to active'},
+        'pipeline'      : {'args': 0, 'help': 'Toggle separate network and disk threads for binary transfers'},
+        'profile'       : {'args': 1, 'help': 'Profile commands (on [file]/off), report written to file when turned off'},
         'prompt'        : {'args': 0, 'help': 'Force interactive prompting on multiple commands'},
         'pwd'           : {'args': 0, 'help': 'Print working directory on remote machine'},
         'quit'          : {'args': 0, 'help': 'Terminate ftp session and exit'},
+        'refresh'       : {'args': 1, 'help': 'Build or update local index of a remote tree, listing only changed directories (refresh [dir])'},
         'remotecmd'     : {'args': 1, 'help': 'Send arbitrary ftp command'},
         'remotehelp'    : {'args': 1, 'help': 'Get help from remote server'},
         'retr'          : {'args': 1, 'help': 'Receive file'},
-        'rmd'           : {'args': 1, 'help': 'Remove directory on the remote machine'},
+        'rmd'           : {'args': 1, 'help': 'Remove directory on the remote machine, with its contents for rm -r (-n to only show what would be deleted)'},
         'rnfr'          : {'args': 1, 'help': 'Rename file'},
         'secure'        : {'args': 0, 'help': 'Connect using FTP over SSL/TLS'},
+        'sent'          : {'args': 1, 'help': 'List files in upload history of this host (sent [pattern] | -forget [pattern] | -prune [days])'},
+        'senthash'      : {'args': 0, 'help': 'Toggle sha256 in upload history, files touched or copied but with the same content are skipped'},
+        'set'           : {'args': 1, 'help': 'Show or change transfer settings'},
+        'size'          : {'args': 1, 'help': 'Show size of remote files'},
+        'skipsent'      : {'args': 0, 'help': 'Toggle local upload history, put and mput skip files sent before and unchanged'},
         'status'        : {'args': 0, 'help': 'Show current status'},
         'stor'          : {'args': 1, 'help': 'Send one file'},
+        'tail'          : {'args': 1, 'help': 'Fetch data added to a growing remote file (also get -follow), repeat every seconds if given'},
+        'tuning'        : {'args': 1, 'help': 'Socket tuning profile (lan, wan, auto [Mbit/s], off)'},
         'type'          : {'args': 1, 'help': 'Set file transfer type'},
         'user'          : {'args': 1, 'help': 'Send new user information'},
         'verbose'       : {'args': 0, 'help': 'Toggle verbose mode'},
@@ -106,13 +156,32 @@ class ftpProcess():
 #
     systStatus = {
         'binary'        : False,
+        'cmdpipeline'   : False,
         'debug'         : False,
+        'index'         : False,
+        'manifesthash'  : False,
         'passive'       : True,
+        'pipeline'      : False,
         'prompt'        : True,
         'secure'        : False,
+        'senthash'      : False,
+        'skipsent'      : False,
         'datasecure'    : False,
         'verbose'       : True,
     }
+#
+    systSettings = {
+        'bufferdepth'   : {'value': 4, 'help': 'Buffers queued between network and disk in pipeline mode'},
+        'connecttimeout': {'value': 15, 'min': 1, 'help': 'Seconds to wait for each address of remote host to connect'},
+        'stalltimeout'  : {'value': 120, 'help': 'Seconds without progress before a transfer is aborted (0 waits forever)'},
+        'retries'       : {'value': 3, 'help': 'Times a stalled transfer is resumed or sent again'},
+        'sessions'      : {'value': 4, 'help': 'Sessions to remote host used in parallel by find, du, refresh and rm -r (0 adapts to throughput)'},
+        'maxsessions'   : {'value': 16, 'help': 'Most sessions to remote host used when sessions is 0'},
+        'fanouthosts'   : {'value': 16, 'help': 'Hosts sent to at the same time by fanout'},
+        'batchsize'     : {'value': 50, 'help': 'Commands sent at once when cmdpipeline is on'},
+        'sentdays'      : {'value': 90, 'help': 'Days an upload history entry is kept after last use (0 keeps it)'},
+        'sentmax'       : {'value': 100000, 'help': 'Most entries kept in upload history, least recently used evicted (0 for no limit)'},
+    }
 #
     def __init__(self):
         self.loginHost = ''
@@ -125,8 +194,24 @@ class ftpProcess():
 
         self.ftpCommand = ''
         self.remoteLastCheck = None
-        self.ftpConn = None
         self.ftpTerminate = False
+        self.bufferPool = ftpBufferPool()
+        self.ftpClient = ftpClient(bufferPool = self.bufferPool)
+        self.sessionPool = []
+        self.sessionControl = None
+        self.remoteIndex = None
+        self.uploadHistory = None
+        self.commandHooks = {'start': [], 'end': []}
+        self.commandResult = None
+        self.commandProfile = None
+        self.commandMetrics = None
+
+        # Dispatch table, built once: command -> (function, whether parameters are passed)
+        self.commandDispatch = {}
+        for userCommand, commandInfo in self.commandValid.items():
+            if len(commandInfo['func']) > 0:
+                self.commandDispatch[userCommand] = (getattr(self, 'ftpCommand_' + commandInfo['func']),
+                                                     self.ftpCmdList[commandInfo['func']]['args'] > 0)
 #
 # Used when resetting the existing connection
 # Called from:
@@ -138,10 +223,60 @@ class ftpProcess():
         self.loginPort = 0
         self.loginUser = ''
 #
+# Register functions called at the start and end of every command:
+#   startFunc(userCommand, userInput)
+#   endFunc(userCommand, userInput, wallTime, cpuTime)
+# Either can be None. Used by 'profile' and available to scripts embedding ftpProcess.
+# Called from:
+#   ftpCommand_profile
+#
+    def ftpRegisterHook(self, startFunc = None, endFunc = None):
+        if startFunc != None:
+            self.commandHooks['start'].append(startFunc)
+        
+        if endFunc != None:
+            self.commandHooks['end'].append(endFunc)
+#
+# Remove functions registered with ftpRegisterHook
+# Called from:
+#   ftpCommand_profile
+#
+    def ftpRemoveHook(self, startFunc = None, endFunc = None):
+        if startFunc in self.commandHooks['start']:
+            self.commandHooks['start'].remove(startFunc)
+        
+        if endFunc in self.commandHooks['end']:
+            self.commandHooks['end'].remove(endFunc)
+#
 # Process User Input Commands
-# Main function to handle user command inputs
+# Main function to handle user command inputs. Calls the registered hooks around the command, with the
+# wall time and CPU time (process wide, all threads) spent on parsing, validating and running it.
 #
     def ftpProcessCommand(self, userInput):
+        userCommand = userInput.strip().split(' ', 1)[0].lower()
+        if len(userCommand) == 0 or (len(self.commandHooks['start']) == 0 and len(self.commandHooks['end']) == 0):
+            self.ftpExecuteCommand(userInput)
+            return
+        
+        for hookFunc in self.commandHooks['start']:
+            hookFunc(userCommand, userInput)
+        
+        wallStart = time.perf_counter()
+        cpuStart = time.process_time()
+        try:
+            self.ftpExecuteCommand(userInput)
+        finally:
+            wallTime = time.perf_counter() - wallStart
+            cpuTime = time.process_time() - cpuStart
+            for hookFunc in self.commandHooks['end']:
+                hookFunc(userCommand, userInput, wallTime, cpuTime)
+#
+# Parse, validate and run a command
+# Called from:
+#   ftpProcessCommand
+#
+    def ftpExecuteCommand(self, userInput):
+        self.commandResult = None
         splitInput = userInput.strip().split(' ', 1)
         userCommand = splitInput[0].lower()
         userParams = ''
@@ -151,18 +286,55 @@ class ftpProcess():
         if self.ftpCheckCommand(userCommand) == False:
             return
         
-        if len(self.commandValid[userCommand]['func']) == 0:
-            print('Under development. Please contact developer for latest status.')
+        if userCommand not in self.commandDispatch.keys():
+            self.ftpCommand_error('Under development. Please contact developer for latest status.')
             return
         
-        # Gets function to be called from dictionary 'commandValid'. Prefixes the function name with 'ftpCommand_' to create the actual function name to process
-        # for the ftp command. If parameters are allowed for function, then parameters are passed for processing.
-        callFnName = self.commandValid[userCommand]['func']
-        callFTPFn = getattr(self, 'ftpCommand_' + callFnName)
-        if self.ftpCmdList[callFnName]['args'] > 0:
-            callFTPFn(userParams)
+        # Function to be called is looked up in commandDispatch (built from 'commandValid' with the 'ftpCommand_' prefix).
+        # If parameters are allowed for function, then parameters are passed for processing.
+        callFTPFn, passParams = self.commandDispatch[userCommand]
+        if passParams == True:
+            cmdResponse = callFTPFn(userParams)
         else:
-            callFTPFn()
+            cmdResponse = callFTPFn()
+        
+        # Functions returning a result (e.g. transfers, mget) give the outcome of the command
+        if isinstance(cmdResponse, ftpResult):
+            self.commandResult = cmdResponse
+#
+# Print an error found locally, e.g. an invalid option or a missing local file, and keep it as the outcome of the
+# command (commandResult) for the command hooks. Returns the outcome
+# Called from:
+#   ftpCheckCommand
+#   ftpExecuteCommand
+#   commands checking their parameters or local files
+#
+    def ftpCommand_error(self, errorMessage):
+        print(errorMessage)
+        self.commandResult = ftpResult(False, 0, errorMessage)
+        return self.commandResult
+#
+# Check if the command streams a file to stdout (get remote-file -) or from stdin (put - remote-file)
+# Returns 'stdout', 'stdin' or empty string
+# Called from:
+#   main
+#
+    def ftpCheckStream(self, userInput):
+        splitInput = userInput.strip().split(' ', 1)
+        userCommand = splitInput[0].lower()
+        if userCommand not in self.commandValid.keys():
+            return ''
+        
+        userInputs = getInputParams(' '.join(splitInput[1:]))
+        if len(userInputs) > 0 and userInputs[0].lower() == '-follow':
+            return ''
+        
+        if self.commandValid[userCommand]['func'] == 'retr' and len(userInputs) > 1 and userInputs[1] == '-':
+            return 'stdout'
+        elif self.commandValid[userCommand]['func'] in ['stor', 'appe'] and len(userInputs) > 0 and userInputs[0] == '-':
+            return 'stdin'
+        
+        return ''
 #
 # Validate user commands
 # Called from:
@@ -170,7 +342,7 @@ class ftpProcess():
 #
     def ftpCheckCommand(self, userCommand):
         if userCommand not in self.commandValid.keys():
-            print('Invalid command.')
+            self.ftpCommand_error('Invalid command.')
             return False
         
         commandErr = False
@@ -179,15 +351,15 @@ class ftpProcess():
             portInfo = ''
             if self.loginPort > 0:
                 portInfo = f':{self.loginPort}'
-            print(f'Already connected to {self.loginHost}{portInfo}, use disconnect first.')
+            self.ftpCommand_error(f'Already connected to {self.loginHost}{portInfo}, use disconnect first.')
             commandErr = True
         elif self.commandValid[userCommand]['avail'] == 1 and len(self.loginHost) == 0:
-            print('Not connected.')
+            self.ftpCommand_error('Not connected.')
             commandErr = True
         elif self.commandValid[userCommand]['avail'] == 1:
             if (len(self.loginUser) > 0 and (self.remoteLastCheck <= hostLastConnected)) or \
                         (self.ftpConnectionActive() == False):
-                print('Connection closed by remote host.')
+                self.ftpCommand_error('Connection closed by remote host.')
                 self.resetconnection()
                 commandErr = True
         
@@ -202,7 +374,7 @@ class ftpProcess():
 #   ftpCheckCommand
 #
     def ftpConnectionActive(self):
-        if self.ftpCommand_remotecmd('NOOP', -1)['cmdsuccess'] == False:
+        if self.ftpCommand_remotecmd('NOOP', -1).success == False:
             return False
         
         self.remoteLastCheck = datetime.now()
@@ -228,9 +400,9 @@ class ftpProcess():
             return
         
         if self.systStatus['debug'] == True:
-            self.ftpConn.set_debuglevel(1)
+            self.ftpClient.setDebug(1)
         else:
-            self.ftpConn.set_debuglevel(0)
+            self.ftpClient.setDebug(0)
 #
 # Toggle prompt for multiple files
 # Called from:
@@ -246,6 +418,28 @@ class ftpProcess():
     def ftpCommand_verbose(self):
         self.ftpCommand_togglestatus()
 #
+# Toggle pipelined (network thread + disk thread) binary transfers
+# Called from:
+#   ftpProcessCommand
+#
+    def ftpCommand_pipeline(self):
+        self.ftpCommand_togglestatus()
+#
+# Toggle pipelined commands
+# Called from:
+#   ftpProcessCommand
+#
+    def ftpCommand_cmdpipeline(self):
+        self.ftpCommand_togglestatus()
+        self.ftpClient.resetPipeline()
+#
+# Toggle use of the local index for listings
+# Called from:
+#   ftpProcessCommand
+#
+    def ftpCommand_index(self):
+        self.ftpCommand_togglestatus()
+#
 # Toggle SSL/TLS for connection
 # Called from:
 #   ftpProcessCommand
@@ -253,6 +447,27 @@ class ftpProcess():
     def ftpCommand_secure(self):
         self.ftpCommand_togglestatus()
 #
+# Toggle skipping of files already sent and unchanged since (upload history)
+# Called from:
+#   ftpProcessCommand
+#
+    def ftpCommand_skipsent(self):
+        self.ftpCommand_togglestatus()
+#
+# Toggle sha256 of files recorded in and checked against upload history
+# Called from:
+#   ftpProcessCommand
+#
+    def ftpCommand_senthash(self):
+        self.ftpCommand_togglestatus()
+#
+# Toggle sha256 of files recorded in mget/mput manifests
+# Called from:
+#   ftpProcessCommand
+#
+    def ftpCommand_manifesthash(self):
+        self.ftpCommand_togglestatus()
+#
 # Toggle secure channel for data connection
 # Called from:
 #   ftpProcessCommand
@@ -269,18 +484,15 @@ class ftpProcess():
         
         self.ftpCommand_togglestatus(True)
 #
-# Create Secure Data connection. Sends PROT P to remote server
+# Create Secure Data connection. Sends PBSZ and PROT P to remote server
 # Called from:
 #   ftpCommand_datasecure
 #   ftpCommand_user
 #
     def ftpCommand_prot_p(self):
-        cmdResponse = self.ftpCommand_remotecmd(f'PBSZ 0', -1)
-        if cmdResponse['cmdsuccess'] == False:
-            return
-        
-        cmdResponse = self.ftpCommand_remotecmd(f'PROT P')
-        if cmdResponse['cmdsuccess'] == True:
+        cmdResponse = self.ftpClient.protect(True)
+        self.ftpCommand_printresponse(cmdResponse.response)
+        if cmdResponse.success == True:
             self.systStatus['datasecure'] = True
 #
 # Clear the Secure Data connection. Sends PROT C to remote server
@@ -288,8 +500,9 @@ class ftpProcess():
 #   ftpCommand_datasecure
 #
     def ftpCommand_prot_c(self):
-        cmdResponse = self.ftpCommand_remotecmd(f'PROT C')
-        if cmdResponse['cmdsuccess'] == True:
+        cmdResponse = self.ftpClient.protect(False)
+        self.ftpCommand_printresponse(cmdResponse.response)
+        if cmdResponse.success == True:
             self.systStatus['datasecure'] = False
 #
 # Update the existing user modes
@@ -298,8 +511,12 @@ class ftpProcess():
 #   ftpCommand_debug
 #   ftpCommand_prompt
 #   ftpCommand_verbose
+#   ftpCommand_pipeline
 #   ftpCommand_secure
 #   ftpCommand_datasecure
+#   ftpCommand_skipsent
+#   ftpCommand_senthash
+#   ftpCommand_manifesthash
 #
     def ftpCommand_togglestatus(self, statusOnly = False):
         statusName = self.ftpCommand
@@ -320,16 +537,30 @@ class ftpProcess():
         
         if statusName == 'binary':
             modeInfo = 'Binary Mode'
+        elif statusName == 'cmdpipeline':
+            modeInfo = 'Pipelined commands'
         elif statusName == 'debug':
             modeInfo = 'Debugging'
+        elif statusName == 'index':
+            modeInfo = 'Listings from local index'
+        elif statusName == 'manifesthash':
+            modeInfo = 'Content hash in manifests'
         elif statusName == 'prompt':
             modeInfo = 'Interactive mode'
         elif statusName == 'passive':
             modeInfo = 'Passive mode'
+        elif statusName == 'pipeline':
+            modeInfo = 'Pipelined transfers'
         elif statusName == 'secure':
             modeInfo = 'FTP over SSL/TLS (FTPS)'
+        elif statusName == 'senthash':
+            modeInfo = 'Content hash in upload history'
+        elif statusName == 'skipsent':
+            modeInfo = 'Skip files sent unchanged'
         elif statusName == 'datasecure':
             modeInfo = 'Secure Data Channel'
+        elif statusName == 'verbose':
+            modeInfo = 'Verbose mode'
         
         print(f'{modeInfo} {modeStatus} .')
 #
@@ -353,14 +584,7 @@ class ftpProcess():
 #   ftpCommand_passive
 #
     def ftpCommand_portpasv(self, newStatus):
-        newStatus = None
-
-        try:
-            self.ftpConn.set_pasv(newStatus)
-        except ftplib.all_errors as err:
-            print(str(err))
-            return
-        
+        self.ftpClient.setPassive(newStatus)
         self.ftpCommand = 'passive'
         self.systStatus['passive'] = newStatus
         self.ftpCommand_togglestatus(True)
@@ -407,7 +631,7 @@ class ftpProcess():
             print(f'{cmdParams}: unknown mode.')
             return
         
-        if self.ftpCommand_remotecmd(command)['cmdsuccess'] == True:
+        if self.ftpCommand_remotecmd(command).success == True:
             self.systStatus['binary'] = newStatus
 #
 # Print help
@@ -434,7 +658,7 @@ class ftpProcess():
         else:
             for helpItem in userInputs:
                 if helpItem not in self.commandValid.keys():
-                    print(f'Invalid help command {helpItem}')
+                    self.ftpCommand_error(f'Invalid help command {helpItem}')
                 else:
                     helpFunc = self.commandValid[helpItem]['func']
                     helpStr = self.ftpCmdList[helpFunc]['help']
@@ -466,6 +690,215 @@ class ftpProcess():
                 strStatus = 'Off'
             
             print(f'{statKeys:<15}: {strStatus}')
+        
+        for settingKey in self.systSettings.keys():
+            print(f'{settingKey:<15}: {self.systSettings[settingKey]["value"]}')
+        
+        if self.systSettings['sessions']['value'] == 0 and len(self.loginHost) > 0:
+            print(f'{"sessions used":<15}: {hostCache.get(self.ftpClient.ftpConn.hostKey(), "sessions", "-")}')
+        if len(self.loginHost) > 0:
+            print(f'{"roundtrips":<15}: {self.ftpClient.ftpConn.roundTripsSaved} saved')
+        print(f'{"bandwidth":<15}: {formatRate(bandwidthLimit.currentRate())}')
+#
+# Turn command profiling on or off. When turned off, the report is written to the profile file
+#   profile                 Show profiling status
+#   profile on [file]       Start profiling (default file pyFTP-profile.txt in local directory)
+#   profile off             Stop profiling and write report
+# Called from:
+#   ftpProcessCommand
+#   main
+#
+    def ftpCommand_profile(self, profileParams = ''):
+        userInputs = getInputParams(profileParams)
+        if len(userInputs) == 0:
+            if self.commandProfile == None:
+                print('Profiling Off .')
+            else:
+                print(f'Profiling On, report to {self.commandProfile.profileFile} .')
+            return
+        
+        if userInputs[0].lower() == 'on':
+            if self.commandProfile != None:
+                print(f'Profiling already On, report to {self.commandProfile.profileFile} .')
+                return
+            
+            profileFile = os.path.join(self.localDir, 'pyFTP-profile.txt')
+            if len(userInputs) > 1:
+                profileFile = os.path.join(self.localDir, userInputs[1])
+            
+            self.commandProfile = ftpProfile(profileFile)
+            self.ftpRegisterHook(self.commandProfile.commandStart, self.commandProfile.commandEnd)
+            print(f'Profiling On, report to {profileFile} .')
+        elif userInputs[0].lower() == 'off':
+            if self.commandProfile == None:
+                print('Profiling Off .')
+                return
+            
+            self.ftpRemoveHook(self.commandProfile.commandStart, self.commandProfile.commandEnd)
+            try:
+                self.commandProfile.writeReport()
+            except OSError as err:
+                print(str(err))
+            else:
+                print(f'Profiling Off, report written to {self.commandProfile.profileFile} .')
+            self.commandProfile = None
+        else:
+            self.ftpCommand_error(f'Usage: profile on [file] | off')
+#
+# Show metrics status and write the Prometheus metrics file. Metrics are enabled with --metrics/--prometheus
+# Called from:
+#   ftpProcessCommand
+#
+    def ftpCommand_metrics(self):
+        if self.commandMetrics == None:
+            print('Metrics Off. Use --metrics and/or --prometheus to enable.')
+            return
+        
+        if self.commandMetrics.eventFile != None:
+            print(f'Metrics events to {self.commandMetrics.eventFile} .')
+        
+        if self.commandMetrics.promFile != None:
+            try:
+                self.commandMetrics.flush()
+            except OSError as err:
+                print(str(err))
+            else:
+                print(f'Metrics written to {self.commandMetrics.promFile} .')
+#
+# Show or change transfer settings
+#   set                 Show all settings
+#   set name            Show one setting
+#   set name value      Change setting
+# Called from:
+#   ftpProcessCommand
+#
+    def ftpCommand_set(self, settingParams = ''):
+        userInputs = getInputParams(settingParams.lower())
+        if len(userInputs) == 0:
+            for settingKey in self.systSettings.keys():
+                settingInfo = self.systSettings[settingKey]
+                print(f'{settingKey:<15}: {str(settingInfo["value"]):<10} {settingInfo["help"]}')
+            return
+        
+        settingKey = userInputs[0]
+        if settingKey not in self.systSettings.keys():
+            print(f'{settingKey}: unknown setting.')
+            return
+        
+        if len(userInputs) > 1:
+            if userInputs[1].isdigit() == False:
+                self.ftpCommand_error(f'{userInputs[1]}: invalid value for {settingKey}.')
+                return
+            
+            # Settings with a lower limit, e.g. a connect timeout of 0 would make the socket non-blocking
+            if int(userInputs[1]) < self.systSettings[settingKey].get('min', 0):
+                self.ftpCommand_error(f'{userInputs[1]}: {settingKey} must be at least {self.systSettings[settingKey]["min"]}.')
+                return
+            
+            self.systSettings[settingKey]['value'] = int(userInputs[1])
+            if settingKey in ['stalltimeout', 'retries']:
+                self.ftpClient.setStallTimeout(self.systSettings['stalltimeout']['value'], self.systSettings['retries']['value'])
+        
+        print(f'{settingKey:<15}: {self.systSettings[settingKey]["value"]}')
+#
+# Show or change socket tuning profile for control and data connections
+#   tuning                      Show profile in use
+#   tuning lan|wan|off          Change profile
+#   tuning auto [Mbit/s]        Size socket buffers from round trip time and link speed (default 1000 Mbit/s)
+# Called from:
+#   ftpProcessCommand
+#   main
+#
+    def ftpCommand_tuning(self, tuningParams = ''):
+        userInputs = getInputParams(tuningParams.lower())
+        if len(userInputs) > 0:
+            tuningProfile = userInputs[0]
+            if tuningProfile == 'off':
+                tuningProfile = ''
+            
+            if tuningProfile != '' and tuningProfile not in tuningProfiles.keys():
+                self.ftpCommand_error(f'Usage: tuning {" | ".join(tuningProfiles.keys())} [Mbit/s] | off')
+                return
+            
+            linkSpeed = None
+            if len(userInputs) > 1:
+                if userInputs[1].isdigit() == False or int(userInputs[1]) == 0:
+                    self.ftpCommand_error(f'{userInputs[1]}: invalid link speed.')
+                    return
+                linkSpeed = int(userInputs[1])
+            
+            self.ftpClient.setTuning(tuningProfile, linkSpeed)
+        
+        if self.ftpClient.tuningProfile == '':
+            print('Tuning Off .')
+            return
+        
+        tuningInfo = f'Tuning {self.ftpClient.tuningProfile}'
+        if self.ftpClient.tuningProfile == 'auto':
+            tuningInfo += f', link speed {self.ftpClient.linkSpeed} Mbit/s'
+        
+        if self.ftpClient.ftpConn != None:
+            if self.ftpClient.ftpConn.roundTrip != None:
+                tuningInfo += f', round trip {self.ftpClient.ftpConn.roundTrip * 1000:.1f} ms'
+            
+            socketBuffer = self.ftpClient.ftpConn.socketBuffer()
+            if socketBuffer > 0:
+                tuningInfo += f', socket buffers {socketBuffer // 1024}K'
+        
+        print(f'{tuningInfo} .')
+#
+# Show or change bandwidth limits. Rates are bytes per second, e.g. 500K, 20M, 1G (off for no limit)
+#   bandwidth                               Show limits
+#   bandwidth rate                          Limit all transfers together (shared by weight)
+#   bandwidth HH:MM-HH:MM=rate ... [rate]   Limit during time windows, rate outside them (default no limit)
+#   bandwidth -file filename                Read limits from a file, same entries one or more per line
+#   bandwidth -transfer rate                Limit each transfer of this session on its own
+#   bandwidth -weight n                     Share of the limit for transfers of this session (default 1)
+# Called from:
+#   ftpProcessCommand
+#   main
+#
+    def ftpCommand_bandwidth(self, bandwidthParams = ''):
+        userInputs = getInputParams(bandwidthParams)
+        if len(userInputs) > 0 and userInputs[0].lower() in ['-transfer', '-weight']:
+            if len(userInputs) < 2:
+                self.ftpCommand_error(f'Usage: bandwidth {userInputs[0].lower()} value')
+                return
+            
+            if userInputs[0].lower() == '-transfer':
+                rateLimit = parseRate(userInputs[1])
+                if rateLimit == None:
+                    self.ftpCommand_error(f'{userInputs[1]}: invalid rate.')
+                    return
+                self.ftpClient.setRateLimit(rateLimit)
+            else:
+                if userInputs[1].isdigit() == False or int(userInputs[1]) == 0:
+                    self.ftpCommand_error(f'{userInputs[1]}: invalid weight.')
+                    return
+                self.ftpClient.setRateLimit(self.ftpClient.rateLimit, int(userInputs[1]))
+        elif len(userInputs) > 0:
+            try:
+                if userInputs[0].lower() == '-file':
+                    if len(userInputs) < 2:
+                        self.ftpCommand_error('Usage: bandwidth -file filename')
+                        return
+                    globalRate, rateSchedule = readRateSchedule(os.path.join(self.localDir, userInputs[1]))
+                else:
+                    globalRate, rateSchedule = parseRateSchedule(bandwidthParams.replace(',', ' ').split())
+            except (OSError, ValueError) as err:
+                print(str(err))
+                return
+            
+            bandwidthLimit.setLimit(globalRate, rateSchedule)
+        
+        for startMinute, endMinute, windowRate in bandwidthLimit.rateSchedule:
+            print(f'{startMinute // 60:02}:{startMinute % 60:02}-{endMinute // 60:02}:{endMinute % 60:02}   : {formatRate(windowRate)}')
+        
+        otherInfo = ''
+        if len(bandwidthLimit.rateSchedule) > 0:
+            otherInfo = ' (other times)'
+        print(f'Bandwidth {formatRate(bandwidthLimit.globalRate)}{otherInfo}, now {formatRate(bandwidthLimit.currentRate())}, '
+              f'per transfer {formatRate(self.ftpClient.rateLimit)}, weight {self.ftpClient.rateWeight} .')
 #
 # Connect to remote host. Sends OPEN to connect
 # Called from:
@@ -487,16 +920,14 @@ class ftpProcess():
         
         connectInfo = f'{host}{portInfo}'
 
-        if self.systStatus['secure'] == True:
-            self.ftpConn = ftplib.FTP_TLS()
-        else:
-            self.ftpConn = ftplib.FTP()
-        
+        # Sends AUTH for SSL/TLS connection as part of connecting
+        self.ftpClient.secure = self.systStatus['secure']
+        self.ftpClient.connectTimeout = self.systSettings['connecttimeout']['value']
+        self.ftpClient.setStallTimeout(self.systSettings['stalltimeout']['value'], self.systSettings['retries']['value'])
         self.ftpCommand_ftpdebug(True)
-        try:
-            ftpResponse = self.ftpConn.connect(host,port)
-        except ftplib.all_errors as err:
-            if str(err)[:13] == '[Errno 11001]':
+        cmdResponse = self.ftpClient.open(host, port)
+        if cmdResponse.success == False:
+            if cmdResponse.response[:13] == '[Errno 11001]':
                 print(f'Unknown host {connectInfo}')
             else:
                 print('> ftp: connect :Connection refused')
@@ -504,26 +935,17 @@ class ftpProcess():
             self.loginHost = host
             self.loginPort = port
             print(f'Connected to {connectInfo}.')
-            print(ftpResponse)
-            self.ftpCommand_auth()
+            print(cmdResponse.response)
             self.ftpCommand_user()
 #
-# Sends AUTH info for SSL/TLS connection
-# Called from:
-#   ftpCommand_open
-#
-    def ftpCommand_auth(self):
-        if self.systStatus['secure'] == False:
-            return
-        
-        self.ftpConn.auth()
-#
 # Get User ID, Password & Account for login. Sends USER to login and passes further PASS and AUTH as requested by using ftpCommand 'challengeuser' function
 # Called from:
 #   ftpProcessCommand
 #   ftpCommand_open
 #
     def ftpCommand_user(self, userParams = ''):
+        import getpass
+
         loginDetails = getUserInput(f'User ({self.loginHost}:({getpass.getuser()})):', userParams, False, 'user username [password] [account]')
         userInputs = getInputParams(loginDetails)
         try:
@@ -544,35 +966,27 @@ class ftpProcess():
         if len(loginID) == 0:
             return
         
-        cmdResponse = self.ftpCommand_remotecmd(f'USER {loginID}')
-        while self.ftpCommand_errorCode(cmdResponse) in range(300, 400):
-            checkStatus = self.ftpCommand_errorCode(cmdResponse)
-            if checkStatus == 331:
-                cmdResponse = self.ftpCommand_challengeuser('PASS', loginPass)
-                loginPass = cmdResponse[0]
-                cmdResponse = cmdResponse[1]
-            elif checkStatus == 332:
-                cmdResponse = self.ftpCommand_challengeuser('ACCT', loginAcct)
-                loginAcct = cmdResponse[0]
-                cmdResponse = cmdResponse[1]
-            else:
-                cmdResponse['cmdsuccess'] = False
-            
-        if cmdResponse['cmdsuccess'] == False:
+        cmdResponse = self.ftpClient.login(loginID, loginPass, loginAcct, self.ftpCommand_challengeuser, False)
+        self.ftpCommand_printresponse(cmdResponse.response)
+        if cmdResponse.success == False:
             print('Login failed.')
-        elif self.ftpCommand_errorCode(cmdResponse) in [230, 232]:
+        else:
             self.loginUser = loginID
-            self.DefaultRemoteDir = self.ftpConn.pwd()
+            if self.ftpClient.pwd().success == False:
+                self.ftpClient.remoteDir = ''
+            self.DefaultRemoteDir = self.ftpClient.remoteDir
             self.remoteDir = self.DefaultRemoteDir
             self.remoteLastCheck = datetime.now()
             if self.systStatus['secure'] == True:
                 self.ftpCommand_prot_p()
 #
-# Gets additional details to be sent to remote server for user authentication
+# Gets additional details to be sent to remote server for user authentication. Passed to ftpClient login,
+# which calls it with the server response requesting the details and the value given on the command line (if any)
 # Called from:
 #   ftpCommand_user
 #
-    def ftpCommand_challengeuser(self, command, userParams = '', ):
+    def ftpCommand_challengeuser(self, command, cmdResponse, userParams = ''):
+        self.ftpCommand_printresponse(cmdResponse)
         reqStr = ''
         if command == 'PASS':
             reqStr = f'Password:'
@@ -586,9 +1000,7 @@ class ftpProcess():
         except:
             loginDetails = ''
         
-        cmdResponse = self.ftpCommand_remotecmd(f'{command} {loginDetails}')
-
-        return [loginDetails, cmdResponse]
+        return loginDetails
 #
 # Disconnect from remote host. Could've used QUIT and may be redundant code
 # Called from:
@@ -600,14 +1012,80 @@ class ftpProcess():
         if len(self.loginHost) == 0:
             return
         
-        try:
-            ftpResponse = self.ftpConn.quit()
-        except:
-            ftpResponse = self.ftpConn.close()
-        finally:
-            self.resetconnection()
-            if ftpResponse != None:
-                print(ftpResponse)
+        self.ftpCommand_closepool()
+        if self.remoteIndex != None:
+            self.remoteIndex.close()
+            self.remoteIndex = None
+        
+        cmdResponse = self.ftpClient.close()
+        self.resetconnection()
+        if len(cmdResponse.response) > 0:
+            print(cmdResponse.response)
+#
+# Sessions for parallel commands: this session plus additional sessions to the same host, up to the 'sessions'
+# setting. Additional sessions stay open until the connection is closed, and are checked before being used again.
+# With 'sessions' 0, the list has 'maxsessions' entries, None for sessions not open yet, and sessionControl
+# (ftpConcurrency, to be passed on with the list) opens them as throughput improves. Otherwise sessionControl is None
+# Called from:
+#   ftpCommand_refresh
+#   ftpCommand_find
+#   ftpCommand_du
+#   ftpCommand_rmtree
+#
+    def ftpCommand_sessionpool(self):
+        self.ftpCommand_checkpool()
+        if self.systSettings['sessions']['value'] == 0:
+            maxSessions = max(1, self.systSettings['maxsessions']['value'])
+            sessionList = ([self.ftpClient] + self.sessionPool + [None] * maxSessions)[:maxSessions]
+            self.sessionControl = ftpConcurrency(self.ftpClient.ftpConn.hostKey(), sessionList, self.ftpCommand_opensession)
+            return sessionList
+        
+        self.sessionControl = None
+        sessionCount = max(1, self.systSettings['sessions']['value'])
+        while len(self.sessionPool) + 1 < sessionCount:
+            cmdResponse = self.ftpClient.clone()
+            if cmdResponse.success == False:
+                print(f'Additional session: {cmdResponse.response}')
+                break
+            
+            self.sessionPool.append(cmdResponse.data[0])
+        
+        return [self.ftpClient] + self.sessionPool[:sessionCount - 1]
+#
+# Additional sessions left idle may have been closed by remote server: open them again, or drop them when that fails
+# Called from:
+#   ftpCommand_sessionpool
+#
+    def ftpCommand_checkpool(self):
+        livePool = []
+        for ftpSession in self.sessionPool:
+            cmdResponse = ftpSession.keepalive()
+            if cmdResponse.success == True:
+                livePool.append(ftpSession)
+            else:
+                print(f'Additional session: {cmdResponse.response}')
+                ftpSession.close()
+        self.sessionPool = livePool
+#
+# Open an additional session for the session pool
+# Called from:
+#   ftpConcurrency (through ftpCommand_sessionpool)
+#
+    def ftpCommand_opensession(self):
+        cmdResponse = self.ftpClient.clone()
+        if cmdResponse.success == True:
+            self.sessionPool.append(cmdResponse.data[0])
+        
+        return cmdResponse
+#
+# Close the additional sessions
+# Called from:
+#   ftpCommand_close
+#
+    def ftpCommand_closepool(self):
+        for ftpSession in self.sessionPool:
+            ftpSession.close()
+        self.sessionPool = []
 #
 # Disconnect & terminate the process
 # Called from:
@@ -631,7 +1109,7 @@ class ftpProcess():
             self.localDir = localDir
             print(f'Local directory now {localDir}.')
         else:
-            print(f'{localDir}: File not found')
+            self.ftpCommand_error(f'{localDir}: File not found')
 #
 # Get Remote Directory Filenames
 # ls --> NLST
@@ -650,25 +1128,17 @@ class ftpProcess():
                 fileMode = 'a'
             file2write = open(localFile, fileMode)
         
-        sendRemoteCmd = 'NLST'
-        if self.ftpCommand == 'ls':
-            sendRemoteCmd = 'NLST'
-        elif self.ftpCommand == 'dir':
-            sendRemoteCmd = 'LIST'
-        
-        dir_list = []
-        try:
-            ftpResponse = self.ftpConn.retrlines(f'{sendRemoteCmd} {remoteDir}', dir_list.append)
-        except ftplib.all_errors as err:
-            print(str(err))
+        cmdResponse = self.ftpCommand_listing(remoteDir, self.ftpCommand == 'dir')
+        if cmdResponse.success == False:
+            print(cmdResponse.response)
             outputError = True
         else:
-            for fileEntry in dir_list:
+            for fileEntry in cmdResponse.data:
                 if len(localFile) > 0:
                     file2write.write(fileEntry + '\n')
                 else:
                     print(fileEntry)
-            print(ftpResponse)
+            print(cmdResponse.response)
         
         if len(localFile) > 0:
             file2write.close()
@@ -677,6 +1147,134 @@ class ftpProcess():
         
         return not(outputError)
 #
+# Remote listing for ls/dir, mget and mdelete: from the local index when 'index' is on and the directory is
+# indexed (see refresh), otherwise from remote server. A pattern (*, ? or [) in the last part of the name is
+# matched locally. Names are returned with the directory part as given (as NLST dir does), so that mget and
+# mdelete can use them as paths
+# Called from:
+#   ftpCommand_nlist
+#   ftpCommand_remfiles
+#
+    def ftpCommand_listing(self, remoteDir = '', longFormat = False):
+        import fnmatch
+
+        if self.systStatus['index'] == True:
+            listDir = remoteDir
+            listPattern = ''
+            if re.search(r'[*?[]', posixpath.basename(remoteDir)) != None:
+                listDir, listPattern = posixpath.split(remoteDir)
+            
+            indexList = self.ftpCommand_remoteindex().entries(posixpath.normpath(posixpath.join(self.remoteDir, listDir)))
+            if indexList != None:
+                entryList, dirListed = indexList
+                cmdResponse = ftpResult(True, 0, f'Listed from index of {time.strftime("%Y-%m-%d %H:%M", time.localtime(dirListed))}.')
+                for entryName, entryFacts in entryList:
+                    if len(listPattern) > 0 and fnmatch.fnmatch(entryName, listPattern) == False:
+                        continue
+                    
+                    if longFormat == True:
+                        entryModify = entryFacts.get('modify', '')
+                        if len(entryModify) == 14:
+                            entryModify = f'{entryModify[0:4]}-{entryModify[4:6]}-{entryModify[6:8]} {entryModify[8:10]}:{entryModify[10:12]}'
+                        entryType = {'dir': 'd', 'file': '-', 'link': 'l'}.get(entryFacts['type'], '?')
+                        cmdResponse.data.append(f'{entryType} {entryFacts.get("size", 0):>15} {entryModify:<16} {entryName}')
+                    elif len(listDir) > 0:
+                        cmdResponse.data.append(posixpath.join(listDir, entryName))
+                    else:
+                        cmdResponse.data.append(entryName)
+                
+                return cmdResponse
+        
+        return self.ftpClient.list(remoteDir, longFormat)
+#
+# Local index of the remote tree for the current login, opened when first needed
+# Called from:
+#   ftpCommand_listing
+#   ftpCommand_refresh
+#
+    def ftpCommand_remoteindex(self):
+        indexKey = f'{self.ftpClient.loginUser}@{self.ftpClient.ftpConn.hostKey()}'
+        if self.remoteIndex != None and self.remoteIndex.indexKey != indexKey:
+            self.remoteIndex.close()
+            self.remoteIndex = None
+        
+        if self.remoteIndex == None:
+            self.remoteIndex = ftpIndex(indexKey)
+        return self.remoteIndex
+#
+# Build or update the local index of a remote tree (default current directory). Directories already indexed are
+# checked in parallel with MLST, and only those whose modify time changed are listed again (files changed in
+# place don't change the directory time). New directories are walked, directories gone are removed.
+# Called from:
+#   ftpProcessCommand
+#
+    def ftpCommand_refresh(self, refreshParams = ''):
+        import sqlite3
+
+        startTime = time.perf_counter()
+        userInputs = getInputParams(refreshParams)
+        remoteDir = self.remoteDir
+        if len(userInputs) > 0:
+            remoteDir = posixpath.normpath(posixpath.join(self.remoteDir, userInputs[0]))
+        
+        try:
+            remoteIndex = self.ftpCommand_remoteindex()
+            sessionList = self.ftpCommand_sessionpool()
+            knownDirs = remoteIndex.dirs(remoteDir)
+            checkDirs = list(knownDirs.keys()) or [remoteDir]
+            dirStatus = runParallel(sessionList, checkDirs, lambda ftpSession, dirPath: ftpSession.mlst(dirPath), self.sessionControl)
+
+            changedDirs = {}
+            removedCount = 0
+            for dirPath, cmdResponse in zip(checkDirs, dirStatus):
+                if cmdResponse == None:
+                    continue
+                
+                if cmdResponse.code == 550:
+                    if dirPath in knownDirs.keys():
+                        remoteIndex.removeTree(dirPath)
+                        removedCount += 1
+                    else:
+                        print(cmdResponse.response)
+                    continue
+                
+                # Without MLST the directory time is not known, the directory is listed again
+                dirModify = None
+                if cmdResponse.success == True:
+                    dirModify = cmdResponse.data[0].get('modify')
+                
+                if dirModify == None or dirModify != knownDirs.get(dirPath):
+                    changedDirs[dirPath] = dirModify
+            
+            newDirs = []
+            dirListings = runParallel(sessionList, list(changedDirs.keys()), lambda ftpSession, dirPath: ftpSession.entries(dirPath),
+                                      self.sessionControl)
+            for dirPath, cmdResponse in zip(changedDirs.keys(), dirListings):
+                if cmdResponse == None:
+                    continue
+                
+                if cmdResponse.success == False:
+                    print(f'{dirPath}: {cmdResponse.response}')
+                    continue
+                
+                newDirs += remoteIndex.storeDir(dirPath, changedDirs[dirPath], cmdResponse.data)
+            
+            newCount = 0
+            if len(newDirs) > 0:
+                treeWalker = ftpTreeWalker(sessionList, None, dirFunc = lambda dirPath, entryList, depth: remoteIndex.storeDir(dirPath, None, entryList),
+                                           concurrency = self.sessionControl)
+                walkResult = treeWalker.walk(newDirs)
+                newCount = treeWalker.dirCount
+                for walkError in walkResult.data:
+                    print(walkError)
+        except sqlite3.Error as err:
+            print(f'Index: {err}')
+            return
+        
+        if self.systStatus['verbose'] == True:
+            print(f'refresh: {len(knownDirs)} directories checked, {len(changedDirs)} changed, {removedCount} removed, '
+                  f'{newCount} new listed in {time.perf_counter() - startTime:.2f}Seconds.')
+#
 # List multiple directory from remote server to local file. Calls ftpCommand 'nlist' function to get details in required format
 # Called from:
 #   ftpProcessCommand
@@ -719,67 +1317,571 @@ class ftpProcess():
 #   ftpProcessCommand
 #
     def ftpCommand_mput(self, filList = ''):
-        filList = getUserInput('Local files:', filList, False, f'{self.ftpCommand} Local files')
+        filList = getUserInput('Local files:', filList, False, f'{self.ftpCommand} [-continue] Local files')
 
-        userInputs = getInputParams(filList)
+        fileManifest, userInputs = self.ftpCommand_manifest(getInputParams(filList))
         if len(userInputs) < 1:
             return
         
-        for inputFil in userInputs:
-            if self.systStatus['prompt'] == True:
-                userOption = getYorN(f'{self.ftpCommand} {inputFil}')
-                if userOption == 'q':
-                    return
-                elif userOption == 'n':
+        skipCount = 0
+        unchangedCount = 0
+        failCount = 0
+        runComplete = False
+        try:
+            for inputFil in userInputs:
+                if fileManifest != None and fileManifest.completed(inputFil) == True:
+                    skipCount += 1
                     continue
-            
-            self.ftpCommand_stor(inputFil, inputFil)
+                
+                if self.systStatus['skipsent'] == True and self.ftpCommand_sentbefore(inputFil, inputFil) == True:
+                    unchangedCount += 1
+                    continue
+                
+                if self.systStatus['prompt'] == True:
+                    userOption = getYorN(f'{self.ftpCommand} {inputFil}')
+                    if userOption == 'q':
+                        break
+                    elif userOption == 'n':
+                        continue
+                
+                cmdResponse = self.ftpCommand_stor(inputFil, inputFil, checkSent = False)
+                if cmdResponse == None or cmdResponse.success == False:
+                    failCount += 1
+                elif fileManifest != None:
+                    fileManifest.record(inputFil, inputFil)
+            else:
+                runComplete = failCount == 0
+        finally:
+            if fileManifest != None:
+                fileManifest.close(runComplete)
+        
+        if skipCount > 0:
+            print(f'{self.ftpCommand}: {skipCount} files already sent, skipped.')
+        if unchangedCount > 0:
+            print(f'{self.ftpCommand}: {unchangedCount} files unchanged since sent, skipped.')
+        if self.uploadHistory != None:
+            self.ftpCommand_sentprune()
+        
+        return ftpResult(failCount == 0, 0, f'{self.ftpCommand}: {failCount} files failed.')
 #
-# Calls ftpCommand 'remfiles' for processing multiple files - get only
+# Upload history (see ftpUploadHistory), opened when first needed. Entries not used for 'sentdays' days and beyond
+# 'sentmax' are evicted when it is opened. None if it can't be opened
 # Called from:
-#   ftpProcessCommand
+#   ftpCommand_sent
+#   ftpCommand_sentbefore
+#   ftpCommand_sentrecord
 #
-    def ftpCommand_mget(self, dirList = ''):
-        self.ftpCommand_remfiles(dirList)
+    def ftpCommand_uploadhistory(self):
+        import sqlite3
+
+        if self.uploadHistory == None:
+            try:
+                self.uploadHistory = ftpUploadHistory()
+            except (OSError, sqlite3.Error) as err:
+                print(f'Upload history: {err}')
+                return None
+            
+            self.ftpCommand_sentprune()
+        
+        self.uploadHistory.checkHash = self.systStatus['senthash']
+        return self.uploadHistory
 #
-# Calls ftpCommand 'remfiles' for processing multiple files - delete only
+# Login and remote path of a file in upload history
 # Called from:
-#   ftpProcessCommand
+#   ftpCommand_sent
+#   ftpCommand_sentbefore
+#   ftpCommand_sentrecord
 #
-    def ftpCommand_mdelete(self, dirList = ''):
-        self.ftpCommand_remfiles(dirList)
+    def ftpCommand_sentkey(self, remoteFile = ''):
+        return f'{self.ftpClient.loginUser}@{self.ftpClient.ftpConn.hostKey()}', posixpath.normpath(posixpath.join(self.remoteDir, remoteFile))
 #
-# Depending on user call, it'll get multiple files or delete multiple files from a directory list
+# Whether localFile was sent to remoteFile before and has not changed since
 # Called from:
-#   ftpProcessCommand_mget
-#   ftpProcessCommand_mdelete
+#   ftpCommand_stor
+#   ftpCommand_mput
+#
+    def ftpCommand_sentbefore(self, localFile, remoteFile):
+        import sqlite3
+
+        uploadHistory = self.ftpCommand_uploadhistory()
+        if uploadHistory == None:
+            return False
+        
+        try:
+            return uploadHistory.unchanged(*self.ftpCommand_sentkey(remoteFile), localFile)
+        except sqlite3.Error as err:
+            print(f'Upload history: {err}')
+            return False
+#
+# Record in upload history that localFile was sent to remoteFile. fileStat as taken before it was sent
+# Called from:
+#   ftpCommand_stor
+#
+    def ftpCommand_sentrecord(self, localFile, remoteFile, fileStat):
+        import sqlite3
+
+        uploadHistory = self.ftpCommand_uploadhistory()
+        if uploadHistory == None:
+            return
+        
+        try:
+            uploadHistory.record(*self.ftpCommand_sentkey(remoteFile), localFile, fileStat)
+        except (OSError, sqlite3.Error) as err:
+            print(f'Upload history: {err}')
+#
+# Evict entries of upload history not used for maxAge days (default 'sentdays') and beyond 'sentmax'.
+# Returns the number of entries evicted
+# Called from:
+#   ftpCommand_uploadhistory
+#   ftpCommand_mput
+#   ftpCommand_sent
+#
+    def ftpCommand_sentprune(self, maxAge = None):
+        import sqlite3
+
+        if maxAge == None:
+            maxAge = self.systSettings['sentdays']['value']
+        
+        try:
+            return self.uploadHistory.prune(maxAge, self.systSettings['sentmax']['value'])
+        except sqlite3.Error as err:
+            print(f'Upload history: {err}')
+            return 0
+#
+# Show or change upload history of the current login. Patterns are remote paths (relative to the remote directory)
+# and may have * ? [ ]
+#   sent [pattern]              List files sent, with size and time sent
+#   sent -forget [pattern]      Remove entries (all without pattern), the files are sent again
+#   sent -prune [days]          Evict entries not used for days (default 'sentdays') and beyond 'sentmax'
+# Called from:
+#   ftpProcessCommand
+#
+    def ftpCommand_sent(self, sentParams = ''):
+        import sqlite3
+
+        userInputs = getInputParams(sentParams)
+        uploadHistory = self.ftpCommand_uploadhistory()
+        if uploadHistory == None:
+            return
+        
+        sentOption = ''
+        if len(userInputs) > 0 and userInputs[0].lower() in ['-forget', '-prune']:
+            sentOption = userInputs.pop(0).lower()
+        
+        try:
+            if sentOption == '-prune':
+                maxAge = None
+                if len(userInputs) > 0:
+                    if userInputs[0].isdigit() == False:
+                        self.ftpCommand_error(f'{userInputs[0]}: invalid number of days.')
+                        return
+                    maxAge = int(userInputs[0])
+                
+                print(f'Upload history: {self.ftpCommand_sentprune(maxAge)} entries evicted.')
+                return
+            
+            hostKey, pathPattern = self.ftpCommand_sentkey(userInputs[0] if len(userInputs) > 0 else '*')
+            if sentOption == '-forget':
+                print(f'Upload history: {uploadHistory.forget(hostKey, pathPattern)} entries removed.')
+                return
+            
+            sentEntries = uploadHistory.entries(hostKey, pathPattern)
+        except sqlite3.Error as err:
+            print(f'Upload history: {err}')
+            return
+        
+        for remotePath, fileSize, fileSent, fileHash in sentEntries:
+            print(f'{time.strftime("%Y-%m-%d %H:%M", time.localtime(fileSent))} {fileSize:>15} {"sha256" if fileHash != None else "":<6} {remotePath}')
+        print(f'Upload history: {len(sentEntries)} files sent to {hostKey} .')
+#
+# Manifest recording the files completed by mget/mput (see ftpManifest). A first input -continue is removed and
+# continues the last run with the same host, directories and files, else a new manifest is started.
+# Returns the manifest (None if it can't be written) and the inputs left
+# Called from:
+#   ftpCommand_mput
+#   ftpCommand_remfiles
+#
+    def ftpCommand_manifest(self, userInputs):
+        continueRun = False
+        if len(userInputs) > 0 and userInputs[0].lower() in ['-continue', '--continue']:
+            continueRun = True
+            userInputs = userInputs[1:]
+        
+        if len(userInputs) == 0:
+            return None, userInputs
+        
+        manifestKey = ' '.join([self.ftpCommand, f'{self.loginHost}:{self.loginPort}', self.loginUser, self.remoteDir,
+                                self.localDir, os.getcwd()] + userInputs)
+        try:
+            return ftpManifest(manifestKey, continueRun, self.systStatus['manifesthash']), userInputs
+        except OSError as err:
+            print(f'{self.ftpCommand}: manifest not written, {err}')
+            return None, userInputs
+#
+# Calls ftpCommand 'remfiles' for processing multiple files - get only
+# Called from:
+#   ftpProcessCommand
+#
+    def ftpCommand_mget(self, dirList = ''):
+        return self.ftpCommand_remfiles(dirList)
+#
+# Calls ftpCommand 'remfiles' for processing multiple files - delete only
+# Called from:
+#   ftpProcessCommand
+#
+    def ftpCommand_mdelete(self, dirList = ''):
+        return self.ftpCommand_remfiles(dirList)
+#
+# Depending on user call, it'll get multiple files or delete multiple files from a directory list
+# Called from:
+#   ftpProcessCommand_mget
+#   ftpProcessCommand_mdelete
 #
     def ftpCommand_remfiles(self, dirList = ''):
-        dirList = getUserInput('Remote files:', dirList, False, f'{self.ftpCommand} remote files')
+        if self.ftpCommand == 'mget':
+            dirList = getUserInput('Remote files:', dirList, False, f'{self.ftpCommand} [-continue] remote files')
+        else:
+            dirList = getUserInput('Remote files:', dirList, False, f'{self.ftpCommand} remote files')
 
         userInputs = getInputParams(dirList)
+        fileManifest = None
+        if self.ftpCommand == 'mget':
+            fileManifest, userInputs = self.ftpCommand_manifest(userInputs)
+        
         if len(userInputs) < 1:
             return
         
-        for inputDir in userInputs:
-            fileList = []
-            try:
-                ftpResponse = self.ftpConn.retrlines(f'NLST {inputDir}', fileList.append)
-            except ftplib.all_errors as err:
-                print(str(err))
+        # With cmdpipeline, deletes are sent together batchsize at a time, so that they can be pipelined
+        deleteList = []
+        getResults = {}
+        skipCount = 0
+        failCount = 0
+        userOption = ''
+        runComplete = False
+        try:
+            for inputDir in userInputs:
+                if userOption == 'q':
+                    break
+                
+                cmdResponse = self.ftpCommand_listing(inputDir)
+                if cmdResponse.success == False:
+                    print(cmdResponse.response)
+                    failCount += 1
+                    continue
+                else:
+                    for fileItem in cmdResponse.data:
+                        if fileManifest != None and fileManifest.completed(fileItem) == True:
+                            skipCount += 1
+                            continue
+                        
+                        if self.systStatus['prompt'] == True:
+                            userOption = getYorN(f'{self.ftpCommand} {fileItem}')
+                            if userOption == 'q':
+                                break
+                            elif userOption == 'n':
+                                continue
+                        if self.ftpCommand == 'mget':
+                            getResults[fileItem] = self.ftpCommand_retr(fileItem, fileItem)
+                            if getResults[fileItem] == None or getResults[fileItem].success == False:
+                                failCount += 1
+                            elif fileManifest != None and len(getResults[fileItem].data) > 0:
+                                fileManifest.record(fileItem, getResults[fileItem].data[0])
+                        elif self.ftpCommand == 'mdelete' and self.systStatus['cmdpipeline'] == True:
+                            deleteList.append(fileItem)
+                            if len(deleteList) >= self.systSettings['batchsize']['value']:
+                                failCount += self.ftpCommand_deletebatch(deleteList)
+                                deleteList = []
+                        elif self.ftpCommand == 'mdelete':
+                            if self.ftpCommand_dele(fileItem).success == False:
+                                failCount += 1
+            
+            runComplete = userOption != 'q' and failCount == 0
+        finally:
+            if fileManifest != None:
+                fileManifest.close(runComplete)
+        
+        failCount += self.ftpCommand_deletebatch(deleteList)
+        if len(getResults) > 0 or skipCount > 0:
+            self.ftpCommand_getsummary(getResults, skipCount)
+        
+        return ftpResult(failCount == 0, 0, f'{self.ftpCommand}: {failCount} failed.')
+#
+# Delete remote files with one batch of commands (pipelined when 'cmdpipeline' is on). Returns the number of
+# deletes which failed
+# Called from:
+#   ftpCommand_remfiles
+#
+    def ftpCommand_deletebatch(self, deleteList):
+        cmdResponses = self.ftpCommand_sendbatch([f'DELE {fileItem}' for fileItem in deleteList])
+        return len([cmdResponse for cmdResponse in cmdResponses if cmdResponse.success == False])
+#
+# Summary at the end of mget: files received, failed and skipped (-continue), and the files which stalled
+# Called from:
+#   ftpCommand_remfiles
+#
+    def ftpCommand_getsummary(self, getResults, skipCount = 0):
+        failedCount = 0
+        stallCount = 0
+        for fileItem, cmdResponse in getResults.items():
+            if cmdResponse == None or cmdResponse.success == False:
+                failedCount += 1
+            if cmdResponse != None:
+                stallCount += cmdResponse.stalls
+        
+        print(f'{self.ftpCommand}: {len(getResults) - failedCount} of {len(getResults)} files received, {failedCount} failed, {stallCount} stalls.')
+        if skipCount > 0:
+            print(f'{self.ftpCommand}: {skipCount} files already received, skipped.')
+        for fileItem, cmdResponse in getResults.items():
+            if cmdResponse != None and cmdResponse.stalls > 0:
+                stallResult = 'resumed' if cmdResponse.success == True else 'failed'
+                print(f'  {fileItem}: stalled {cmdResponse.stalls} times, {stallResult}.')
+#
+# Send one local file to many hosts at the same time. The local file is read once (memory mapped) and shared by
+# all uploads. Hosts file has one host per line: host [port] [user [password]], # for comments. Hosts without
+# user/password use those of the current login, or are asked once. Ends with a table of results per host.
+#   fanout hosts-file local-file [remote-file]
+# Called from:
+#   ftpProcessCommand
+#
+    def ftpCommand_fanout(self, fanoutParams = ''):
+        fanoutParams = getUserInput('Hosts file:', fanoutParams, False, f'{self.ftpCommand} hosts-file local-file [remote-file]')
+
+        userInputs = getInputParams(fanoutParams)
+        if len(userInputs) < 2:
+            print(f'{self.ftpCommand} hosts-file local-file [remote-file].')
+            return
+        
+        hostsFile = os.path.join(self.localDir, userInputs[0])
+        localFile = os.path.join(self.localDir, userInputs[1])
+        remoteFile = os.path.basename(localFile)
+        if len(userInputs) > 2:
+            remoteFile = userInputs[2]
+        
+        if not os.path.isfile(localFile):
+            self.ftpCommand_error(f'{localFile}: File not found')
+            return
+        
+        hostList = []
+        try:
+            with open(hostsFile, 'r') as hostsInput:
+                for hostLine in hostsInput:
+                    hostInfo = hostLine.split('#')[0].split()
+                    if len(hostInfo) == 0:
+                        continue
+                    
+                    fanoutHost = {'host': hostInfo.pop(0), 'port': 0, 'user': '', 'password': ''}
+                    if len(hostInfo) > 0 and hostInfo[0].isdigit() == True:
+                        fanoutHost['port'] = int(hostInfo.pop(0))
+                    if len(hostInfo) > 0:
+                        fanoutHost['user'] = hostInfo.pop(0)
+                    if len(hostInfo) > 0:
+                        fanoutHost['password'] = hostInfo.pop(0)
+                    hostList.append(fanoutHost)
+        except OSError as err:
+            print(str(err))
+            return
+        
+        if len(hostList) == 0:
+            print(f'{hostsFile}: no hosts.')
+            return
+        
+        # Logins missing in hosts file: current login, or asked once here as uploads run without prompting
+        loginUser = self.ftpClient.loginUser
+        loginPassword = self.ftpClient.loginPassword
+        if any(len(fanoutHost['user']) == 0 for fanoutHost in hostList) and len(loginUser) == 0:
+            loginUser = getUserInput('User:')
+            loginPassword = getUserInput('Password:', '', True)
+        for fanoutHost in hostList:
+            if len(fanoutHost['user']) == 0:
+                fanoutHost['user'] = loginUser
+                fanoutHost['password'] = loginPassword
+        
+        def fanoutSession():
+            ftpSession = ftpClient(self.systStatus['secure'], self.bufferPool)
+            ftpSession.passive = self.ftpClient.passive
+            ftpSession.connectTimeout = self.systSettings['connecttimeout']['value']
+            ftpSession.setStallTimeout(self.systSettings['stalltimeout']['value'], self.systSettings['retries']['value'])
+            ftpSession.tuningProfile = self.ftpClient.tuningProfile
+            ftpSession.linkSpeed = self.ftpClient.linkSpeed
+            ftpSession.setRateLimit(self.ftpClient.rateLimit, self.ftpClient.rateWeight)
+            ftpSession.transferHooks = list(self.ftpClient.transferHooks)
+            return ftpSession
+        
+        try:
+            fanoutResults = fanoutPut(hostList, localFile, remoteFile, self.systSettings['fanouthosts']['value'], fanoutSession)
+        except OSError as err:
+            print(str(err))
+            return
+        
+        print(f'{"Host":<30} {"Result":<6} {"Bytes":>12} {"Seconds":>8} {"Kbytes/sec":>11}  Response')
+        failCount = 0
+        for fanoutHost, cmdResponse in zip(hostList, fanoutResults):
+            hostName = fanoutHost['host']
+            if fanoutHost['port'] > 0:
+                hostName += f':{fanoutHost["port"]}'
+            
+            if cmdResponse == None:
+                cmdResponse = ftpResult(False, 0, 'Not started.')
+            
+            transferResult = 'OK'
+            if cmdResponse.success == False:
+                transferResult = 'FAILED'
+                failCount += 1
+            
+            transferRate = cmdResponse.bytes / 1024 / max(cmdResponse.elapsed, 0.001)
+            print(f'{hostName:<30} {transferResult:<6} {cmdResponse.bytes:>12} {cmdResponse.elapsed:>8.2f} {transferRate:>11.2f}  {cmdResponse.response.strip()}')
+        
+        print(f'fanout: {len(hostList) - failCount} of {len(hostList)} hosts sent {remoteFile}.')
+#
+# Parse directory and options of a tree walk command. Option values are returned as given, except sizes
+# (suffix K, M or G allowed) and numbers which are converted. Returns None if an option is not valid
+# Called from:
+#   ftpCommand_find
+#   ftpCommand_du
+#
+    def ftpCommand_walkparams(self, walkParams, optionNames):
+        userInputs = getInputParams(walkParams)
+        remoteDir = ''
+        walkOptions = {}
+        while len(userInputs) > 0:
+            userInput = userInputs.pop(0)
+            if userInput[:1] != '-':
+                remoteDir = userInput
                 continue
+            
+            optionName = userInput[1:].lower()
+            if optionName not in optionNames or len(userInputs) == 0:
+                self.ftpCommand_error(f'{userInput}: invalid option, use {" ".join("-" + optionName for optionName in optionNames)}.')
+                return None
+            
+            optionValue = userInputs.pop(0)
+            if optionName in ['minsize', 'maxsize']:
+                sizeMatch = re.match(r'^(\d+)([kmg]?)$', optionValue.lower())
+                if sizeMatch == None:
+                    self.ftpCommand_error(f'{optionValue}: invalid size.')
+                    return None
+                optionValue = int(sizeMatch.group(1)) * 1024 ** ' kmg'.index(sizeMatch.group(2) or ' ')
+            elif optionName in ['maxdepth', 'newer', 'older']:
+                if optionValue.isdigit() == False:
+                    self.ftpCommand_error(f'{optionValue}: invalid number.')
+                    return None
+                optionValue = int(optionValue)
+            elif optionName == 'type' and optionValue not in ['f', 'd']:
+                self.ftpCommand_error(f'{optionValue}: invalid type, use f or d.')
+                return None
+            
+            walkOptions[optionName] = optionValue
+        
+        if len(remoteDir) > 1:
+            remoteDir = remoteDir.rstrip('/') or '/'
+        return remoteDir, walkOptions
+#
+# Find files and directories in a remote tree, listed in parallel over 'sessions' sessions.
+#   find [dir] [-name pattern] [-type f|d] [-minsize n] [-maxsize n] [-newer days] [-older days] [-maxdepth n]
+# Called from:
+#   ftpProcessCommand
+#
+    def ftpCommand_find(self, findParams = ''):
+        import fnmatch
+
+        walkParams = self.ftpCommand_walkparams(findParams, ['name', 'type', 'minsize', 'maxsize', 'newer', 'older', 'maxdepth'])
+        if walkParams == None:
+            return
+        
+        remoteDir, findOptions = walkParams
+        newerTime = ''
+        olderTime = ''
+        if 'newer' in findOptions.keys():
+            newerTime = time.strftime('%Y%m%d%H%M%S', time.gmtime(time.time() - findOptions['newer'] * 86400))
+        if 'older' in findOptions.keys():
+            olderTime = time.strftime('%Y%m%d%H%M%S', time.gmtime(time.time() - findOptions['older'] * 86400))
+        
+        findCount = [0]
+        def findEntry(entryDir, entryName, entryFacts, depth):
+            if 'name' in findOptions.keys() and fnmatch.fnmatch(entryName, findOptions['name']) == False:
+                return
+            if 'type' in findOptions.keys() and {'f': 'file', 'd': 'dir'}[findOptions['type']] != entryFacts['type']:
+                return
+            if entryFacts.get('size', 0) < findOptions.get('minsize', 0):
+                return
+            if 'maxsize' in findOptions.keys() and entryFacts.get('size', 0) > findOptions['maxsize']:
+                return
+            if len(newerTime) > 0 and entryFacts.get('modify', '') < newerTime:
+                return
+            if len(olderTime) > 0 and entryFacts.get('modify', '99999999999999') > olderTime:
+                return
+            
+            findCount[0] += 1
+            print(posixpath.join(entryDir, entryName))
+        
+        # -maxdepth 0 is the starting point itself, with its facts from MLST (a directory when not supported)
+        if findOptions.get('maxdepth') == 0:
+            startPoint = remoteDir or '.'
+            cmdResponse = self.ftpClient.mlst(startPoint)
+            if cmdResponse.success == True:
+                startFacts = cmdResponse.data[0]
+                if startFacts['type'] in ['cdir', 'pdir']:
+                    startFacts['type'] = 'dir'
+            elif cmdResponse.code in [500, 502]:
+                startFacts = {'type': 'dir'}
             else:
-                for fileItem in fileList:
-                    if self.systStatus['prompt'] == True:
-                        userOption = getYorN(f'{self.ftpCommand} {fileItem}')
-                        if userOption == 'q':
-                            return
-                        elif userOption == 'n':
-                            continue
-                    if self.ftpCommand == 'mget':
-                        self.ftpCommand_retr(fileItem, fileItem)
-                    elif self.ftpCommand == 'mdelete':
-                        self.ftpCommand_dele(fileItem)
+                print(f'{startPoint}: {cmdResponse.response}')
+                return cmdResponse
+            
+            findEntry(posixpath.dirname(startPoint), posixpath.basename(startPoint) or startPoint, startFacts, 0)
+            if self.systStatus['verbose'] == True:
+                print(f'find: {findCount[0]} found.')
+            return
+        
+        # -maxdepth counts levels below dir as for find, the walker counts levels of directories listed
+        walkDepth = -1
+        if 'maxdepth' in findOptions.keys():
+            walkDepth = findOptions['maxdepth'] - 1
+        
+        treeWalker = ftpTreeWalker(self.ftpCommand_sessionpool(), findEntry, walkDepth, concurrency = self.sessionControl)
+        walkResult = treeWalker.walk(remoteDir)
+        for walkError in walkResult.data:
+            print(walkError)
+        
+        if self.systStatus['verbose'] == True:
+            print(f'find: {findCount[0]} found, {walkResult.response[:-1]} in {walkResult.elapsed:.2f}Seconds.')
+#
+# Total size and number of files of a remote tree and its subdirectories, listed in parallel over 'sessions'
+# sessions. -maxdepth limits the subdirectories shown, the whole tree is always counted.
+#   du [dir] [-maxdepth n]
+# Called from:
+#   ftpProcessCommand
+#
+    def ftpCommand_du(self, duParams = ''):
+        walkParams = self.ftpCommand_walkparams(duParams, ['maxdepth'])
+        if walkParams == None:
+            return
+        
+        remoteDir, duOptions = walkParams
+        dirTotals = {remoteDir: [0, 0, 0]}
+        def duEntry(entryDir, entryName, entryFacts, depth):
+            if entryFacts['type'] == 'dir':
+                dirTotals[posixpath.join(entryDir, entryName)] = [0, 0, depth + 1]
+                return
+            
+            # Add to the directory and all its parents up to the starting directory
+            for parentDepth in range(depth + 1):
+                dirTotals[entryDir][0] += entryFacts.get('size', 0)
+                dirTotals[entryDir][1] += 1
+                entryDir = posixpath.dirname(entryDir)
+        
+        treeWalker = ftpTreeWalker(self.ftpCommand_sessionpool(), duEntry, concurrency = self.sessionControl)
+        walkResult = treeWalker.walk(remoteDir)
+        for walkError in walkResult.data:
+            print(walkError)
+        
+        for dirName in sorted(dirTotals.keys()):
+            dirSize, fileCount, dirDepth = dirTotals[dirName]
+            if dirDepth <= duOptions.get('maxdepth', dirDepth):
+                print(f'{dirSize:>15} {fileCount:>9}  {dirName or "."}')
+        
+        if self.systStatus['verbose'] == True:
+            print(f'du: {walkResult.response[:-1]} in {walkResult.elapsed:.2f}Seconds.')
 #
 # Change Remote Working Directory. send CWD to remote server
 # Called from:
@@ -795,9 +1897,13 @@ class ftpProcess():
         remoteDir = userInputs[0]
 
         cmdResponse = self.ftpCommand_remotecmd(f'CWD {remoteDir}')
-        if cmdResponse['cmdsuccess'] == True:
-            getRemoteFile = cmdResponse['response'].strip().find(' : ') + 3
-            self.remoteDir = cmdResponse['response'][getRemoteFile:]
+        if cmdResponse.success == True:
+            getRemoteFile = cmdResponse.response.strip().find(' : ') + 3
+            if getRemoteFile > 2:
+                self.remoteDir = cmdResponse.response[getRemoteFile:]
+            elif self.ftpClient.pwd().success == True:
+                # Reply doesn't include the directory (differs by server)
+                self.remoteDir = self.ftpClient.remoteDir
 #
 # Get Present Working Directory. Send PWD to remote server
 # Called from:
@@ -805,8 +1911,8 @@ class ftpProcess():
 #
     def ftpCommand_pwd(self):
         cmdResponse = self.ftpCommand_remotecmd(f'PWD', 1)
-        if cmdResponse['cmdsuccess'] == True:
-            getDir = re.search('\"(.+)\"', cmdResponse['response'])
+        if cmdResponse.success == True:
+            getDir = re.search('\"(.+)\"', cmdResponse.response)
             if len(getDir.groups()) > 0:
                 self.remoteDir = getDir.group(1)
 #
@@ -815,12 +1921,14 @@ class ftpProcess():
 #   ftpProcessCommand
 #
     def ftpCommand_cdup(self):
-        cmdResponse = self.ftpCommand_remotecmd(f'CDUP')
-        self.remoteDir = self.ftpConn.pwd()
+        self.ftpCommand_remotecmd(f'CDUP')
+        if self.ftpClient.pwd().success == True:
+            self.remoteDir = self.ftpClient.remoteDir
 #
 # Delete remote file. Send DELE to remote server
 # Called from:
 #   ftpProcessCommand
+#   ftpCommand_remfiles
 #
     def ftpCommand_dele(self, remoteFile = ''):
         remoteFile = getUserInput('Remote file:', remoteFile, False, f'{self.ftpCommand} remote file.')
@@ -831,24 +1939,111 @@ class ftpProcess():
         userInputs = getInputParams(remoteFile)
         remoteFile = userInputs[0]
 
-        self.ftpCommand_remotecmd(f'DELE {remoteFile}')
+        cmdResponse = self.ftpClient.delete(remoteFile)
+        self.ftpCommand_printresponse(cmdResponse.response)
+        return cmdResponse
 #
 # Delete remote directory. Send RMD to remote server
+#   rmdir directory-name
+#   rm -r [-n] directory-name       Delete directory with everything in it (-n: only show what would be deleted)
 # Called from:
 #   ftpProcessCommand
 #
     def ftpCommand_rmd(self, remoteDir = ''):
-        remoteDir = getUserInput('Directory name:', remoteDir, False, f'{self.ftpCommand} directory-name')
+        remoteDir = getUserInput('Directory name:', remoteDir, False, f'{self.ftpCommand} [-r [-n]] directory-name')
 
         if len(remoteDir) == 0:
             return
         
         userInputs = getInputParams(remoteDir)
+        rmOptions = ''
+        while len(userInputs) > 1 and userInputs[0][:1] == '-':
+            rmOptions += userInputs.pop(0)[1:].lower()
         remoteDir = userInputs[0]
 
-        self.ftpCommand_remotecmd(f'RMD {remoteDir}')
+        if 'r' in rmOptions:
+            self.ftpCommand_rmtree(remoteDir, 'n' in rmOptions)
+        elif 'n' in rmOptions:
+            print('-n only applies to rm -r.')
+        else:
+            self.ftpCommand_remotecmd(f'RMD {remoteDir}')
+#
+# Delete a remote directory tree: the tree is walked first, then files are deleted in parallel over 'sessions'
+# sessions and directories removed bottom-up (the directories of one level in parallel). Nothing is deleted when
+# the tree could not be listed completely. With dryRun only lists what would be deleted.
+# Called from:
+#   ftpCommand_rmd
+#
+    def ftpCommand_rmtree(self, remoteDir, dryRun = False):
+        startTime = time.perf_counter()
+        sessionList = self.ftpCommand_sessionpool()
+        treeFiles = []
+        treeDirs = [(remoteDir, 0)]
+        def treeEntry(entryDir, entryName, entryFacts, depth):
+            if entryFacts['type'] == 'dir':
+                treeDirs.append((posixpath.join(entryDir, entryName), depth + 1))
+            else:
+                treeFiles.append(posixpath.join(entryDir, entryName))
+        
+        walkResult = ftpTreeWalker(sessionList, treeEntry, concurrency = self.sessionControl).walk(remoteDir)
+        if walkResult.success == False:
+            for walkError in walkResult.data:
+                print(walkError)
+            print(f'rm: {remoteDir} not listed completely, nothing deleted.')
+            return
+        
+        if dryRun == True:
+            for filePath in sorted(treeFiles):
+                print(filePath)
+            for dirPath, depth in sorted(treeDirs, key = lambda x: (-x[1], x[0])):
+                print(f'{dirPath}/')
+            print(f'rm: would delete {len(treeFiles)} files and {len(treeDirs)} directories.')
+            return
+        
+        if self.systStatus['prompt'] == True:
+            userOption = getYorN(f'rm -r {remoteDir}: delete {len(treeFiles)} files and {len(treeDirs)} directories', ['y', 'n'])
+            if userOption == 'n':
+                return
+        
+        # Progress is shown at most once a second, on one line
+        rmTotal = len(treeFiles) + len(treeDirs)
+        rmProgress = {'done': 0, 'failed': [], 'shown': 0.0}
+        progressLock = threading.Lock()
+        def rmItem(ftpSession, itemPath):
+            if itemPath in rmFiles:
+                cmdResponse = ftpSession.delete(itemPath)
+            else:
+                cmdResponse = ftpSession.rmdir(itemPath)
+            
+            with progressLock:
+                rmProgress['done'] += 1
+                if cmdResponse.success == False:
+                    rmProgress['failed'].append(f'{itemPath}: {cmdResponse.response}')
+                if self.systStatus['verbose'] == True and time.perf_counter() - rmProgress['shown'] >= 1.0:
+                    rmProgress['shown'] = time.perf_counter()
+                    print(f'\rrm: {rmProgress["done"]} of {rmTotal} deleted, {len(rmProgress["failed"])} failed.', end = '', flush = True)
+            return cmdResponse
+        
+        rmFiles = set(treeFiles)
+        runParallel(sessionList, treeFiles, rmItem, self.sessionControl)
+        for dirDepth in sorted(set(depth for dirPath, depth in treeDirs), reverse = True):
+            runParallel(sessionList, [dirPath for dirPath, depth in treeDirs if depth == dirDepth], rmItem, self.sessionControl)
+        
+        if self.systStatus['verbose'] == True and rmProgress['shown'] > 0:
+            print()
+        
+        for rmError in rmProgress['failed'][:20]:
+            print(rmError)
+        if len(rmProgress['failed']) > 20:
+            print(f'... {len(rmProgress["failed"]) - 20} more failed.')
+        
+        if self.remoteIndex != None and len(rmProgress['failed']) == 0:
+            self.remoteIndex.removeTree(posixpath.normpath(posixpath.join(self.remoteDir, remoteDir)))
+        
+        print(f'rm: {rmProgress["done"] - len(rmProgress["failed"])} of {rmTotal} files and directories deleted '
+              f'in {time.perf_counter() - startTime:.2f}Seconds.')
 #
-# Uses RETR to get file from remote server
+# Uses RETR to get file from remote server. Returns the transfer result (None when nothing was transferred)
 # Called from:
 #   ftpProcessCommand
 #   ftpCommand_remfiles
@@ -857,6 +2052,10 @@ class ftpProcess():
         remoteFile = getUserInput('Remote file:', f'{remoteFile} {localFile}', False, f'{self.ftpCommand} Remote file')
 
         userInputs = getInputParams(remoteFile)
+        if len(userInputs) > 0 and userInputs[0].lower() == '-follow':
+            self.ftpCommand_tail(remoteFile.strip()[len('-follow'):])
+            return
+        
         try:
             remoteFile = userInputs[0]
         except:
@@ -877,6 +2076,23 @@ class ftpProcess():
         except:
             localFile = ''
 
+        # Local file '-' streams the data to stdout, messages go to stderr so the data stream is not corrupted
+        if localFile == '-':
+            fileUsageMode = 'w'
+            fileBuffering = -1
+            if self.systStatus['binary'] == True:
+                fileUsageMode = 'wb'
+                fileBuffering = 0
+            
+            import contextlib
+            sys.stdout.flush()
+            with contextlib.redirect_stdout(sys.stderr):
+                with open(sys.__stdout__.fileno(), fileUsageMode, buffering = fileBuffering, closefd = False) as file2write:
+                    bufferDepth = self.ftpCommand_bufferdepth(True)
+                    cmdResponse = self.ftpClient.get(remoteFile, file2write, False, self.systStatus['binary'], bufferDepth)
+                    self.ftpCommand_transferresult('received', cmdResponse, bufferDepth)
+            return cmdResponse
+        
         fileLocalPath = os.path.dirname(localFile)
         fileLocalBase = os.path.basename(localFile)
 
@@ -889,30 +2105,65 @@ class ftpProcess():
             fileLocalBase = re.sub('[\$\*\/\(\)]', '_', remoteFile)
             localFile = os.path.join(fileLocalPath, fileLocalBase)
         
-        fileUsageMode = 'w'
-        if appendFile == True:
-            fileUsageMode = 'a'
+        bufferDepth = self.ftpCommand_bufferdepth()
+        cmdResponse = self.ftpClient.get(remoteFile, localFile, appendFile, self.systStatus['binary'], bufferDepth)
+        self.ftpCommand_transferresult('received', cmdResponse, bufferDepth)
+        return cmdResponse
+#
+# Fetch only the data added to a growing remote file (e.g. a log) since the last fetch, appending it to the local
+# copy. When seconds is given, polls again every seconds until interrupted (Ctrl-C).
+#   tail remote-file [local-file] [seconds]
+#   get -follow remote-file [local-file] [seconds]
+# Called from:
+#   ftpProcessCommand
+#   ftpCommand_retr
+#
+    def ftpCommand_tail(self, tailParams = ''):
+        tailParams = getUserInput('Remote file:', tailParams, False, f'{self.ftpCommand} remote-file [local-file] [seconds]')
+
+        userInputs = getInputParams(tailParams)
+        if len(userInputs) == 0:
+            return
         
-        if self.systStatus['binary'] == True:
-            fileUsageMode += 'b'
+        remoteFile = userInputs[0]
+        localFile = posixpath.basename(remoteFile)
+        pollInterval = 0
+        if len(userInputs) > 1 and userInputs[-1].isdigit() == True:
+            pollInterval = int(userInputs.pop())
         
-        outputError = False
-        file2write = open(localFile, fileUsageMode)
-
-        try:
-            if self.systStatus['binary'] == True:
-                ftpResponse = self.ftpConn.retrbinary(f'RETR {remoteFile}', lambda x: file2write.write(x))
-            else:
-                ftpResponse = self.ftpConn.retrlines(f'RETR {remoteFile}', lambda x: file2write.write(x + '\n'))
-        except ftplib.all_errors as err:
-            print(str(err))
-            outputError = True
-        else:
-            print(ftpResponse)
+        if len(userInputs) > 1:
+            localFile = userInputs[1]
+        
+        if localFile == '-':
+            print('tail: local file required.')
+            return
         
-        file2write.close()
-        if outputError == True:
-            os.remove(localFile)
+        localFile = os.path.join(self.localDir, localFile)
+        if os.path.isdir(localFile):
+            localFile = os.path.join(localFile, re.sub(r'[$*/()]', '_', posixpath.basename(remoteFile)))
+        
+        bufferDepth = 0
+        if self.systStatus['pipeline'] == True:
+            bufferDepth = max(2, self.systSettings['bufferdepth']['value'])
+        
+        try:
+            while True:
+                cmdResponse = self.ftpClient.follow(remoteFile, localFile, bufferDepth)
+                if cmdResponse.success == True and cmdResponse.data[1] == True:
+                    print(f'{remoteFile}: truncated or replaced, fetched from start.')
+                
+                if cmdResponse.success == True and len(cmdResponse.response) == 0:
+                    if self.systStatus['verbose'] == True:
+                        print(f'{remoteFile}: no new data, {cmdResponse.data[0]} bytes.')
+                else:
+                    self.ftpCommand_transferresult('received', cmdResponse, bufferDepth)
+                
+                if pollInterval == 0 or cmdResponse.success == False:
+                    break
+                
+                time.sleep(pollInterval)
+        except KeyboardInterrupt:
+            print()
 #
 # Calls the ftpCommand 'stor' function to override for append
 # Called from:
@@ -921,13 +2172,14 @@ class ftpProcess():
     def ftpCommand_appe(self, inputParams = ''):
         self.ftpCommand_stor(inputParams, '', True)
 #
-# Uses STOR to send file to remote server
+# Uses STOR to send file to remote server. Returns the transfer result (failed for a local error, None when no file
+# was given)
 # Called from:
 #   ftpProcessCommand
 #   ftpCommand_mput
 #   ftpCommand_appe
 #
-    def ftpCommand_stor(self, localFile = '', remoteFile = '', appendFile = False):
+    def ftpCommand_stor(self, localFile = '', remoteFile = '', appendFile = False, checkSent = True):
         localFile = getUserInput('Local file:', f'{localFile} {remoteFile}', False, f'{self.ftpCommand} Local file')
 
         userInputs = getInputParams(localFile)
@@ -944,9 +2196,13 @@ class ftpProcess():
         if len(localFile) == 0:
             return
         
-        if not os.path.exists(localFile) or not os.path.isfile(localFile):
-            print(f'{localFile}: File not found')
-            return
+        # Local file '-' reads the data from stdin. Remote file can't be prompted for, as stdin is the data
+        streamData = (localFile == '-')
+        if streamData == True:
+            if len(remoteFile) == 0:
+                return self.ftpCommand_error(f'Usage: {self.ftpCommand} - remote-file')
+        elif not os.path.isfile(localFile):
+            return self.ftpCommand_error(f'{localFile}: File not found')
         
         remoteFile = getUserInput('Remote file:', remoteFile)
         userInputs = getInputParams(remoteFile)
@@ -955,23 +2211,60 @@ class ftpProcess():
         except:
             remoteFile = ''
         
-        fileSendCommand = 'STOR'
-        if appendFile == True:
-            fileSendCommand = 'APPE'
+        bufferDepth = self.ftpCommand_bufferdepth(streamData)
+        if streamData == True:
+            import contextlib
+            sys.stdout.flush()
+            with contextlib.redirect_stdout(sys.stderr):
+                cmdResponse = self.ftpClient.put(sys.__stdin__.buffer, remoteFile, appendFile, self.systStatus['binary'], bufferDepth)
+                self.ftpCommand_transferresult('sent', cmdResponse, bufferDepth)
+            return cmdResponse
         
-        file2send = open(localFile, 'rb')
-
-        try:
-            if self.systStatus['binary'] == True:
-                ftpResponse = self.ftpConn.storbinary(f'{fileSendCommand} {remoteFile}', file2send)
-            else:
-                ftpResponse = self.ftpConn.storlines(f'{fileSendCommand} {remoteFile}', file2send)
-        except ftplib.all_errors as err:
-            print(str(err))
-        else:
-            print(ftpResponse)
+        # Upload history: appended files can't be compared with what was sent
+        sentHistory = self.systStatus['skipsent'] == True and appendFile == False and len(remoteFile) > 0
+        if sentHistory == True and checkSent == True and self.ftpCommand_sentbefore(localFile, remoteFile) == True:
+            print(f'{localFile}: unchanged since sent, skipped.')
+            return ftpResult(True, 0, f'{localFile}: unchanged since sent, skipped.')
+        
+        fileStat = os.stat(localFile)
+        cmdResponse = self.ftpClient.put(localFile, remoteFile, appendFile, self.systStatus['binary'], bufferDepth)
+        self.ftpCommand_transferresult('sent', cmdResponse, bufferDepth)
+        if sentHistory == True and cmdResponse.success == True:
+            self.ftpCommand_sentrecord(localFile, remoteFile, fileStat)
+        return cmdResponse
+#
+# Number of buffers between network and disk thread. 0 when pipeline mode is off (single thread) and for ascii
+# transfers. Binary streams to stdout/from stdin always use the bounded ring of buffers
+# Called from:
+#   ftpCommand_retr
+#   ftpCommand_stor
+#
+    def ftpCommand_bufferdepth(self, streamData = False):
+        if self.systStatus['binary'] == False:
+            return 0
+        
+        if self.systStatus['pipeline'] == False and streamData == False:
+            return 0
+        
+        return max(2, self.systSettings['bufferdepth']['value'])
+#
+# Print the transfer response followed by the transfer statistics in the same format as ftp.exe (Verbose mode only).
+# In pipeline mode, also prints the time each side of the transfer was held up by the other
+# Called from:
+#   ftpCommand_retr
+#   ftpCommand_stor
+#
+    def ftpCommand_transferresult(self, transferMode, transferResult, bufferDepth = 0):
+        print(transferResult.response)
+        if transferResult.success == False or self.systStatus['verbose'] == False:
+            return
         
-        file2send.close()
+        transferRate = transferResult.bytes / 1024 / max(transferResult.elapsed, 0.001)
+        print(f'ftp: {transferResult.bytes} bytes {transferMode} in {transferResult.elapsed:.2f}Seconds {transferRate:.2f}Kbytes/sec.')
+        if bufferDepth > 0:
+            print(f'ftp: stalled {transferResult.diskStall:.2f}Seconds on disk, {transferResult.networkStall:.2f}Seconds on network.')
+        if transferResult.stalls > 0:
+            print(f'ftp: transfer stalled {transferResult.stalls} times and was resumed.')
 #
 # Uses RNFR followed by RNTO to rename file on remote server
 # Called from:
@@ -1004,15 +2297,9 @@ class ftpProcess():
         if len(newName) == 0:
             return
         
-        cmdResponse = self.ftpCommand_remotecmd(f'RNFR {oldName}')
-        while self.ftpCommand_errorCode(cmdResponse) in range(300, 400):
-            checkStatus = self.ftpCommand_errorCode(cmdResponse)
-            if checkStatus == 350:
-                cmdResponse = self.ftpCommand_remotecmd(f'RNTO {newName}')
-            else:
-                cmdResponse['cmdsuccess'] = False
-        
-        if cmdResponse['cmdsuccess'] == False:
+        cmdResponse = self.ftpClient.rename(oldName, newName)
+        self.ftpCommand_printresponse(cmdResponse.response)
+        if cmdResponse.success == False:
             print('Rename failed.')
 #
 # Creates a new remote directory. Send MKD to remote server
@@ -1020,15 +2307,62 @@ class ftpProcess():
 #   ftpProcessCommand
 #
     def ftpCommand_mkd(self, newDir = ''):
-        newDir = getUserInput('Directory name:', newDir, False, f'{self.ftpCommand} directory-name.')
+        newDir = getUserInput('Directory name:', newDir, False, f'{self.ftpCommand} directory-name [directory-name ...].')
 
         if len(newDir) == 0:
             return
         
         userInputs = getInputParams(newDir)
-        newDir = userInputs[0]
+        self.ftpCommand_sendbatch([f'MKD {newDir}' for newDir in userInputs])
+#
+# Show size of remote files. Sends SIZE to remote server, in binary type
+# Called from:
+#   ftpProcessCommand
+#
+    def ftpCommand_size(self, remoteFiles = ''):
+        remoteFiles = getUserInput('Remote files:', remoteFiles, False, f'{self.ftpCommand} remote-file [remote-file ...].')
+
+        userInputs = getInputParams(remoteFiles)
+        # Sizes in bytes need binary type, some servers refuse SIZE in ascii (no round trip when already binary).
+        # Transfers set the type they need themselves
+        self.ftpClient.sendcmd('TYPE I')
+        cmdResponses = self.ftpCommand_sendbatch([f'SIZE {remoteFile}' for remoteFile in userInputs], -1)
+        for remoteFile, cmdResponse in zip(userInputs, cmdResponses):
+            if cmdResponse.code == 213:
+                print(f'{remoteFile}: {cmdResponse.response[4:].strip()}')
+            else:
+                print(f'{remoteFile}: {cmdResponse.response}')
+#
+# Show modification time (UTC) of remote files. Sends MDTM to remote server
+# Called from:
+#   ftpProcessCommand
+#
+    def ftpCommand_mdtm(self, remoteFiles = ''):
+        remoteFiles = getUserInput('Remote files:', remoteFiles, False, f'{self.ftpCommand} remote-file [remote-file ...].')
 
-        self.ftpCommand_remotecmd(f'MKD {newDir}')
+        userInputs = getInputParams(remoteFiles)
+        cmdResponses = self.ftpCommand_sendbatch([f'MDTM {remoteFile}' for remoteFile in userInputs], -1)
+        for remoteFile, cmdResponse in zip(userInputs, cmdResponses):
+            fileTime = cmdResponse.response[4:].strip()
+            if cmdResponse.code == 213 and len(fileTime) >= 14:
+                print(f'{remoteFile}: {fileTime[0:4]}-{fileTime[4:6]}-{fileTime[6:8]} {fileTime[8:10]}:{fileTime[10:12]}:{fileTime[12:14]} UTC')
+            else:
+                print(f'{remoteFile}: {cmdResponse.response}')
+#
+# Send several commands, pipelined when 'cmdpipeline' is on, printing each response (printResponse as for
+# ftpCommand 'remotecmd'). Returns the results in order
+# Called from:
+#   ftpCommand_deletebatch
+#   ftpCommand_mkd
+#   ftpCommand_size
+#   ftpCommand_mdtm
+#
+    def ftpCommand_sendbatch(self, commandList, printResponse = 0):
+        cmdResponses = self.ftpClient.sendBatch(commandList, self.systStatus['cmdpipeline'], self.systSettings['batchsize']['value'])
+        for cmdResponse in cmdResponses:
+            self.ftpCommand_printresponse(cmdResponse.response, printResponse)
+        
+        return cmdResponses
 #
 # Send arbitrary command to remote server. This is also called from multiple functions
 # printResponse values:
@@ -1038,55 +2372,2842 @@ class ftpProcess():
 # Called from:
 #   ftpProcessCommand
 #   ftpConnectionActive     (No output)
-#   ftpCommand_prot_p       (No output - partially)
-#   ftpCommand_prot_c
 #   ftpCommand_type
 #   ftpCommand_remotehelp   (Forced output)
-#   ftpCommand_user
-#   ftpCommand_challengeuser
 #   ftpCommand_cwd
 #   ftpCommand_pwd          (Forced output)
 #   ftpCommand_cdup
-#   ftpCommand_dele
 #   ftpCommand_rmd
-#   ftpCommand_rnfr
 #   ftpCommand_mkd
 #
     def ftpCommand_remotecmd(self, commandToSend, printResponse = 0):
-        commandStatus = {'cmdsuccess': False, 'response': ''}
+        cmdResponse = self.ftpClient.sendcmd(commandToSend)
+        self.ftpCommand_printresponse(cmdResponse.response, printResponse)
 
+        return cmdResponse
+#
+# Print response from remote server. printResponse values as for ftpCommand 'remotecmd'
+# Called from:
+#   ftpCommand_remotecmd
+#   ftpCommand_prot_p
+#   ftpCommand_prot_c
+#   ftpCommand_user
+#   ftpCommand_challengeuser
+#   ftpCommand_dele
+#   ftpCommand_rnfr
+#
+    def ftpCommand_printresponse(self, ftpResponse, printResponse = 0):
+        if printResponse == 1 or (printResponse == 0 and self.systStatus['verbose'] == True):
+            print(ftpResponse)
+###############################################################################
+# Command profiler, registered as command hook by 'profile on'. Runs cProfile while a command is processed
+# and keeps count, wall time and CPU time per command. The report has the per command times followed by the
+# cProfile statistics of the functions with highest cumulative time.
+#
+class ftpProfile():
+    def __init__(self, profileFile):
+        import cProfile
+
+        self.profileFile = profileFile
+        self.profileStart = datetime.now()
+        self.profiler = cProfile.Profile()
+        self.commandTimes = {}
+
+    def commandStart(self, userCommand, userInput):
+        self.profiler.enable()
+
+    def commandEnd(self, userCommand, userInput, wallTime, cpuTime):
+        self.profiler.disable()
+        if userCommand not in self.commandTimes.keys():
+            self.commandTimes[userCommand] = {'count': 0, 'wall': 0.0, 'cpu': 0.0}
+        
+        self.commandTimes[userCommand]['count'] += 1
+        self.commandTimes[userCommand]['wall'] += wallTime
+        self.commandTimes[userCommand]['cpu'] += cpuTime
+#
+# Write report to the profile file
+#
+    def writeReport(self, functionCount = 30):
+        import io
+
+        reportLines = [f'pyFTP profile {self.profileStart:%Y-%m-%d %H:%M:%S} - {datetime.now():%Y-%m-%d %H:%M:%S}', '']
+        reportLines.append(f'{"command":<15} {"count":>7} {"wall(s)":>12} {"cpu(s)":>12} {"cpu%":>7}')
+        for userCommand in sorted(self.commandTimes.keys()):
+            commandTime = self.commandTimes[userCommand]
+            cpuPercent = commandTime['cpu'] * 100 / max(commandTime['wall'], 0.000001)
+            reportLines.append(f'{userCommand:<15} {commandTime["count"]:>7} {commandTime["wall"]:>12.4f} {commandTime["cpu"]:>12.4f} {cpuPercent:>7.1f}')
+        
+        statsOutput = io.StringIO()
+        if len(self.commandTimes) > 0:
+            import pstats
+            profileStats = pstats.Stats(self.profiler, stream = statsOutput)
+            profileStats.sort_stats('cumulative').print_stats(functionCount)
+        
+        with open(self.profileFile, 'w') as profileOutput:
+            profileOutput.write('\n'.join(reportLines) + '\n\n')
+            profileOutput.write(statsOutput.getvalue())
+###############################################################################
+# Metrics of commands and transfers for monitoring of scheduled jobs:
+#   - eventFile: a JSON line is appended for every command and every transfer (host, command, bytes, duration,
+#     rate, response code)
+#   - promFile: counters and histograms in Prometheus text format (for the node_exporter textfile collector),
+#     written by flush(). Values already in the file are loaded first, so counters keep increasing across runs.
+# Registered as command hook on ftpProcess and transfer hook on its ftpClient.
+#
+class ftpMetrics():
+    metricFamilies = {
+        'pyftp_commands_total'                      : {'type': 'counter',   'help': 'Commands processed'},
+        'pyftp_command_duration_seconds'            : {'type': 'histogram', 'help': 'Wall time of commands'},
+        'pyftp_transfers_total'                     : {'type': 'counter',   'help': 'File transfers'},
+        'pyftp_transfer_bytes_total'                : {'type': 'counter',   'help': 'Bytes transferred'},
+        'pyftp_transfer_stalls_total'               : {'type': 'counter',   'help': 'Transfers aborted after making no progress'},
+        'pyftp_transfer_duration_seconds'           : {'type': 'histogram', 'help': 'Duration of successful transfers'},
+        'pyftp_transfer_rate_bytes_per_second'      : {'type': 'histogram', 'help': 'Rate of successful transfers'},
+        'pyftp_last_run_timestamp_seconds'          : {'type': 'gauge',     'help': 'Time metrics were last written'},
+    }
+    durationBuckets = [0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600]
+    rateBuckets = [1e4, 1e5, 1e6, 1e7, 1e8, 1e9]
+
+    def __init__(self, ftpUser, eventFile = None, promFile = None):
+        self.ftpUser = ftpUser
+        self.eventFile = eventFile
+        self.promFile = promFile
+        self.promValues = {}
+        self.commandHost = ''
+        self.commandBytes = 0
+        self.metricsLock = threading.Lock()
+
+        self.eventOutput = None
+        if eventFile != None:
+            self.eventOutput = open(eventFile, 'a', buffering = 1)
+        
+        if promFile != None:
+            self.loadProm()
+        
+        ftpUser.ftpRegisterHook(self.commandStart, self.commandEnd)
+        ftpUser.ftpClient.transferHooks.append(self.transferEnd)
+#
+# Command hooks: one event per command, bytes are the total of the transfers done by the command (e.g. mget)
+#
+    def commandStart(self, userCommand, userInput):
+        self.commandHost = self.ftpUser.loginHost
+        self.commandBytes = 0
+        self.ftpUser.ftpClient.lastResult = None
+
+    def commandEnd(self, userCommand, userInput, wallTime, cpuTime):
+        if userCommand not in self.ftpUser.commandValid.keys():
+            userCommand = 'invalid'
+        
+        # Outcome given by the command (see ftpProcess.commandResult), otherwise that of its last remote command
+        cmdResult = self.ftpUser.commandResult or self.ftpUser.ftpClient.lastResult
+        if cmdResult == None:
+            cmdResult = ftpResult(True)
+        
+        self.writeEvent({
+            'type'      : 'command',
+            'host'      : self.ftpUser.loginHost or self.commandHost,
+            'command'   : userCommand,
+            'bytes'     : self.commandBytes,
+            'duration'  : round(wallTime, 6),
+            'cpu'       : round(cpuTime, 6),
+            'rate'      : round(self.commandBytes / max(wallTime, 0.000001), 1),
+            'code'      : cmdResult.code,
+            'success'   : cmdResult.success,
+        })
+
+        commandLabels = {'command': userCommand, 'status': 'ok' if cmdResult.success == True else 'error'}
+        self.addValue('pyftp_commands_total', commandLabels, 1)
+        self.observe('pyftp_command_duration_seconds', {'command': userCommand}, wallTime, self.durationBuckets)
+#
+# Transfer hook: one event per file transferred. Also called from the threads of parallel uploads (fanout)
+#
+    def transferEnd(self, operation, remoteFile, cmdResult, loginHost):
+        with self.metricsLock:
+            self.transferMetrics(operation, remoteFile, cmdResult, loginHost)
+
+    def transferMetrics(self, operation, remoteFile, cmdResult, loginHost):
+        transferRate = cmdResult.bytes / max(cmdResult.elapsed, 0.000001)
+        self.commandBytes += cmdResult.bytes
+        self.writeEvent({
+            'type'      : 'transfer',
+            'host'      : loginHost,
+            'command'   : operation,
+            'file'      : remoteFile,
+            'bytes'     : cmdResult.bytes,
+            'duration'  : round(cmdResult.elapsed, 6),
+            'rate'      : round(transferRate, 1),
+            'code'      : cmdResult.code,
+            'success'   : cmdResult.success,
+            'stalls'    : cmdResult.stalls,
+        })
+
+        transferLabels = {'host': loginHost, 'direction': operation}
+        self.addValue('pyftp_transfers_total', dict(transferLabels, status = 'ok' if cmdResult.success == True else 'error'), 1)
+        self.addValue('pyftp_transfer_bytes_total', transferLabels, cmdResult.bytes)
+        self.addValue('pyftp_transfer_stalls_total', transferLabels, cmdResult.stalls)
+        if cmdResult.success == True:
+            self.observe('pyftp_transfer_duration_seconds', transferLabels, cmdResult.elapsed, self.durationBuckets)
+            self.observe('pyftp_transfer_rate_bytes_per_second', transferLabels, transferRate, self.rateBuckets)
+#
+# Append event to the JSON lines file
+#
+    def writeEvent(self, metricEvent):
+        import json
+
+        if self.eventOutput == None:
+            return
+        
+        metricEvent = dict({'time': datetime.now().astimezone().isoformat(timespec = 'milliseconds')}, **metricEvent)
+        self.eventOutput.write(json.dumps(metricEvent) + '\n')
+#
+# Prometheus sample name with labels, e.g. pyftp_transfers_total{host="ftp.example.com",direction="get"}
+#
+    def sampleName(self, metricName, metricLabels):
+        if len(metricLabels) == 0:
+            return metricName
+        
+        labelList = []
+        for labelName, labelValue in metricLabels.items():
+            labelValue = str(labelValue).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            labelList.append(f'{labelName}="{labelValue}"')
+        
+        return metricName + '{' + ','.join(labelList) + '}'
+
+    def addValue(self, metricName, metricLabels, metricValue):
+        sampleName = self.sampleName(metricName, metricLabels)
+        self.promValues[sampleName] = self.promValues.get(sampleName, 0) + metricValue
+#
+# Add an observation to a histogram (cumulative buckets, sum and count)
+#
+    def observe(self, metricName, metricLabels, metricValue, metricBuckets):
+        for bucketLimit in metricBuckets:
+            if metricValue <= bucketLimit:
+                self.addValue(f'{metricName}_bucket', dict(metricLabels, le = f'{bucketLimit:g}'), 1)
+            else:
+                self.addValue(f'{metricName}_bucket', dict(metricLabels, le = f'{bucketLimit:g}'), 0)
+        
+        self.addValue(f'{metricName}_bucket', dict(metricLabels, le = '+Inf'), 1)
+        self.addValue(f'{metricName}_sum', metricLabels, metricValue)
+        self.addValue(f'{metricName}_count', metricLabels, 1)
+#
+# Load the values of the previous runs from the Prometheus metrics file
+#
+    def loadProm(self):
+        try:
+            promInput = open(self.promFile, 'r')
+        except OSError:
+            return
+        
+        with promInput:
+            for promLine in promInput:
+                promLine = promLine.strip()
+                if len(promLine) == 0 or promLine[0] == '#':
+                    continue
+                
+                try:
+                    sampleName, sampleValue = promLine.rsplit(' ', 1)
+                    self.promValues[sampleName] = float(sampleValue)
+                except ValueError:
+                    continue
+#
+# Write all values to the Prometheus metrics file. Written to a temporary file first and renamed, so the
+# collector never reads a partial file
+#
+    def flush(self):
+        if self.promFile == None:
+            return
+        
+        self.promValues['pyftp_last_run_timestamp_seconds'] = round(time.time(), 3)
+        familyLines = {}
+        for sampleName, sampleValue in self.promValues.items():
+            familyName = sampleName.split('{', 1)[0]
+            if familyName not in self.metricFamilies.keys():
+                familyName = re.sub('_(bucket|sum|count)$', '', familyName)
+            
+            if familyName not in self.metricFamilies.keys():
+                continue
+            
+            if float(sampleValue).is_integer():
+                sampleValue = int(sampleValue)
+            
+            familyLines.setdefault(familyName, []).append(f'{sampleName} {sampleValue}')
+        
+        promOutput = []
+        for familyName in familyLines.keys():
+            promOutput.append(f'# HELP {familyName} {self.metricFamilies[familyName]["help"]}')
+            promOutput.append(f'# TYPE {familyName} {self.metricFamilies[familyName]["type"]}')
+            promOutput += familyLines[familyName]
+        
+        promTemp = f'{self.promFile}.{os.getpid()}.tmp'
+        with open(promTemp, 'w') as promFile:
+            promFile.write('\n'.join(promOutput) + '\n')
+        os.replace(promTemp, self.promFile)
+#
+# Write the Prometheus metrics file and close the events file
+#
+    def close(self):
+        self.flush()
+        if self.eventOutput != None:
+            self.eventOutput.close()
+            self.eventOutput = None
+###############################################################################
+# Result of an ftpClient operation. code is the numeric reply code of the final response (0 if there was none),
+# bytes/elapsed/diskStall/networkStall/stalls are filled in for transfers and data holds listing lines.
+# stalls is the number of times the transfer stalled and was aborted (see ftpClient.setStallTimeout).
+# A plain class rather than a dataclass: the dataclasses module imports inspect, which is slow to load.
+#
+class ftpResult():
+    resultFields = ['success', 'code', 'response', 'bytes', 'elapsed', 'diskStall', 'networkStall', 'stalls', 'data']
+
+    def __init__(self, success = False, code = 0, response = '', bytes = 0, elapsed = 0.0, diskStall = 0.0, networkStall = 0.0,
+                 stalls = 0, data = None):
+        self.success = success
+        self.code = code
+        self.response = response
+        self.bytes = bytes
+        self.elapsed = elapsed
+        self.diskStall = diskStall
+        self.networkStall = networkStall
+        self.stalls = stalls
+        self.data = data if data != None else []
+
+    def __repr__(self):
+        return f'ftpResult({", ".join(f"{fieldName}={getattr(self, fieldName)!r}" for fieldName in self.resultFields)})'
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return all(getattr(self, fieldName) == getattr(other, fieldName) for fieldName in self.resultFields)
+###############################################################################
+# FTP client for use as a library. Never prompts and never prints, every operation returns an ftpResult.
+# ftpProcess (the interactive shell) is built on top of it.
+#
+#   ftpSession = ftpClient()
+#   ftpSession.open('ftp.example.com')
+#   ftpSession.login('username', 'password')
+#   transferResult = ftpSession.get('remote.bin', '/tmp/local.bin')
+#
+class ftpClient():
+    def __init__(self, secure = False, bufferPool = None):
+        self.secure = secure
+        self.passive = True
+        self.debugLevel = 0
+        self.connectTimeout = 15
+        self.stallTimeout = 0
+        self.stallRetries = 3
+        self.tuningProfile = ''
+        self.linkSpeed = 1000
+        self.rateLimit = 0
+        self.rateWeight = 1
+        self.bufferPool = bufferPool or ftpBufferPool()
+
+        self.ftpConn = None
+        self.loginHost = ''
+        self.loginPort = 0
+        self.loginUser = ''
+        self.loginPassword = ''
+        self.loginAccount = ''
+        self.remoteDir = ''
+
+        self.lastResult = None
+        self.transferHooks = []
+        self.pipelineRefused = set()
+#
+# Build result of an operation. The last result is kept, e.g. for the response code of a shell command
+#
+    def result(self, success, response, startTime, transferStatus = None):
+        cmdResult = ftpResult(success, getResponseCode(response), response)
+        cmdResult.elapsed = time.perf_counter() - startTime
+        if transferStatus != None:
+            cmdResult.bytes = transferStatus['bytes']
+            cmdResult.diskStall = transferStatus.get('diskstall', 0.0)
+            cmdResult.networkStall = transferStatus.get('networkstall', 0.0)
+            cmdResult.stalls = transferStatus.get('stalls', 0)
+        
+        self.lastResult = cmdResult
+        return cmdResult
+#
+# Call the functions in transferHooks at the end of a transfer: hookFunc(operation, remoteFile, cmdResult,
+# loginHost) where operation is 'get' or 'put'. Sessions used in parallel (e.g. fanout) call them from their threads
+#
+    def transferDone(self, operation, remoteFile, cmdResult):
+        for hookFunc in self.transferHooks:
+            hookFunc(operation, remoteFile, cmdResult, self.loginHost)
+        
+        return cmdResult
+#
+# Connect to remote host. Secure connections also send AUTH TLS
+#
+    def open(self, host, port = 0):
+        startTime = time.perf_counter()
+        if self.secure == True:
+            ftpConn = ftpConnectionTLS()
+        else:
+            ftpConn = ftpConnection()
+        
+        ftpConn.connectTimeout = self.connectTimeout
+        ftpConn.tuningProfile = self.tuningProfile
+        ftpConn.linkSpeed = self.linkSpeed
+        ftpConn.set_debuglevel(self.debugLevel)
+        ftpConn.set_pasv(self.passive)
+        try:
+            ftpResponse = ftpConn.connect(host, port, self.stallTimeout or None)
+            if self.secure == True:
+                ftpConn.auth()
+        except ftplib.all_errors as err:
+            ftpConn.close()
+            return self.result(False, str(err), startTime)
+        
+        self.ftpConn = ftpConn
+        self.loginHost = host
+        self.loginPort = port
+        return self.result(True, ftpResponse, startTime)
+#
+# Login with USER, followed by PASS and ACCT as requested by remote server. challengeFunc(command, response, value)
+# is called before PASS/ACCT are sent and returns the value to send (used by the shell to prompt).
+# Secure connections protect the data channel after login unless protectData is False.
+#
+    def login(self, user, password = '', account = '', challengeFunc = None, protectData = None):
+        startTime = time.perf_counter()
+        cmdResult = self.sendcmd(f'USER {user}')
+        while cmdResult.code in range(300, 400):
+            if cmdResult.code == 331:
+                command, value = 'PASS', password
+            elif cmdResult.code == 332:
+                command, value = 'ACCT', account
+            else:
+                cmdResult.success = False
+                break
+            
+            if challengeFunc != None:
+                value = challengeFunc(command, cmdResult.response, value)
+            
+            # Kept so that more sessions can be opened with clone()
+            if command == 'PASS':
+                password = value
+            else:
+                account = value
+            
+            cmdResult = self.sendcmd(f'{command} {value}')
+        
+        if cmdResult.success == True and cmdResult.code not in [230, 232]:
+            cmdResult.success = False
+        
+        if cmdResult.success == True:
+            self.loginUser = user
+            self.loginPassword = password
+            self.loginAccount = account
+            self.remoteDir = ''
+            
+            if protectData == None:
+                protectData = self.secure
+            
+            if protectData == True:
+                self.protect(True)
+            
+            if self.tuningProfile == 'auto':
+                self.ftpConn.measureRoundTrip()
+        
+        cmdResult.elapsed = time.perf_counter() - startTime
+        return cmdResult
+#
+# Set data channel protection (PBSZ/PROT P or PROT C) on secure connections
+#
+    def protect(self, dataSecure = True):
+        startTime = time.perf_counter()
+        if self.secure == False:
+            return self.result(False, 'Secure FTP not available.', startTime)
+        
+        try:
+            if dataSecure == True:
+                ftpResponse = self.ftpConn.prot_p()
+            else:
+                ftpResponse = self.ftpConn.prot_c()
+        except ftplib.all_errors as err:
+            return self.result(False, str(err), startTime)
+        
+        return self.result(True, ftpResponse, startTime)
+#
+# Change data connection mode
+#
+    def setPassive(self, passive = True):
+        self.passive = passive
+        if self.ftpConn != None:
+            self.ftpConn.set_pasv(passive)
+#
+# Change socket tuning profile (see tuningProfiles, '' for none) and link speed in Mbit/s used by 'auto'.
+# Applies to data connections opened from now on.
+#
+    def setTuning(self, tuningProfile = '', linkSpeed = None):
+        self.tuningProfile = tuningProfile
+        if linkSpeed != None:
+            self.linkSpeed = linkSpeed
+        
+        if self.ftpConn != None:
+            self.ftpConn.tuningProfile = self.tuningProfile
+            self.ftpConn.linkSpeed = self.linkSpeed
+            self.ftpConn.tuneSocket(self.ftpConn.sock, False)
+            if self.tuningProfile == 'auto' and self.ftpConn.roundTrip == None:
+                self.ftpConn.measureRoundTrip()
+#
+# Change stall timeout: seconds without progress on the control or data connection before a transfer is taken as
+# stalled (0 waits forever), and the number of times a stalled get/put is tried again. A stalled transfer is
+# aborted (ABOR), then a download is resumed from the data received (REST) and an upload is sent again.
+#
+    def setStallTimeout(self, stallTimeout = 0, stallRetries = None):
+        self.stallTimeout = stallTimeout
+        if stallRetries != None:
+            self.stallRetries = stallRetries
+        
+        if self.ftpConn != None:
+            self.ftpConn.timeout = self.stallTimeout or None
+            self.ftpConn.sock.settimeout(self.ftpConn.timeout)
+#
+# Change bandwidth limit of each transfer of this session in bytes per second (0 is no limit) and the weight of
+# its transfers when sharing the global limit (see bandwidthLimit) with transfers of other sessions.
+# Applies to transfers started from now on.
+#
+    def setRateLimit(self, rateLimit = 0, rateWeight = None):
+        self.rateLimit = rateLimit
+        if rateWeight != None:
+            self.rateWeight = rateWeight
+#
+# Get the session usable again after a transfer stalled. ABOR is sent and its replies read. When remote server
+# doesn't answer in time, the control connection can't be used anymore and the session is opened again.
+#
+    def recoverStall(self):
+        startTime = time.perf_counter()
+        try:
+            ftpResponse = self.ftpConn.abort()
+            # 426 for the aborted transfer is followed by the reply to ABOR
+            if ftpResponse[:3] == '426':
+                ftpResponse = self.ftpConn.getresp()
+        except ftplib.all_errors:
+            return self.reopen()
+        
+        return self.result(True, ftpResponse, startTime)
+#
+# Open the session again with the same login, e.g. after the connection was lost. The remote working directory
+# and data channel protection are restored. If it can't be opened, commands fail until the session is closed.
+#
+    def reopen(self):
+        startTime = time.perf_counter()
+        remoteDir = self.remoteDir
+        protectData = getattr(self.ftpConn, '_prot_p', False)
+        loginUser, loginPassword, loginAccount = self.loginUser, self.loginPassword, self.loginAccount
+        lostConn = self.ftpConn
+        lostConn.sock.close()
+
+        cmdResult = self.open(self.loginHost, self.loginPort)
+        if cmdResult.success == True:
+            lostConn.close()
+            cmdResult = self.login(loginUser, loginPassword, loginAccount, protectData = protectData)
+        if cmdResult.success == True and len(remoteDir) > 0:
+            cmdResult = self.sendcmd(f'CWD {remoteDir}')
+        
+        return self.result(cmdResult.success, cmdResult.response, startTime)
+#
+# Check the session with NOOP and open it again when it doesn't answer, e.g. closed by remote server after being
+# idle. Success is False when the session can't be used
+#
+    def keepalive(self):
+        cmdResult = self.sendcmd('NOOP')
+        if cmdResult.success == True:
+            return cmdResult
+        
+        return self.reopen()
+#
+# Change ftplib debug level
+#
+    def setDebug(self, debugLevel = 0):
+        self.debugLevel = debugLevel
+        if self.ftpConn != None:
+            self.ftpConn.set_debuglevel(debugLevel)
+#
+# Send any command to remote server
+#
+    def sendcmd(self, command):
+        startTime = time.perf_counter()
+        try:
+            ftpResponse = self.ftpConn.sendcmd(command)
+        except ftplib.all_errors as err:
+            return self.result(False, str(err), startTime)
+        
+        # Keep remoteDir up to date without asking PWD, it is needed to open the session again (reopen). Until PWD
+        # was asked, it is relative to the login directory
+        commandVerb = command.split(' ', 1)[0].upper()
+        commandPath = command[len(commandVerb):].strip()
+        if commandVerb in ['CDUP', 'XCUP']:
+            commandPath = '..'
+        if commandVerb in ['CWD', 'XCWD', 'CDUP', 'XCUP']:
+            self.remoteDir = self.ftpConn.knownDir() or posixpath.normpath(posixpath.join(self.remoteDir, commandPath))
+        
+        return self.result(True, ftpResponse, startTime)
+#
+# Send several commands, results in the order of commandList. With pipelined, the commands which can be
+# pipelined (see pipelineReplies) are sent batchSize at a time without waiting for each reply, unless remote
+# server was found not to allow it (pipelineRefused, for this run until cleared by resetPipeline). When replies
+# come out of sequence, the commands of the batch not answered yet and those after it are sent one at a time.
+# When the replies can't be brought in sequence again, the session is opened again (reopen) and the commands
+# left are sent on it, or fail when it can't be opened.
+#
+    def sendBatch(self, commandList, pipelined = False, batchSize = 50):
+        cmdResults = []
+        while len(cmdResults) < len(commandList):
+            batchCommands = []
+            if pipelined == True and self.ftpConn != None and self.ftpConn.hostKey() not in self.pipelineRefused:
+                for command in commandList[len(cmdResults):len(cmdResults) + max(1, batchSize)]:
+                    if command.split(' ', 1)[0].upper() not in pipelineReplies.keys():
+                        break
+                    batchCommands.append(command)
+            
+            if len(batchCommands) < 2:
+                cmdResults.append(self.sendcmd(commandList[len(cmdResults)]))
+                continue
+            
+            startTime = time.perf_counter()
+            ftpReplies, inSequence = self.ftpConn.pipelinecmd(batchCommands)
+            for ftpReply in ftpReplies:
+                cmdResults.append(self.result(getResponseCode(ftpReply) in range(200, 400), ftpReply, startTime))
+            
+            if len(ftpReplies) < len(batchCommands) or inSequence == False:
+                self.pipelineRefused.add(self.ftpConn.hostKey())
+            
+            # Replies of the batch may still come, no command can be sent on this connection anymore
+            if inSequence == False:
+                cmdResult = self.reopen()
+                if cmdResult.success == False:
+                    cmdResults += [self.result(False, cmdResult.response, startTime) for command in commandList[len(cmdResults):]]
+                    break
+        
+        return cmdResults
+#
+# Allow pipelined commands again to the hosts where replies came out of sequence
+#
+    def resetPipeline(self):
+        self.pipelineRefused = set()
+#
+# Download remote file. localFile is a path, or an open file (unbuffered for binary) such as stdout.
+# A local file created by this call is removed when the transfer fails, otherwise its path is returned in data.
+# When the transfer stalls (see setStallTimeout), it is aborted and resumed from the data received, or for ascii
+# started again. Not for streams, which can't be positioned back.
+# The transfer rate is limited by setRateLimit and bandwidthLimit.
+#
+    def get(self, remoteFile, localFile, appendFile = False, binary = True, bufferDepth = 0, restOffset = None):
+        startTime = time.perf_counter()
+        fileUsageMode = 'w'
+        if appendFile == True:
+            fileUsageMode = 'a'
+        
+        # Binary downloads are written through an unbuffered file, the receive path does its own buffering
+        fileBuffering = -1
+        if binary == True:
+            fileUsageMode += 'b'
+            fileBuffering = 0
+        
+        file2write = None
+        cmdResult = None
+        stallCount = 0
+        rateBucket = bandwidthLimit.start(self.rateLimit, self.rateWeight)
+        try:
+            if isinstance(localFile, str):
+                file2write = open(localFile, fileUsageMode, buffering = fileBuffering)
+            
+            fileOutput = file2write or localFile
+            fileStart = None
+            if fileOutput.seekable() == True:
+                fileStart = fileOutput.tell()
+            
+            while True:
+                try:
+                    if binary == True:
+                        resumeOffset = restOffset
+                        if stallCount > 0:
+                            resumeOffset = ((restOffset or 0) + fileOutput.tell() - fileStart) or None
+                        transferStatus = recvBinaryFile(self.ftpConn, remoteFile, fileOutput, self.bufferPool, resumeOffset, bufferDepth,
+                                                        rateBucket = rateBucket)
+                        if stallCount > 0:
+                            transferStatus['bytes'] = fileOutput.tell() - fileStart
+                    else:
+                        transferStatus = {'response': '', 'bytes': 0}
+                        def writeLine(fileLine):
+                            if rateBucket != None:
+                                rateBucket.throttle(len(fileLine) + 2)
+                            transferStatus['bytes'] += fileOutput.write(fileLine + '\n')
+                        transferStatus['response'] = self.ftpConn.retrlines(f'RETR {remoteFile}', writeLine)
+                    break
+                except TimeoutError:
+                    stallCount += 1
+                    if self.recoverStall().success == False or stallCount > self.stallRetries or fileStart == None:
+                        raise
+                    
+                    if binary == False:
+                        fileOutput.seek(fileStart)
+                        fileOutput.truncate()
+            
+            transferStatus['stalls'] = stallCount
+        except TimeoutError:
+            cmdResult = self.result(False, f'Transfer of {remoteFile} stalled, no progress in {self.stallTimeout} seconds.', startTime)
+            cmdResult.stalls = stallCount
+        except ftplib.all_errors as err:
+            cmdResult = self.result(False, str(err), startTime)
+            cmdResult.stalls = stallCount
+        else:
+            cmdResult = self.result(True, transferStatus['response'], startTime, transferStatus)
+            if file2write != None:
+                cmdResult.data = [localFile]
+        finally:
+            bandwidthLimit.end(rateBucket)
+            if file2write != None:
+                file2write.close()
+                if cmdResult == None or cmdResult.success == False:
+                    os.remove(localFile)
+        
+        return self.transferDone('get', remoteFile, cmdResult)
+#
+# Fetch the data added to a growing remote file since the previous call, appending it to localFile (binary).
+# The offset reached is kept per host, remote file and local file in ~/.pyftp/follow.json (see followCache).
+# The last followOverlap bytes already fetched are fetched again: if they changed, or the remote file is now
+# smaller than the offset, the file was truncated or replaced and is fetched again from the start.
+# Returns data [offset, restarted], response is empty when there was no new data.
+#
+    followOverlap = 64
+
+    def follow(self, remoteFile, localFile, bufferDepth = 0):
+        startTime = time.perf_counter()
+        localFile = os.path.abspath(localFile)
+        remotePath = remoteFile
+        if remoteFile.startswith('/') == False and self.pwd().success == True:
+            remotePath = posixpath.join(self.remoteDir, remoteFile)
+        
+        followKey = f'{self.loginHost}:{self.loginPort}'
+        followInfo = followCache.get(followKey, remotePath, {})
+        fileOffset = 0
+        if followInfo.get('local') == localFile and os.path.isfile(localFile):
+            if os.path.getsize(localFile) >= followInfo.get('offset', 0):
+                fileOffset = followInfo.get('offset', 0)
+        
+        transferStatus = {'response': '', 'bytes': 0}
+        restarted = False
+        rateBucket = bandwidthLimit.start(self.rateLimit, self.rateWeight)
+        try:
+            self.ftpConn.voidcmd('TYPE I')
+            remoteSize = self.ftpConn.size(remoteFile)
+            if remoteSize == None:
+                return self.result(False, f'{remoteFile}: SIZE not available', startTime)
+            
+            if remoteSize < fileOffset:
+                fileOffset = 0
+                restarted = True
+            
+            fileUsageMode = 'w+b'
+            if os.path.isfile(localFile):
+                fileUsageMode = 'r+b'
+            
+            with open(localFile, fileUsageMode, buffering = 0) as file2write:
+                while remoteSize > fileOffset:
+                    overlapSize = min(fileOffset, self.followOverlap)
+                    file2write.seek(fileOffset - overlapSize)
+                    localOverlap = file2write.read(overlapSize)
+                    file2write.seek(fileOffset - overlapSize)
+                    transferStatus = recvBinaryFile(self.ftpConn, remoteFile, file2write, self.bufferPool,
+                                                    (fileOffset - overlapSize) or None, bufferDepth, remoteSize, rateBucket)
+                    fileEnd = file2write.tell()
+                    file2write.seek(fileOffset - overlapSize)
+                    if file2write.read(overlapSize) == localOverlap:
+                        fileOffset = fileEnd
+                        break
+                    
+                    fileOffset = 0
+                    restarted = True
+                
+                file2write.truncate(fileOffset)
+        except TimeoutError:
+            self.recoverStall()
+            return self.transferDone('get', remoteFile, self.result(False, f'Transfer of {remoteFile} stalled, no progress in {self.stallTimeout} seconds.', startTime))
+        except ftplib.all_errors as err:
+            return self.transferDone('get', remoteFile, self.result(False, str(err), startTime))
+        finally:
+            bandwidthLimit.end(rateBucket)
+        
+        followCache.set(followKey, remotePath, {'local': localFile, 'offset': fileOffset})
+        cmdResult = self.result(True, transferStatus['response'], startTime, transferStatus)
+        cmdResult.data = [fileOffset, restarted]
+        if transferStatus['bytes'] > 0:
+            self.transferDone('get', remoteFile, cmdResult)
+        return cmdResult
+#
+# Upload local file. localFile is a path, an open binary file such as stdin, or data in memory (bytes, memoryview,
+# mmap) which is sent directly from memory.
+# When the transfer stalls (see setStallTimeout), it is aborted and STOR is sent again from the start of the file.
+# Not for APPE and streams. The transfer rate is limited as for get.
+#
+    def put(self, localFile, remoteFile, appendFile = False, binary = True, bufferDepth = 0):
+        import io
+        import mmap
+
+        startTime = time.perf_counter()
+        fileSendCommand = 'STOR'
+        if appendFile == True:
+            fileSendCommand = 'APPE'
+        
+        if isinstance(localFile, str) and not os.path.isfile(localFile):
+            return self.transferDone('put', remoteFile, self.result(False, f'{localFile}: File not found', startTime))
+        
+        file2send = None
+        stallCount = 0
+        rateBucket = bandwidthLimit.start(self.rateLimit, self.rateWeight)
+        def countLine(fileLine):
+            if rateBucket != None:
+                rateBucket.throttle(len(fileLine))
+            transferStatus['bytes'] += len(fileLine)
+        
+        try:
+            if isinstance(localFile, str):
+                file2send = open(localFile, 'rb')
+            
+            fileInput = file2send or localFile
+            dataInMemory = isinstance(fileInput, (bytes, bytearray, memoryview, mmap.mmap))
+            fileStart = None
+            if dataInMemory == True:
+                fileStart = 0
+            elif fileInput.seekable() == True:
+                fileStart = fileInput.tell()
+            
+            while True:
+                try:
+                    if dataInMemory == True:
+                        if binary == False:
+                            dataInput = io.BytesIO(fileInput)
+                            transferStatus = {'response': '', 'bytes': 0}
+                            transferStatus['response'] = self.ftpConn.storlines(f'{fileSendCommand} {remoteFile}', dataInput, countLine)
+                            transferStatus['bytes'] = dataInput.tell()
+                        else:
+                            transferStatus = sendBinaryData(self.ftpConn, f'{fileSendCommand} {remoteFile}', fileInput, self.bufferPool.bufferSize,
+                                                            rateBucket)
+                    elif binary == True:
+                        transferStatus = sendBinaryFile(self.ftpConn, f'{fileSendCommand} {remoteFile}', fileInput, self.bufferPool, bufferDepth,
+                                                        rateBucket = rateBucket)
+                    else:
+                        transferStatus = {'response': '', 'bytes': 0}
+                        transferStatus['response'] = self.ftpConn.storlines(f'{fileSendCommand} {remoteFile}', fileInput, countLine)
+                    break
+                except TimeoutError:
+                    stallCount += 1
+                    if self.recoverStall().success == False or stallCount > self.stallRetries or fileStart == None or appendFile == True:
+                        raise
+                    
+                    if dataInMemory == False:
+                        fileInput.seek(fileStart)
+            
+            transferStatus['stalls'] = stallCount
+        except TimeoutError:
+            cmdResult = self.result(False, f'Transfer of {remoteFile} stalled, no progress in {self.stallTimeout} seconds.', startTime)
+            cmdResult.stalls = stallCount
+        except ftplib.all_errors as err:
+            cmdResult = self.result(False, str(err), startTime)
+            cmdResult.stalls = stallCount
+        else:
+            cmdResult = self.result(True, transferStatus['response'], startTime, transferStatus)
+        finally:
+            bandwidthLimit.end(rateBucket)
+            if file2send != None:
+                file2send.close()
+        
+        return self.transferDone('put', remoteFile, cmdResult)
+#
+# List remote directory, names only (NLST) or long format (LIST). Lines are returned in data
+#
+    def list(self, remoteDir = '', longFormat = False):
+        startTime = time.perf_counter()
+        sendRemoteCmd = 'NLST'
+        if longFormat == True:
+            sendRemoteCmd = 'LIST'
+        
+        cmdResult = ftpResult()
+        try:
+            ftpResponse = self.ftpConn.retrlines(f'{sendRemoteCmd} {remoteDir}'.strip(), cmdResult.data.append)
+        except ftplib.all_errors as err:
+            cmdResult.response = str(err)
+        else:
+            cmdResult.success = True
+            cmdResult.response = ftpResponse
+        
+        cmdResult.code = getResponseCode(cmdResult.response)
+        cmdResult.elapsed = time.perf_counter() - startTime
+        self.lastResult = cmdResult
+        return cmdResult
+#
+# Get remote working directory. Directory name is returned in data and kept in remoteDir
+#
+    def pwd(self):
+        cmdResult = self.sendcmd('PWD')
+        if cmdResult.success == True and cmdResult.code != 257:
+            # parse257 only takes a 257 reply with the directory quoted
+            cmdResult.success = False
+        elif cmdResult.success == True:
+            self.remoteDir = ftplib.parse257(cmdResult.response)
+            cmdResult.data.append(self.remoteDir)
+        
+        return cmdResult
+#
+# Delete remote file
+#
+    def delete(self, remoteFile):
+        return self.sendcmd(f'DELE {remoteFile}')
+#
+# Remove empty remote directory
+#
+    def rmdir(self, remoteDir):
+        return self.sendcmd(f'RMD {remoteDir}')
+#
+# Rename remote file. Sends RNFR followed by RNTO
+#
+    def rename(self, oldName, newName):
+        startTime = time.perf_counter()
+        cmdResult = self.sendcmd(f'RNFR {oldName}')
+        if cmdResult.code == 350:
+            cmdResult = self.sendcmd(f'RNTO {newName}')
+        elif cmdResult.success == True:
+            cmdResult.success = False
+        
+        cmdResult.elapsed = time.perf_counter() - startTime
+        return cmdResult
+#
+# Disconnect from remote host. Sends QUIT, closing the connection anyway if that fails
+#
+    def close(self):
+        startTime = time.perf_counter()
+        cmdResult = self.result(True, '', startTime)
+        if self.ftpConn == None:
+            return cmdResult
+        
+        try:
+            cmdResult = self.result(True, self.ftpConn.quit(), startTime)
+        except ftplib.all_errors:
+            self.ftpConn.close()
+        finally:
+            self.ftpConn = None
+            self.loginHost = ''
+            self.loginPort = 0
+            self.loginUser = ''
+            self.loginPassword = ''
+            self.loginAccount = ''
+        
+        return cmdResult
+#
+# Open another session to the same host with the same login and settings, e.g. for parallel work.
+# Returns data [ftpClient] when successful
+#
+    def clone(self):
+        startTime = time.perf_counter()
+        if self.ftpConn == None:
+            return self.result(False, 'Not connected.', startTime)
+        
+        ftpSession = ftpClient(self.secure, self.bufferPool)
+        ftpSession.passive = self.passive
+        ftpSession.connectTimeout = self.connectTimeout
+        ftpSession.stallTimeout = self.stallTimeout
+        ftpSession.stallRetries = self.stallRetries
+        ftpSession.tuningProfile = self.tuningProfile
+        ftpSession.linkSpeed = self.linkSpeed
+        ftpSession.setRateLimit(self.rateLimit, self.rateWeight)
+        cmdResult = ftpSession.open(self.loginHost, self.loginPort)
+        if cmdResult.success == True:
+            cmdResult = ftpSession.login(self.loginUser, self.loginPassword, self.loginAccount)
+        
+        if cmdResult.success == False:
+            ftpSession.close()
+            return self.result(False, cmdResult.response, startTime)
+        
+        cmdResult = self.result(True, cmdResult.response, startTime)
+        cmdResult.data = [ftpSession]
+        return cmdResult
+#
+# Entries of a remote directory, data is a list of (name, facts). Uses MLSD, or LIST when remote server has no
+# MLSD, i.e. FEAT doesn't list MLST or MLSD is answered 500/502 (remembered per host in hostCache). facts has 'type' ('dir', 'file' or other) and, when known, 'size' and
+# 'modify' (YYYYMMDDHHMMSS). '.' and '..' are left out.
+#
+    def entries(self, remoteDir = ''):
+        startTime = time.perf_counter()
+        cmdResult = self.result(True, '', startTime)
+        try:
+            hostKey = self.ftpConn.hostKey()
+            if hostCache.get(hostKey, 'listmode') != 'LIST' and self.ftpConn.hasFeature('MLST') == False:
+                self.ftpConn.roundTripsSaved += 1
+                hostCache.set(hostKey, 'listmode', 'LIST')
+            
+            if hostCache.get(hostKey, 'listmode') != 'LIST':
+                try:
+                    for entryName, entryFacts in self.ftpConn.mlsd(remoteDir):
+                        entryFacts = mlsxFacts(entryFacts)
+                        if entryFacts['type'] in ['cdir', 'pdir'] or entryName in ['.', '..']:
+                            continue
+                        cmdResult.data.append((entryName, entryFacts))
+                except ftplib.error_perm as err:
+                    # Only "not implemented" means no MLSD. 501/550 are about the directory (e.g. pyftpdlib answers
+                    # 501 for a missing directory) and fail the listing, host keeps MLSD
+                    if getResponseCode(str(err)) not in [500, 502]:
+                        raise
+                    
+                    hostCache.set(hostKey, 'listmode', 'LIST')
+                    cmdResult.data = []
+                else:
+                    hostCache.set(hostKey, 'listmode', 'MLSD')
+                    cmdResult.elapsed = time.perf_counter() - startTime
+                    return cmdResult
+            
+            listLines = []
+            self.ftpConn.retrlines(f'LIST {remoteDir}'.strip(), listLines.append)
+            for listLine in listLines:
+                dirEntry = parseListLine(listLine)
+                if dirEntry != None and dirEntry[0] not in ['.', '..']:
+                    cmdResult.data.append(dirEntry)
+        except ftplib.all_errors as err:
+            return self.result(False, str(err), startTime)
+        
+        cmdResult.elapsed = time.perf_counter() - startTime
+        return cmdResult
+#
+# Facts of one remote file or directory with MLST, data is [facts] as for entries
+#
+    def mlst(self, remotePath):
+        if self.ftpConn.hasFeature('MLST') == False:
+            self.ftpConn.roundTripsSaved += 1
+            return self.result(False, '502 MLST not supported (FEAT).', time.perf_counter())
+        
+        cmdResult = self.sendcmd(f'MLST {remotePath}')
+        if cmdResult.success == True:
+            for responseLine in cmdResult.response.splitlines()[1:-1]:
+                entryFacts = {}
+                for factItem in responseLine.strip().split(' ', 1)[0].split(';'):
+                    if '=' in factItem:
+                        factName, factValue = factItem.split('=', 1)
+                        entryFacts[factName] = factValue
+                cmdResult.data.append(mlsxFacts(entryFacts))
+            
+            if len(cmdResult.data) == 0:
+                cmdResult.success = False
+        
+        return cmdResult
+###############################################################################
+# Recursive walk of a remote directory tree, with directories listed in parallel over a list of ftpClient
+# sessions (one thread per session). Subdirectories are queued for the next free session; when queueSize are
+# queued, the session walks the subdirectory itself. The queue is not bounded, so that directories put back when
+# a session is lost never wait. maxDepth limits the depth walked (-1 for no limit, 0 lists only the starting
+# directory).
+# entryFunc(remoteDir, entryName, entryFacts, depth) is called for every entry and dirFunc(remoteDir, entryList,
+# depth) once for every directory listed, one call at a time. Either can be None.
+# With concurrency (ftpConcurrency), the number of sessions used adapts to the rate directories are listed.
+# A session lost during the walk is opened again. When that fails, its worker stops and the directory is listed by
+# the others.
+#
+#   treeWalker = ftpTreeWalker(sessionList, printEntry)
+#   walkResult = treeWalker.walk('/pub')
+#
+class ftpTreeWalker():
+    def __init__(self, sessionList, entryFunc, maxDepth = -1, queueSize = 10000, dirFunc = None, concurrency = None):
+        self.sessionList = sessionList
+        self.entryFunc = entryFunc
+        self.dirFunc = dirFunc
+        self.concurrency = concurrency
+        self.maxDepth = maxDepth
+        self.queueSize = queueSize
+        self.entryLock = threading.Lock()
+        self.dirQueue = None
+        self.walkStop = False
+        self.dirCount = 0
+        self.walkErrors = []
+        self.walkWorkers = 0
+#
+# Walk the tree below remoteDir, or below each directory of a list. Returns ftpResult, success is False when some
+# directories could not be listed (their errors in data) or the walk was interrupted
+#
+    def walk(self, remoteDir):
+        startTime = time.perf_counter()
+        self.dirQueue = queue.Queue()
+        self.walkStop = False
+        self.dirCount = 0
+        self.walkErrors = []
+        self.walkWorkers = len(self.sessionList)
+
+        if self.concurrency != None:
+            self.concurrency.start()
+        
+        walkThreads = []
+        for sessionIndex in range(len(self.sessionList)):
+            walkThread = threading.Thread(target = self.walkWorker, args = (sessionIndex,), daemon = True)
+            walkThread.start()
+            walkThreads.append(walkThread)
+        
+        try:
+            if isinstance(remoteDir, str):
+                remoteDir = [remoteDir]
+            for startDir in remoteDir:
+                self.dirQueue.put((startDir, 0))
+            self.dirQueue.join()
+        except KeyboardInterrupt:
+            self.walkStop = True
+            self.walkErrors.append('Interrupted.')
+            self.dirQueue.join()
+        finally:
+            # Workers waiting for a session stop, the others when they get None
+            if self.concurrency != None:
+                self.concurrency.stop()
+            for walkThread in walkThreads:
+                self.dirQueue.put(None)
+            for walkThread in walkThreads:
+                walkThread.join()
+        
+        walkResult = ftpResult(len(self.walkErrors) == 0, 0, f'{self.dirCount} directories listed.')
+        walkResult.elapsed = time.perf_counter() - startTime
+        walkResult.data = self.walkErrors
+        return walkResult
+
+    def walkWorker(self, sessionIndex):
+        while True:
+            if self.concurrency != None and self.concurrency.admit(sessionIndex) == None:
+                break
+            
+            dirItem = self.dirQueue.get()
+            if dirItem == None:
+                break
+            
+            try:
+                # Session lost: with concurrency, admit opens a new one
+                if self.walkStop == False and self.walkDir(sessionIndex, dirItem[0], dirItem[1]) == False:
+                    if self.concurrency == None:
+                        break
+            finally:
+                self.dirQueue.task_done()
+#
+# List remoteDir with the session of worker sessionIndex. Returns False when the session was lost and the directory
+# put back for the other workers
+#
+    def walkDir(self, sessionIndex, remoteDir, depth):
+        ftpSession = self.sessionList[sessionIndex]
+        cmdResult = ftpSession.entries(remoteDir)
+        # No reply code, or 421: the connection may be gone, e.g. closed by remote server
+        if cmdResult.success == False and cmdResult.code in [0, 421]:
+            if ftpSession.keepalive().success == True:
+                cmdResult = ftpSession.entries(remoteDir)
+            elif self.sessionLost(sessionIndex) == True:
+                self.dirQueue.put((remoteDir, depth))
+                return False
+        
+        if self.concurrency != None:
+            self.concurrency.done(cmdResult)
+        
+        subDirs = []
+        with self.entryLock:
+            self.dirCount += 1
+            if cmdResult.success == False:
+                self.walkErrors.append(f'{remoteDir}: {cmdResult.response}')
+                return
+            
+            if self.dirFunc != None:
+                self.dirFunc(remoteDir, cmdResult.data, depth)
+            
+            for entryName, entryFacts in cmdResult.data:
+                if self.entryFunc != None:
+                    self.entryFunc(remoteDir, entryName, entryFacts, depth)
+                if entryFacts['type'] == 'dir':
+                    subDirs.append(posixpath.join(remoteDir, entryName))
+        
+        if self.maxDepth >= 0 and depth >= self.maxDepth:
+            return
+        
+        for subIndex, subDir in enumerate(subDirs):
+            if self.walkStop == True:
+                return
+            
+            if self.dirQueue.qsize() < self.queueSize:
+                self.dirQueue.put((subDir, depth + 1))
+            else:
+                if self.walkDir(sessionIndex, subDir, depth + 1) == False:
+                    for lostDir in subDirs[subIndex + 1:]:
+                        self.dirQueue.put((lostDir, depth + 1))
+                    return False
+#
+# Session of worker sessionIndex could not be opened again. Returns True when its directories can be left to the
+# other workers: the worker stops, or with concurrency gets a new session. The last worker (the session of this
+# connection with concurrency) goes on and its directories fail
+#
+    def sessionLost(self, sessionIndex):
+        with self.entryLock:
+            if self.concurrency != None:
+                if sessionIndex == 0:
+                    return False
+                
+                self.sessionList[sessionIndex] = None
+                return True
+            
+            if self.walkWorkers <= 1:
+                return False
+            
+            self.walkWorkers -= 1
+            return True
+###############################################################################
+# Adaptive number of sessions to one host for ftpTreeWalker and runParallel. sessionList has an entry per session
+# that may be used, None for sessions not opened yet, which are opened with openFunc() when needed (returns an
+# ftpResult with data [ftpClient]). Worker threads ask admit(sessionIndex) for their session before each item
+# and wait while sessionIndex is at or above the limit.
+# Starts with the number of sessions remembered for the host (hostCache), or startSessions, and adds a session
+# every interval while throughput (bytes/s, or items/s when no data is transferred) improves by a tenth or more.
+# Once it no longer improves, the best number is kept, and a session is taken away when throughput falls by a
+# quarter. A 421/530 reply (too many connections/logins) takes a session away and caps the number for the run.
+# The best number is remembered for the host when stopped.
+#
+class ftpConcurrency():
+    def __init__(self, hostKey, sessionList, openFunc, startSessions = 2, interval = 1.0):
+        self.hostKey = hostKey
+        self.sessionList = sessionList
+        self.openFunc = openFunc
+        self.interval = interval
+        self.maxSessions = len(sessionList)
+        self.limit = min(self.maxSessions, max(1, hostCache.get(hostKey, 'sessions', startSessions)))
+        self.bestLimit = None
+        self.bestRate = 0.0
+        self.ramping = True
+        self.windowItems = 0
+        self.windowBytes = 0
+        self.windowStart = 0.0
+        self.windowSkip = True
+        self.limitChanged = threading.Condition()
+        self.monitorThread = None
+        self.monitorStop = None
+#
+# Start measuring throughput, before the worker threads are started
+#
+    def start(self):
+        self.windowItems = 0
+        self.windowBytes = 0
+        self.windowStart = time.perf_counter()
+        self.windowSkip = True
+        self.monitorStop = threading.Event()
+        self.monitorThread = threading.Thread(target = self.monitor, args = (self.monitorStop,), daemon = True)
+        self.monitorThread.start()
+#
+# Stop measuring and release waiting workers (admit returns None). Remembers the best number of sessions
+#
+    def stop(self):
+        with self.limitChanged:
+            self.monitorStop.set()
+            self.limitChanged.notify_all()
+        self.monitorThread.join()
+
+        if self.bestLimit != None:
+            hostCache.set(self.hostKey, 'sessions', min(self.bestLimit, self.maxSessions))
+
+    def monitor(self, monitorStop):
+        while monitorStop.wait(self.interval) == False:
+            self.adjust()
+#
+# Session for worker sessionIndex, opened when needed. Waits while sessionIndex is not below the limit.
+# Returns None when the worker should stop: measuring stopped, or the session could not be opened
+#
+    def admit(self, sessionIndex):
+        with self.limitChanged:
+            while sessionIndex >= self.limit and self.monitorStop.is_set() == False:
+                self.limitChanged.wait()
+            if self.monitorStop.is_set() == True:
+                return None
+        
+        if self.sessionList[sessionIndex] == None:
+            cmdResult = self.openFunc()
+            if cmdResult.success == False:
+                with self.limitChanged:
+                    self.maxSessions = min(self.maxSessions, max(1, sessionIndex))
+                    self.limit = min(self.limit, self.maxSessions)
+                    self.ramping = False
+                return None
+            
+            self.sessionList[sessionIndex] = cmdResult.data[0]
+        
+        return self.sessionList[sessionIndex]
+#
+# Item done by a worker, cmdResult is its ftpResult (or None)
+#
+    def done(self, cmdResult):
+        with self.limitChanged:
+            self.windowItems += 1
+            if isinstance(cmdResult, ftpResult):
+                self.windowBytes += cmdResult.bytes
+                if cmdResult.code in [421, 530]:
+                    self.maxSessions = max(1, self.limit - 1)
+                    self.changeLimit(self.maxSessions)
+                    self.ramping = False
+
+    def adjust(self):
+        with self.limitChanged:
+            windowTime = time.perf_counter() - self.windowStart
+            windowRate = (self.windowBytes or self.windowItems) / max(windowTime, 0.000001)
+            self.windowItems = 0
+            self.windowBytes = 0
+            self.windowStart = time.perf_counter()
+            # The first interval after a change includes opening the sessions added
+            if self.windowSkip == True:
+                self.windowSkip = False
+                return
+            
+            if windowRate >= self.bestRate * 1.1:
+                self.bestRate = windowRate
+                self.bestLimit = self.limit
+                if self.ramping == True and self.limit < self.maxSessions:
+                    self.changeLimit(self.limit + 1)
+            elif windowRate < self.bestRate * 0.75 and self.limit > 1:
+                self.bestRate = windowRate
+                self.bestLimit = self.limit - 1
+                self.changeLimit(self.limit - 1)
+            elif self.ramping == True:
+                self.ramping = False
+                self.changeLimit(self.bestLimit)
+
+    def changeLimit(self, newLimit):
+        if newLimit != self.limit:
+            self.limit = newLimit
+            self.windowSkip = True
+            self.limitChanged.notify_all()
+###############################################################################
+# Run workFunc(ftpSession, workItem) for every item of workItems, in parallel with one thread per entry of
+# sessionList (an ftpClient, or whatever workFunc needs per thread). With concurrency (ftpConcurrency), the
+# number of sessions used adapts to throughput.
+# Returns the results in the order of workItems. When interrupted (Ctrl-C), items not started yet are skipped
+# and their result is None.
+#
+def runParallel(sessionList, workItems, workFunc, concurrency = None):
+    workResults = [None] * len(workItems)
+    workQueue = queue.Queue()
+    for itemIndex in range(len(workItems)):
+        workQueue.put(itemIndex)
+    
+    def workWorker(sessionIndex):
+        ftpSession = sessionList[sessionIndex]
+        while True:
+            if concurrency != None:
+                ftpSession = concurrency.admit(sessionIndex)
+                if ftpSession == None:
+                    return
+            
+            try:
+                itemIndex = workQueue.get_nowait()
+            except queue.Empty:
+                return
+            
+            try:
+                workResults[itemIndex] = workFunc(ftpSession, workItems[itemIndex])
+                if concurrency != None:
+                    concurrency.done(workResults[itemIndex])
+            finally:
+                workQueue.task_done()
+    
+    if concurrency != None:
+        concurrency.start()
+    
+    workThreads = []
+    for sessionIndex in range(min(len(sessionList), max(1, len(workItems)))):
+        workThread = threading.Thread(target = workWorker, args = (sessionIndex,), daemon = True)
+        workThread.start()
+        workThreads.append(workThread)
+    
+    try:
+        workQueue.join()
+    except KeyboardInterrupt:
+        while workQueue.empty() == False:
+            workQueue.get_nowait()
+            workQueue.task_done()
+        workQueue.join()
+    finally:
+        # Workers waiting for a session stop
+        if concurrency != None:
+            concurrency.stop()
+        for workThread in workThreads:
+            workThread.join()
+    
+    return workResults
+###############################################################################
+# ftplib connection with faster connection setup:
+#   - connect tries all addresses of the host concurrently (see connectHost), instead of one after the other
+#   - data connections use EPSV/EPRT when remote server supports them, otherwise PASV/PORT. The mode that works
+#     is cached per host (hostCache), so the fallback is only tried once.
+#   - commands which would not change the session state are not sent (see sendcmd)
+#
+class ftpConnection(ftplib.FTP):
+    connectTimeout = 15
+    tuningProfile = ''
+    linkSpeed = 1000
+    roundTrip = None
+    sessionState = {}
+    roundTripsSaved = 0
+    featuresAge = 86400
+
+    def connect(self, host = '', port = 0, timeout = -999, source_address = None):
+        if host != '':
+            self.host = host
+        if port > 0:
+            self.port = port
+        if timeout != -999:
+            self.timeout = timeout
+        if source_address != None:
+            self.source_address = source_address
+        
+        self.sock = connectHost(self.host, self.port, self.connectTimeout, self.source_address)
+        self.tuneSocket(self.sock, False)
+        if isinstance(self.timeout, (int, float)):
+            self.sock.settimeout(self.timeout)
+        else:
+            self.sock.settimeout(socket.getdefaulttimeout())
+        
+        self.af = self.sock.family
+        self.file = self.sock.makefile('r', encoding = self.encoding)
+        self.sessionState = {}
+        self.roundTripsSaved = 0
+        self.welcome = self.getresp()
+        return self.welcome
+#
+# Send command, keeping the session state known from the commands sent and their replies:
+#   TYPE, PBSZ, PROT    the value last set
+#   PWD                 the working directory, from 257 replies and from CWD/CDUP replies which give it
+# A command which would not change the state is not sent, the reply it got before is returned instead and
+# roundTripsSaved is counted. USER, REIN and AUTH start a new session, nothing is known after them.
+#
+    def sendcmd(self, cmd):
+        commandVerb, commandArg = (cmd.split(' ', 1) + [''])[:2]
+        commandVerb = commandVerb.upper()
+        if commandVerb == 'XPWD':
+            commandVerb = 'PWD'
+        
+        knownState = self.sessionState.get(commandVerb)
+        if knownState != None and (commandVerb == 'PWD' or knownState[0] == commandArg.strip().upper()):
+            self.roundTripsSaved += 1
+            return knownState[1]
+        
+        ftpResponse = super().sendcmd(cmd)
+        if commandVerb in ['USER', 'REIN', 'AUTH']:
+            self.sessionState = {}
+        elif commandVerb in ['TYPE', 'PBSZ', 'PROT']:
+            self.sessionState[commandVerb] = (commandArg.strip().upper(), ftpResponse)
+        elif commandVerb == 'PWD' and ftpResponse.startswith('257'):
+            self.sessionState['PWD'] = (ftplib.parse257(ftpResponse), ftpResponse)
+        elif commandVerb in ['CWD', 'XCWD', 'CDUP', 'XCUP']:
+            # Some servers give the new directory, e.g. 250 "/pub" is the current directory
+            self.sessionState.pop('PWD', None)
+            if ftpResponse[3:].strip().startswith('"'):
+                self.sessionState['PWD'] = (ftplib.parse257('257' + ftpResponse[3:]), '257' + ftpResponse[3:])
+        
+        return ftpResponse
+#
+# Same as ftplib, but through sendcmd so that the session state is kept
+#
+    def voidcmd(self, cmd):
+        ftpResponse = self.sendcmd(cmd)
+        if ftpResponse[:1] != '2':
+            raise ftplib.error_reply(ftpResponse)
+        return ftpResponse
+#
+# Remote working directory when known from the session state (see sendcmd), otherwise None
+#
+    def knownDir(self):
+        return self.sessionState.get('PWD', (None,))[0]
+#
+# Whether remote server has a feature (e.g. 'SIZE', 'MLST') as listed by FEAT. The answer to FEAT is kept in
+# hostCache with the time it was asked, and asked again after featuresAge seconds, in case the server changed.
+# Returns None when nothing is known: no FEAT (5xx, kept), or FEAT failed otherwise (e.g. 421, not kept)
+#
+    def hasFeature(self, featureName):
+        featureCache = hostCache.get(self.hostKey(), 'features')
+        if isinstance(featureCache, dict) == False or time.time() - featureCache.get('time', 0) > self.featuresAge:
+            try:
+                ftpResponse = self.sendcmd('FEAT')
+                featureList = [featureLine.strip().split(' ')[0].upper() for featureLine in ftpResponse.splitlines()[1:-1]]
+            except ftplib.error_perm:
+                featureList = False
+            except ftplib.all_errors:
+                return None
+            
+            featureCache = {'list': featureList, 'time': int(time.time())}
+            hostCache.set(self.hostKey(), 'features', featureCache)
+        
+        if featureCache['list'] == False:
+            return None
+        
+        return featureName.upper() in featureCache['list']
+#
+# Send commands without waiting for each reply, then read the replies in order. A reply must be one of the codes
+# expected for its command (pipelineReplies) or an error (4xx/5xx), and must come within replyTimeout seconds.
+# Otherwise the replies are out of sequence: the connection is brought in sequence again (see resyncreplies).
+# Data left after the last reply (a late or extra reply) is handled the same way, so the next reply read by
+# ftplib is the one to the next command.
+# Returns the replies in sequence, and False when the connection can't be used anymore (the caller has to close
+# it), otherwise True.
+# Replies are read from the socket directly, as a timeout would make ftplib's file object unusable.
+#
+    def pipelinecmd(self, commandList, replyTimeout = 10):
+        for command in commandList:
+            if self.debugging:
+                print('*cmd*', self.sanitize(command))
+        
+        sockTimeout = self.sock.gettimeout()
+        replyBuffer = [b'']
+        ftpReplies = []
+        try:
+            self.sock.sendall(''.join(f'{command}{ftplib.CRLF}' for command in commandList).encode(self.encoding))
+            self.sock.settimeout(replyTimeout)
+            for command in commandList:
+                try:
+                    ftpReply = self.readreply(replyBuffer)
+                except TimeoutError:
+                    ftpReply = ''
+                
+                replyCode = ftpReply[:3]
+                if replyCode not in pipelineReplies[command.split(' ', 1)[0].upper()] and replyCode[:1] not in ['4', '5']:
+                    break
+                
+                ftpReplies.append(ftpReply)
+            
+            if len(ftpReplies) < len(commandList) or len(replyBuffer[0]) > 0:
+                return ftpReplies, self.resyncreplies(replyBuffer, replyTimeout)
+        except (OSError, EOFError):
+            return ftpReplies, False
+        finally:
+            self.sock.settimeout(sockTimeout)
+        
+        return ftpReplies, True
+#
+# Bring replies in sequence again after pipelined commands: NOOP is sent and replies are skipped up to its reply
+# (no pipelined command is answered 200 when it succeeds), again while more data follows it. Returns False when
+# that doesn't happen within replyTimeout seconds: replies of the batch may still come and the connection can't
+# be used anymore.
+#
+    def resyncreplies(self, replyBuffer, replyTimeout):
+        resyncEnd = time.monotonic() + replyTimeout
+        try:
+            while True:
+                self.sock.sendall(f'NOOP{ftplib.CRLF}'.encode(self.encoding))
+                while True:
+                    self.sock.settimeout(max(0.001, resyncEnd - time.monotonic()))
+                    if self.readreply(replyBuffer)[:3] == '200':
+                        break
+                
+                if len(replyBuffer[0]) == 0:
+                    return True
+        except (OSError, EOFError):
+            return False
+#
+# Read one reply, possibly multi-line, from the control socket. replyBuffer[0] has data received but not used yet
+#
+    def readreply(self, replyBuffer):
+        replyLines = []
+        while True:
+            while b'\n' not in replyBuffer[0]:
+                replyData = self.sock.recv(8192)
+                if len(replyData) == 0:
+                    raise EOFError
+                replyBuffer[0] += replyData
+            
+            replyLine, replyBuffer[0] = replyBuffer[0].split(b'\n', 1)
+            replyLines.append(replyLine.decode(self.encoding).rstrip('\r'))
+            if replyLines[0][3:4] != '-' or (len(replyLines) > 1 and replyLines[-1][:4] == replyLines[0][:3] + ' '):
+                break
+        
+        ftpReply = '\n'.join(replyLines)
+        if self.debugging:
+            print('*resp*', self.sanitize(ftpReply))
+        return ftpReply
+#
+# Round trip time to remote server, the best of a few NOOPs. Used to size socket buffers with 'auto' tuning
+#
+    def measureRoundTrip(self, noopCount = 3):
+        for noopIndex in range(noopCount):
+            startTime = time.perf_counter()
+            try:
+                self.voidcmd('NOOP')
+            except ftplib.all_errors:
+                return self.roundTrip
+            
+            roundTrip = time.perf_counter() - startTime
+            if self.roundTrip == None or roundTrip < self.roundTrip:
+                self.roundTrip = roundTrip
+        
+        return self.roundTrip
+#
+# Send/receive buffer size for data sockets in tuning profile, 0 to keep system default.
+# 'auto' uses twice the bandwidth-delay product (round trip * link speed), in steps of 64K
+#
+    def socketBuffer(self):
+        if self.tuningProfile not in tuningProfiles.keys():
+            return 0
+        
+        socketBuffer = tuningProfiles[self.tuningProfile]['buffer']
+        if socketBuffer >= 0:
+            return socketBuffer
+        
+        if self.roundTrip == None:
+            return 0
+        
+        socketBuffer = int(2 * self.roundTrip * self.linkSpeed * 125000)
+        socketBuffer = (socketBuffer + 65535) // 65536 * 65536
+        return min(max(socketBuffer, 131072), 67108864)
+#
+# Apply tuning profile to a socket. Buffer sizes only apply to data sockets, and must be set before connecting
+# (or listening) for TCP window scaling to use them
+#
+    def tuneSocket(self, sock, dataSocket = True):
+        if sock == None or self.tuningProfile not in tuningProfiles.keys():
+            return
+        
+        tuningInfo = tuningProfiles[self.tuningProfile]
+        try:
+            if tuningInfo['nodelay'] == True:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            
+            if tuningInfo['keepalive'] == True:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+                if hasattr(socket, 'TCP_KEEPIDLE'):
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60)
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 15)
+            
+            socketBuffer = self.socketBuffer()
+            if dataSocket == True and socketBuffer > 0:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, socketBuffer)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, socketBuffer)
+        except OSError:
+            pass
+#
+# Open data connection for a transfer command. Same as ftplib, except that passive connections are made
+# with connectHost so the socket can be tuned before it connects
+#
+    def ntransfercmd(self, cmd, rest = None):
+        if self.passiveserver == False:
+            conn, size = super().ntransfercmd(cmd, rest)
+            self.tuneSocket(conn)
+            return conn, size
+        
+        host, port = self.makepasv()
+        conn = connectHost(host, port, self.connectTimeout, self.source_address, tuneFunc = self.tuneSocket)
+        try:
+            if isinstance(self.timeout, (int, float)):
+                conn.settimeout(self.timeout)
+            else:
+                conn.settimeout(socket.getdefaulttimeout())
+            
+            if rest is not None:
+                self.sendcmd(f'REST {rest}')
+            
+            ftpResponse = self.sendcmd(cmd)
+            if ftpResponse[0] == '2':
+                ftpResponse = self.getresp()
+            
+            if ftpResponse[0] != '1':
+                raise ftplib.error_reply(ftpResponse)
+        except:
+            conn.close()
+            raise
+        
+        size = None
+        if ftpResponse[:3] == '150':
+            size = ftplib.parse150(ftpResponse)
+        return conn, size
+#
+# Key of remote server in hostCache
+#
+    def hostKey(self):
+        return f'{self.host}:{self.port}'
+#
+# Passive mode: EPSV, falling back to PASV when not supported (IPv6 always uses EPSV)
+#
+    def makepasv(self):
+        if self.af == socket.AF_INET6 or hostCache.get(self.hostKey(), 'pasvmode') != 'PASV':
+            try:
+                ftpResponse = self.sendcmd('EPSV')
+            except ftplib.error_perm:
+                if self.af == socket.AF_INET6:
+                    raise
+                hostCache.set(self.hostKey(), 'pasvmode', 'PASV')
+            else:
+                hostCache.set(self.hostKey(), 'pasvmode', 'EPSV')
+                return ftplib.parse229(ftpResponse, self.sock.getpeername())
+        
+        return super().makepasv()
+#
+# Active mode: EPRT, falling back to PORT when not supported (IPv6 always uses EPRT)
+#
+    def makeport(self):
+        sock = socket.create_server(('', 0), family = self.af, backlog = 1)
+        self.tuneSocket(sock)
+        try:
+            port = sock.getsockname()[1]
+            host = self.sock.getsockname()[0]
+            if self.af == socket.AF_INET6 or hostCache.get(self.hostKey(), 'portmode') != 'PORT':
+                try:
+                    self.sendeprt(host, port)
+                except ftplib.error_perm:
+                    if self.af == socket.AF_INET6:
+                        raise
+                    hostCache.set(self.hostKey(), 'portmode', 'PORT')
+                    self.sendport(host, port)
+                else:
+                    hostCache.set(self.hostKey(), 'portmode', 'EPRT')
+            else:
+                self.sendport(host, port)
+        except:
+            sock.close()
+            raise
+        
+        if isinstance(self.timeout, (int, float)):
+            sock.settimeout(self.timeout)
+        return sock
+###############################################################################
+# Socket tuning profiles for ftpConnection:
+#   nodelay     TCP_NODELAY on control and data sockets (commands are not delayed waiting for ACKs)
+#   keepalive   TCP keepalive, so that the idle control connection survives long transfers through NAT/firewalls
+#   buffer      SO_RCVBUF/SO_SNDBUF of data sockets: 0 keeps system default (autotuning), -1 sizes from round trip
+#
+tuningProfiles = {
+    'lan'   : {'nodelay': True, 'keepalive': False, 'buffer': 0},
+    'wan'   : {'nodelay': True, 'keepalive': True, 'buffer': 16777216},
+    'auto'  : {'nodelay': True, 'keepalive': True, 'buffer': -1},
+}
+###############################################################################
+# Commands which ftpConnection.pipelinecmd can pipeline, with the reply codes expected when they succeed.
+# None is answered 200, the reply to NOOP which ends resyncreplies
+#
+pipelineReplies = {
+    'DELE'  : ['250'],
+    'MDTM'  : ['213'],
+    'MKD'   : ['257', '250'],
+    'RMD'   : ['250'],
+    'SIZE'  : ['213'],
+}
+###############################################################################
+# FTP over SSL/TLS version of ftpConnection
+#
+class ftpConnectionTLS(ftplib.FTP_TLS, ftpConnection):
+    pass
+###############################################################################
+# Connect to host trying all its addresses (IPv6 and IPv4 interleaved), in the style of "happy eyeballs":
+# a new attempt is started every attemptDelay seconds, or as soon as the previous one failed, and the first
+# connection made wins. Others still in progress are closed when they complete.
+# connectTimeout applies to each attempt. Raises the error of the last attempt when none succeeds.
+# tuneFunc(sock) is called for each socket before it connects.
+#
+def connectHost(host, port, connectTimeout = None, sourceAddress = None, attemptDelay = 0.25, tuneFunc = None):
+    addrList = socket.getaddrinfo(host, port or 21, 0, socket.SOCK_STREAM)
+    addrFamilies = [[], []]
+    for addrInfo in addrList:
+        addrFamilies[addrInfo[0] != addrList[0][0]].append(addrInfo)
+    
+    addrList = []
+    for addrIndex in range(max(len(addrFamilies[0]), len(addrFamilies[1]))):
+        addrList += [addrFamily[addrIndex] for addrFamily in addrFamilies if addrIndex < len(addrFamily)]
+    
+    connectQueue = queue.Queue()
+    def connectAddr(addrInfo):
+        sock = socket.socket(addrInfo[0], addrInfo[1], addrInfo[2])
+        try:
+            sock.settimeout(connectTimeout)
+            if tuneFunc != None:
+                tuneFunc(sock)
+            if sourceAddress != None:
+                sock.bind(sourceAddress)
+            sock.connect(addrInfo[4])
+        except OSError as err:
+            sock.close()
+            connectQueue.put((None, err))
+        else:
+            connectQueue.put((sock, None))
+    
+    attemptsStarted = 0
+    attemptsDone = 0
+    connectSock = None
+    connectError = OSError(f'{host}: no address to connect')
+    while connectSock == None and attemptsDone < len(addrList):
+        attemptWait = None
+        if attemptsStarted < len(addrList) and attemptsStarted == attemptsDone:
+            attemptWait = 0
+        elif attemptsStarted < len(addrList):
+            attemptWait = attemptDelay
+        
+        if attemptWait == 0:
+            threading.Thread(target = connectAddr, args = (addrList[attemptsStarted],), daemon = True).start()
+            attemptsStarted += 1
+            continue
+        
+        try:
+            sock, err = connectQueue.get(timeout = attemptWait)
+        except queue.Empty:
+            threading.Thread(target = connectAddr, args = (addrList[attemptsStarted],), daemon = True).start()
+            attemptsStarted += 1
+            continue
+        
+        attemptsDone += 1
+        if sock != None:
+            connectSock = sock
+        else:
+            connectError = err
+    
+    if connectSock == None:
+        raise connectError
+    
+    # Close connections which are made after the first one
+    def closeLate(attemptsLeft):
+        for attemptCount in range(attemptsLeft):
+            sock, err = connectQueue.get()
+            if sock != None:
+                sock.close()
+    
+    if attemptsStarted > attemptsDone:
+        threading.Thread(target = closeLate, args = (attemptsStarted - attemptsDone,), daemon = True).start()
+    
+    return connectSock
+###############################################################################
+# Local index of remote trees in SQLite (~/.pyftp/index.db), so that listings can be queried without the server.
+# indexKey identifies the login (user@host:port). Every directory listed is stored with its entries and the
+# modify time the directory had when it was listed, which refresh compares with the current one (MLST) to list
+# again only the directories which changed. Paths are absolute remote paths.
+#
+#   remoteIndex = ftpIndex('user@ftp.example.com:21')
+#   remoteIndex.storeDir('/pub', '20240101120000', ftpSession.entries('/pub').data)
+#
+class ftpIndex():
+    def __init__(self, indexKey, indexName = 'index.db'):
+        import sqlite3
+
+        self.indexKey = indexKey
+        self.indexDb = sqlite3.connect(getStatePath(indexName), check_same_thread = False)
+        with self.indexDb:
+            self.indexDb.execute('create table if not exists entries (host text, path text, parent text, name text, '
+                                 'type text, size integer, modify text, seen integer, primary key (host, path))')
+            self.indexDb.execute('create index if not exists entries_parent on entries (host, parent)')
+            self.indexDb.execute('create table if not exists dirs (host text, path text, modify text, listed integer, '
+                                 'primary key (host, path))')
+#
+# Range of paths below a directory, for queries of a whole tree
+#
+    def treeRange(self, remoteDir):
+        treePrefix = remoteDir.rstrip('/') + '/'
+        return treePrefix, treePrefix[:-1] + '0'
+#
+# Store entries of a listed directory, replacing what was stored for it. dirModify is the modify time of the
+# directory before it was listed (None to take it from its entry in the parent directory). Subdirectories no
+# longer present are removed with their trees. Returns subdirectories which were not known before.
+#
+    def storeDir(self, remoteDir, dirModify, entryList):
+        timeNow = int(time.time())
+        with self.indexDb:
+            if dirModify == None:
+                dirModify = self.indexDb.execute('select modify from entries where host = ? and path = ?',
+                                                 (self.indexKey, remoteDir)).fetchone()
+                dirModify = dirModify[0] if dirModify != None else None
+            
+            knownDirs = set(dirRow[0] for dirRow in self.indexDb.execute(
+                'select path from dirs where host = ? and path in (select path from entries where host = ? and parent = ?)',
+                (self.indexKey, self.indexKey, remoteDir)))
+            self.indexDb.execute('delete from entries where host = ? and parent = ?', (self.indexKey, remoteDir))
+            # Before the new entries are stored: a subdirectory may have been replaced by a file of the same name
+            subDirs = set(posixpath.join(remoteDir, entryName) for entryName, entryFacts in entryList if entryFacts['type'] == 'dir')
+            for removedDir in knownDirs - subDirs:
+                self.deleteTree(removedDir)
+            
+            self.indexDb.executemany('insert or replace into entries values (?, ?, ?, ?, ?, ?, ?, ?)',
+                                     [(self.indexKey, posixpath.join(remoteDir, entryName), remoteDir, entryName,
+                                       entryFacts['type'], entryFacts.get('size'), entryFacts.get('modify'), timeNow)
+                                      for entryName, entryFacts in entryList])
+            self.indexDb.execute('insert or replace into dirs values (?, ?, ?, ?)', (self.indexKey, remoteDir, dirModify, timeNow))
+        
+        return sorted(subDirs - knownDirs)
+#
+# Remove a directory and everything below it
+#
+    def removeTree(self, remoteDir):
+        with self.indexDb:
+            self.deleteTree(remoteDir)
+#
+# Deletes of removeTree, in the transaction of the caller (storeDir stores a directory in one transaction)
+#
+    def deleteTree(self, remoteDir):
+        treeStart, treeEnd = self.treeRange(remoteDir)
+        for tableName in ['entries', 'dirs']:
+            self.indexDb.execute(f'delete from {tableName} where host = ? and (path = ? or (path >= ? and path < ?))',
+                                 (self.indexKey, remoteDir, treeStart, treeEnd))
+#
+# Directories listed in the tree below remoteDir (included), as {path: modify}
+#
+    def dirs(self, remoteDir):
+        treeStart, treeEnd = self.treeRange(remoteDir)
+        return dict(self.indexDb.execute('select path, modify from dirs where host = ? and (path = ? or (path >= ? and path < ?))',
+                                         (self.indexKey, remoteDir, treeStart, treeEnd)))
+#
+# Entries of a directory as (name, facts) like ftpClient.entries, and when it was listed. None if not indexed
+#
+    def entries(self, remoteDir):
+        dirListed = self.indexDb.execute('select listed from dirs where host = ? and path = ?', (self.indexKey, remoteDir)).fetchone()
+        if dirListed == None:
+            return None
+        
+        entryList = []
+        for entryName, entryType, entrySize, entryModify in self.indexDb.execute(
+                'select name, type, size, modify from entries where host = ? and parent = ? order by name', (self.indexKey, remoteDir)):
+            entryFacts = {'type': entryType}
+            if entrySize != None:
+                entryFacts['size'] = entrySize
+            if entryModify != None:
+                entryFacts['modify'] = entryModify
+            entryList.append((entryName, entryFacts))
+        
+        return entryList, dirListed[0]
+
+    def close(self):
+        self.indexDb.close()
+###############################################################################
+# Local history of uploads in SQLite (~/.pyftp/uploads.db), so that files already sent can be skipped without
+# listing the remote directory (e.g. drop boxes where LIST/NLST are not allowed). One entry per login
+# (user@host:port) and remote path, with the device, inode, size and mtime of the local file sent, its sha256 when
+# checkHash is on, when it was sent and when the entry was last used. A local file is unchanged when all of these
+# are the same. With checkHash, a file of the same size whose inode or mtime changed (e.g. copied or touched) is
+# also unchanged when its sha256 is the same.
+# prune() evicts entries not used for maxAge days and the least recently used beyond maxEntries.
+#
+#   uploadHistory = ftpUploadHistory()
+#   if uploadHistory.unchanged('user@ftp.example.com:21', '/in/data.csv', 'data.csv') == False:
+#       fileStat = os.stat('data.csv')
+#       if ftpSession.put('data.csv', '/in/data.csv').success == True:
+#           uploadHistory.record('user@ftp.example.com:21', '/in/data.csv', 'data.csv', fileStat)
+#
+class ftpUploadHistory():
+    def __init__(self, historyName = 'uploads.db', checkHash = False):
+        import sqlite3
+
+        self.checkHash = checkHash
+        self.historyDb = sqlite3.connect(getStatePath(historyName), check_same_thread = False)
+        with self.historyDb:
+            self.historyDb.execute('create table if not exists uploads (host text, path text, device integer, inode integer, '
+                                   'size integer, mtime integer, sha256 text, sent integer, used integer, primary key (host, path))')
+            self.historyDb.execute('create index if not exists uploads_used on uploads (used)')
+#
+# Whether localFile is unchanged since it was sent to remotePath. The entry counts as used
+#
+    def unchanged(self, hostKey, remotePath, localFile):
         try:
-            ftpResponse = self.ftpConn.sendcmd(commandToSend)
-        except ftplib.all_errors as err:
-            commandStatus['cmdsuccess'] = False
-            commandStatus['response'] = str(err)
+            fileStat = os.stat(localFile)
+        except OSError:
+            return False
+        
+        uploadRow = self.historyDb.execute('select device, inode, size, mtime, sha256 from uploads where host = ? and path = ?',
+                                           (hostKey, remotePath)).fetchone()
+        if uploadRow == None or uploadRow[2] != fileStat.st_size:
+            return False
+        
+        with self.historyDb:
+            if uploadRow[0:4] != (fileStat.st_dev, fileStat.st_ino, fileStat.st_size, fileStat.st_mtime_ns):
+                if self.checkHash == False or uploadRow[4] == None or fileChecksum(localFile) != uploadRow[4]:
+                    return False
+                
+                # Same content: checked by inode and mtime again next time
+                self.historyDb.execute('update uploads set device = ?, inode = ?, mtime = ? where host = ? and path = ?',
+                                       (fileStat.st_dev, fileStat.st_ino, fileStat.st_mtime_ns, hostKey, remotePath))
+            
+            self.historyDb.execute('update uploads set used = ? where host = ? and path = ?', (int(time.time()), hostKey, remotePath))
+        return True
+#
+# Record that localFile was sent to remotePath. fileStat is os.stat of the file taken before it was sent, so that
+# a file changed while it was being sent is sent again next time
+#
+    def record(self, hostKey, remotePath, localFile, fileStat = None):
+        if fileStat == None:
+            fileStat = os.stat(localFile)
+        
+        fileHash = None
+        if self.checkHash == True:
+            fileHash = fileChecksum(localFile)
+        
+        timeNow = int(time.time())
+        with self.historyDb:
+            self.historyDb.execute('insert or replace into uploads values (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                   (hostKey, remotePath, fileStat.st_dev, fileStat.st_ino, fileStat.st_size, fileStat.st_mtime_ns,
+                                    fileHash, timeNow, timeNow))
+#
+# Entries of a login as (path, size, sent, sha256), for remote paths matching pathPattern (GLOB) if given
+#
+    def entries(self, hostKey, pathPattern = '*'):
+        return self.historyDb.execute('select path, size, sent, sha256 from uploads where host = ? and path glob ? order by path',
+                                      (hostKey, pathPattern)).fetchall()
+#
+# Remove entries of a login, for remote paths matching pathPattern (GLOB) if given, so that the files are sent
+# again. Returns the number of entries removed
+#
+    def forget(self, hostKey, pathPattern = '*'):
+        with self.historyDb:
+            return self.historyDb.execute('delete from uploads where host = ? and path glob ?', (hostKey, pathPattern)).rowcount
+#
+# Evict entries not used for maxAge days and the least recently used beyond maxEntries (0 for no limit).
+# Returns the number of entries evicted
+#
+    def prune(self, maxAge = 0, maxEntries = 0):
+        evictCount = 0
+        with self.historyDb:
+            if maxAge > 0:
+                evictCount += self.historyDb.execute('delete from uploads where used < ?', (int(time.time()) - maxAge * 86400,)).rowcount
+            if maxEntries > 0:
+                evictCount += self.historyDb.execute('delete from uploads where rowid in '
+                                                     '(select rowid from uploads order by used desc limit -1 offset ?)',
+                                                     (maxEntries,)).rowcount
+        return evictCount
+
+    def close(self):
+        self.historyDb.close()
+###############################################################################
+# Settings remembered per remote host across runs, in a JSON file of the pyFTP state directory:
+#   hostCache       hosts.json, e.g. data connection mode
+#   followCache     follow.json, offsets of remote files fetched by tail
+#
+class ftpHostCache():
+    def __init__(self, cacheName = 'hosts.json'):
+        self.cacheName = cacheName
+        self.cacheData = None
+        self.cacheLock = threading.Lock()
+
+    def load(self):
+        import json
+
+        if self.cacheData != None:
+            return
+        
+        self.cacheData = {}
+        try:
+            with open(getStatePath(self.cacheName), 'r') as cacheFile:
+                self.cacheData = json.load(cacheFile)
+        except (OSError, ValueError):
+            pass
+
+    def get(self, hostKey, itemName, defaultValue = None):
+        with self.cacheLock:
+            self.load()
+            return self.cacheData.get(hostKey, {}).get(itemName, defaultValue)
+#
+# Change a setting. The cache file is only written when the value changed
+#
+    def set(self, hostKey, itemName, itemValue):
+        with self.cacheLock:
+            self.load()
+            if self.cacheData.get(hostKey, {}).get(itemName) == itemValue:
+                return
+            
+            self.cacheData.setdefault(hostKey, {})[itemName] = itemValue
+            import json
+            try:
+                writeStateFile(self.cacheName, json.dumps(self.cacheData, indent = 1))
+            except OSError:
+                pass
+
+hostCache = ftpHostCache()
+followCache = ftpHostCache('follow.json')
+###############################################################################
+# Journal of a multi-file operation (mget/mput) in ~/.pyftp/manifests, named from a hash of manifestKey (command,
+# host, user, directories and files given). One JSON line is appended per file completed: remote file, local file,
+# its size, mtime, sha256 if hashFiles is on (the file is read again) and the time completed. Each line is flushed
+# when written, so after an interruption the run can be continued (continueRun) and the files completed skipped.
+# A line cut short is ignored, a file that can't be read or recorded is left unrecorded.
+# The journal is removed when the run completes without failures; journals left older than keepDays are pruned.
+#
+class ftpManifest():
+    keepDays = 30
+
+    def __init__(self, manifestKey, continueRun = False, hashFiles = False):
+        import hashlib
+
+        self.hashFiles = hashFiles
+        manifestDir = getStatePath('manifests')
+        os.makedirs(manifestDir, exist_ok = True)
+        self.prune(manifestDir)
+        self.manifestPath = os.path.join(manifestDir, hashlib.sha256(manifestKey.encode()).hexdigest()[:16] + '.jsonl')
+        self.filesDone = {}
+        if continueRun == True:
+            self.load()
+        
+        # A new run starts a new journal
+        self.manifestFile = open(self.manifestPath, 'a' if continueRun == True else 'w')
+        if self.manifestFile.tell() == 0:
+            self.writeLine({'manifest': manifestKey, 'started': datetime.now().isoformat(timespec = 'seconds')})
+
+    def load(self):
+        import json
+
+        try:
+            with open(self.manifestPath, 'r') as manifestFile:
+                for manifestLine in manifestFile:
+                    try:
+                        fileRecord = json.loads(manifestLine)
+                    except ValueError:
+                        continue
+                    if 'file' in fileRecord:
+                        self.filesDone[fileRecord['file']] = fileRecord
+        except OSError:
+            pass
+#
+# File was completed in an earlier run and its local file is unchanged since (same size and mtime)
+#
+    def completed(self, fileName):
+        fileRecord = self.filesDone.get(fileName)
+        if fileRecord == None:
+            return False
+        
+        try:
+            fileStat = os.stat(fileRecord['local'])
+        except OSError:
+            return False
+        
+        return fileStat.st_size == fileRecord['size'] and fileStat.st_mtime_ns == fileRecord['mtime']
+#
+# Record file as completed
+#
+    def record(self, fileName, localFile):
+        try:
+            fileStat = os.stat(localFile)
+            fileRecord = {
+                'file'      : fileName,
+                'local'     : os.path.abspath(localFile),
+                'size'      : fileStat.st_size,
+                'mtime'     : fileStat.st_mtime_ns,
+            }
+            if self.hashFiles == True:
+                fileRecord['sha256'] = fileChecksum(localFile)
+            fileRecord['time'] = datetime.now().isoformat(timespec = 'seconds')
+            self.writeLine(fileRecord)
+        except OSError:
+            return
+        
+        self.filesDone[fileName] = fileRecord
+
+    def writeLine(self, lineData):
+        import json
+
+        self.manifestFile.write(json.dumps(lineData) + '\n')
+        self.manifestFile.flush()
+
+    def close(self, runComplete = False):
+        self.manifestFile.close()
+        if runComplete == True:
+            try:
+                os.remove(self.manifestPath)
+            except OSError:
+                pass
+#
+# Remove journals not written to for keepDays
+#
+    def prune(self, manifestDir):
+        pruneTime = time.time() - self.keepDays * 86400
+        try:
+            with os.scandir(manifestDir) as dirEntries:
+                for dirEntry in dirEntries:
+                    if dirEntry.name.endswith('.jsonl') and dirEntry.stat().st_mtime < pruneTime:
+                        os.remove(dirEntry.path)
+        except OSError:
+            pass
+###############################################################################
+# SHA-256 of a local file, as hex
+#
+def fileChecksum(localFile, blockSize = 1048576):
+    import hashlib
+
+    fileHash = hashlib.sha256()
+    with open(localFile, 'rb') as file2hash:
+        for fileBlock in iter(lambda: file2hash.read(blockSize), b''):
+            fileHash.update(fileBlock)
+    
+    return fileHash.hexdigest()
+###############################################################################
+# Path of a file in the pyFTP state directory (~/.pyftp), which is created when needed
+#
+def getStatePath(fileName):
+    stateDir = os.path.join(os.path.expanduser('~'), '.pyftp')
+    os.makedirs(stateDir, exist_ok = True)
+    return os.path.join(stateDir, fileName)
+###############################################################################
+# Write a file in the pyFTP state directory. Written to a temporary file first and renamed, so that a
+# concurrent run never reads a partial file
+#
+def writeStateFile(fileName, fileData):
+    statePath = getStatePath(fileName)
+    stateTemp = f'{statePath}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(stateTemp, 'w') as stateFile:
+        stateFile.write(fileData)
+    os.replace(stateTemp, statePath)
+###############################################################################
+# Pool of reusable transfer buffers. Buffers are handed out as bytearray and given back once the data has been
+# written, so a download allocates its buffers once instead of one bytes object for every block received.
+# Buffer size is kept as a multiple of 64K so that writes to the local file stay aligned.
+#
+class ftpBufferPool():
+    def __init__(self, bufferSize = 1048576):
+        self.bufferSize = max(65536, bufferSize - bufferSize % 65536)
+        self.freeBuffers = []
+#
+# Get a buffer from the pool, allocating a new one if none is free
+#
+    def getBuffer(self):
+        try:
+            return self.freeBuffers.pop()
+        except IndexError:
+            return bytearray(self.bufferSize)
+#
+# Give the buffer back to the pool for reuse
+#
+    def putBuffer(self, buffer):
+        if len(buffer) == self.bufferSize:
+            self.freeBuffers.append(buffer)
+###############################################################################
+# Ring of transfer buffers between the network side (caller's thread) and the disk side of a transfer.
+# With bufferDepth 0 the disk side is called inline using a single buffer (lockstep). Otherwise the disk side runs
+# in its own thread, with bufferDepth buffers in flight, so that short stalls on either side are absorbed.
+# Time spent waiting on the other side is recorded as diskStall (network side waiting for disk) and
+# networkStall (disk side waiting for network).
+#
+class ftpTransferRing():
+    def __init__(self, bufferPool, bufferDepth = 0):
+        self.bufferPool = bufferPool
+        self.bufferDepth = bufferDepth
+        self.ringBuffers = [bufferPool.getBuffer() for bufferCount in range(max(1, bufferDepth))]
+        self.freeQueue = queue.Queue()
+        self.dataQueue = queue.Queue()
+        for ringBuffer in self.ringBuffers:
+            self.freeQueue.put(ringBuffer)
+        
+        self.diskFunc = None
+        self.diskThread = None
+        self.diskError = None
+        self.diskStall = 0.0
+        self.networkStall = 0.0
+#
+# Start the disk side. diskFunc writes a memoryview to disk (download) or reads into a buffer and returns
+# the number of bytes read (upload)
+#
+    def startWriter(self, diskFunc):
+        self.diskFunc = diskFunc
+        if self.bufferDepth > 0:
+            self.diskThread = threading.Thread(target = self.ringWriter, daemon = True)
+            self.diskThread.start()
+    
+    def startReader(self, diskFunc):
+        self.diskFunc = diskFunc
+        if self.bufferDepth > 0:
+            self.diskThread = threading.Thread(target = self.ringReader, daemon = True)
+            self.diskThread.start()
+#
+# Disk thread for downloads. After an error, buffers are still drained so that the network side does not block
+#
+    def ringWriter(self):
+        while True:
+            ringData = self.ringWait(self.dataQueue, 'networkStall')
+            if ringData == None:
+                break
+            
+            if self.diskError == None:
+                try:
+                    with memoryview(ringData[0]) as dataView:
+                        self.diskFunc(dataView[:ringData[1]])
+                except Exception as err:
+                    self.diskError = err
+            
+            self.freeQueue.put(ringData[0])
+#
+# Disk thread for uploads. End of file (or an error) is passed on as a zero length buffer
+#
+    def ringReader(self):
+        while True:
+            ringBuffer = self.ringWait(self.freeQueue, 'networkStall')
+            if ringBuffer == None:
+                break
+            
+            try:
+                readBytes = self.diskFunc(ringBuffer)
+            except Exception as err:
+                self.diskError = err
+                readBytes = 0
+            
+            self.dataQueue.put((ringBuffer, readBytes))
+            if readBytes == 0:
+                break
+#
+# Get from queue, adding the time blocked to the stall counter
+#
+    def ringWait(self, ringQueue, stallCounter):
+        try:
+            return ringQueue.get_nowait()
+        except queue.Empty:
+            pass
+        
+        waitStart = time.perf_counter()
+        ringItem = ringQueue.get()
+        setattr(self, stallCounter, getattr(self, stallCounter) + time.perf_counter() - waitStart)
+        return ringItem
+#
+# Network side of a download: get an empty buffer and hand it back filled
+#
+    def getBuffer(self):
+        if self.diskError != None:
+            raise self.diskError
+        
+        return self.ringWait(self.freeQueue, 'diskStall')
+    
+    def putBuffer(self, ringBuffer, bufferUsed):
+        if self.diskThread != None:
+            self.dataQueue.put((ringBuffer, bufferUsed))
+            return
+        
+        try:
+            with memoryview(ringBuffer) as dataView:
+                self.diskFunc(dataView[:bufferUsed])
+        finally:
+            self.freeQueue.put(ringBuffer)
+#
+# Network side of an upload: get a filled buffer (length 0 at end of file) and give it back once sent
+#
+    def getData(self):
+        if self.diskThread != None:
+            ringData = self.ringWait(self.dataQueue, 'diskStall')
         else:
-            commandStatus['cmdsuccess'] = True
-            commandStatus['response'] = ftpResponse
+            ringBuffer = self.freeQueue.get_nowait()
+            ringData = (ringBuffer, self.diskFunc(ringBuffer))
         
-        if printResponse == 1 or (printResponse == 0 and self.systStatus['verbose'] == True):
-            print(commandStatus['response'])
+        if self.diskError != None:
+            raise self.diskError
         
-        return commandStatus
+        return ringData
+    
+    def putData(self, ringBuffer):
+        self.freeQueue.put(ringBuffer)
 #
-# Pass the ftpCommand 'remotecmd' response to get the error code in number format
-# Called from:
-#   ftpCommand_user
-#   ftpCommand_rnfr
+# Stop the disk side, wait for pending buffers to be processed and return the buffers to the pool.
+# Raises the disk side error, if any, which was not yet reported to the network side
+#
+    def close(self):
+        if self.diskThread != None:
+            self.dataQueue.put(None)
+            self.freeQueue.put(None)
+            self.diskThread.join()
+            self.diskThread = None
+        
+        for ringBuffer in self.ringBuffers:
+            self.bufferPool.putBuffer(ringBuffer)
+        
+        if self.diskError != None:
+            raise self.diskError
+###############################################################################
+# Bandwidth used by transfers, shared by all sessions (see bandwidthLimit). globalRate in bytes per second (0 is no
+# limit) is shared by the transfers running at the same time, each getting a share in proportion to its weight.
+# A transfer can also have its own limit (transferRate): when that is below its share, the rest is shared by the
+# other transfers. rateSchedule changes the global rate by time of day, a list of (startMinute, endMinute, rate)
+# where the first window containing the local time applies (windows ending before they start wrap past midnight),
+# and globalRate outside all windows.
+# A transfer gets an ftpRateBucket with start(), None when there is no limit at all, and gives it back with end().
 #
-    def ftpCommand_errorCode(self, ftpResponse):
-        response = ftpResponse['response'][0:3].strip()
+class ftpBandwidth():
+    def __init__(self):
+        self.globalRate = 0
+        self.rateSchedule = []
+        self.activeBuckets = []
+        self.bandwidthLock = threading.Lock()
+
+    def setLimit(self, globalRate = 0, rateSchedule = None):
+        with self.bandwidthLock:
+            self.globalRate = globalRate
+            self.rateSchedule = rateSchedule or []
+            for rateBucket in self.activeBuckets:
+                rateBucket.rateTime = None
+#
+# Global rate at the time given (seconds since the epoch, default now)
+#
+    def currentRate(self, timeNow = None):
+        if len(self.rateSchedule) == 0:
+            return self.globalRate
+        
+        localTime = time.localtime(timeNow)
+        minuteNow = localTime.tm_hour * 60 + localTime.tm_min
+        for startMinute, endMinute, windowRate in self.rateSchedule:
+            if startMinute <= endMinute:
+                windowMatch = startMinute <= minuteNow < endMinute
+            else:
+                windowMatch = minuteNow >= startMinute or minuteNow < endMinute
+            if windowMatch == True:
+                return windowRate
+        
+        return self.globalRate
+
+    def start(self, transferRate = 0, transferWeight = 1):
+        if transferRate == 0 and self.globalRate == 0 and len(self.rateSchedule) == 0:
+            return None
+        
+        rateBucket = ftpRateBucket(self, transferRate, max(1, transferWeight))
+        with self.bandwidthLock:
+            self.activeBuckets.append(rateBucket)
+            for activeBucket in self.activeBuckets:
+                activeBucket.rateTime = None
+        return rateBucket
+
+    def end(self, rateBucket):
+        if rateBucket == None:
+            return
+        
+        with self.bandwidthLock:
+            self.activeBuckets.remove(rateBucket)
+            for activeBucket in self.activeBuckets:
+                activeBucket.rateTime = None
+#
+# Rate of a transfer now (0 is no limit). Transfers whose own limit is below their weighted share of the global
+# rate get their own limit, the remaining rate is shared by weight between the others.
+#
+    def shareRate(self, rateBucket):
+        globalRate = self.currentRate()
+        if globalRate == 0:
+            return rateBucket.transferRate
+        
+        with self.bandwidthLock:
+            remainingRate = globalRate
+            remainingWeight = sum(activeBucket.transferWeight for activeBucket in self.activeBuckets)
+            cappedBuckets = [activeBucket for activeBucket in self.activeBuckets if activeBucket.transferRate > 0]
+            cappedBuckets.sort(key = lambda x: x.transferRate / x.transferWeight)
+            for cappedBucket in cappedBuckets:
+                if cappedBucket.transferRate > remainingRate * cappedBucket.transferWeight / remainingWeight:
+                    break
+                if cappedBucket is rateBucket:
+                    return rateBucket.transferRate
+                remainingRate -= cappedBucket.transferRate
+                remainingWeight -= cappedBucket.transferWeight
+            
+            return remainingRate * rateBucket.transferWeight / remainingWeight
+
+bandwidthLimit = ftpBandwidth()
+###############################################################################
+# Token bucket of one transfer. throttle(byteCount) is called for the data sent or received and sleeps while the
+# transfer is ahead of its rate. Up to burstTime seconds of unused rate are saved up. The rate is taken from the
+# ftpBandwidth again every rateInterval seconds, and at once when transfers start or end.
+#
+class ftpRateBucket():
+    burstTime = 0.1
+    rateInterval = 0.5
+
+    def __init__(self, bandwidth, transferRate = 0, transferWeight = 1):
+        self.bandwidth = bandwidth
+        self.transferRate = transferRate
+        self.transferWeight = transferWeight
+        self.currentRate = 0
+        self.rateTime = None
+        self.tokenCount = 0.0
+        self.tokenTime = time.perf_counter()
+
+    def throttle(self, byteCount):
+        timeNow = time.perf_counter()
+        if self.rateTime == None or timeNow - self.rateTime > self.rateInterval:
+            self.currentRate = self.bandwidth.shareRate(self)
+            self.rateTime = timeNow
+        
+        if self.currentRate == 0:
+            self.tokenCount = 0.0
+            self.tokenTime = timeNow
+            return
+        
+        self.tokenCount = min(self.currentRate * self.burstTime, self.tokenCount + (timeNow - self.tokenTime) * self.currentRate)
+        self.tokenTime = timeNow
+        self.tokenCount -= byteCount
+        if self.tokenCount < 0:
+            time.sleep(-self.tokenCount / self.currentRate)
+#
+# Bytes to send or receive at once, so that data moves in steps of about burstTime rather than in whole buffers
+#
+    def blockSize(self, maxSize):
+        if self.currentRate == 0:
+            return maxSize
+        
+        return max(4096, min(maxSize, int(self.currentRate * self.burstTime)))
+###############################################################################
+# Rate in bytes per second from e.g. '500K', '20M', '1.5G' or '20MB' (K, M and G are powers of 1024). 0, 'off'
+# and 'none' are no limit. Returns None if not a valid rate.
+#
+def parseRate(rateText):
+    rateText = rateText.strip().upper()
+    if rateText in ['OFF', 'NONE']:
+        return 0
+    
+    rateText = rateText.removesuffix('/S').removesuffix('B')
+    rateScale = 1
+    if rateText[-1:] in ['K', 'M', 'G']:
+        rateScale = 1024 ** (' KMG'.index(rateText[-1]))
+        rateText = rateText[:-1]
+    
+    try:
+        rateValue = float(rateText)
+    except ValueError:
+        return None
+    
+    if rateValue < 0:
+        return None
+    
+    return int(rateValue * rateScale)
+#
+# Rate in bytes per second for display
+#
+def formatRate(rateValue):
+    if rateValue == 0:
+        return 'unlimited'
+    
+    for rateUnit in ['G', 'M', 'K']:
+        rateScale = 1024 ** (' KMG'.index(rateUnit))
+        if rateValue >= rateScale:
+            return f'{rateValue / rateScale:g}{rateUnit}/s'
+    
+    return f'{rateValue}/s'
+###############################################################################
+# Bandwidth limit from a list of entries (command line, bandwidth command, or lines of a bandwidth file):
+#   rate                    global rate, also outside the time windows, e.g. 20M
+#   HH:MM-HH:MM=rate        rate during a time window, e.g. 08:00-18:00=20M
+# Returns (globalRate, rateSchedule) for ftpBandwidth.setLimit. Raises ValueError for an invalid entry.
+#
+def parseRateSchedule(scheduleEntries):
+    globalRate = 0
+    rateSchedule = []
+    for scheduleEntry in scheduleEntries:
+        timeWindow, _, rateText = scheduleEntry.rpartition('=')
+        windowRate = parseRate(rateText)
+        if windowRate == None:
+            raise ValueError(f'{scheduleEntry}: invalid rate.')
+        
+        if timeWindow in ['', '*']:
+            globalRate = windowRate
+            continue
+        
+        windowMinutes = []
+        for windowTime in timeWindow.split('-'):
+            hourText, _, minuteText = windowTime.partition(':')
+            if hourText.isdigit() == False or (minuteText.isdigit() == False and minuteText != '') or \
+                    int(hourText) > 24 or int(minuteText or 0) > 59:
+                break
+            windowMinutes.append(int(hourText) * 60 + int(minuteText or 0))
+        
+        if len(windowMinutes) != 2 or len(timeWindow.split('-')) != 2:
+            raise ValueError(f'{scheduleEntry}: invalid time window, use HH:MM-HH:MM=rate.')
+        
+        rateSchedule.append((windowMinutes[0], windowMinutes[1], windowRate))
+    
+    return globalRate, rateSchedule
+#
+# Read schedule entries from a bandwidth file, one or more per line. Text after # is a comment.
+#
+def readRateSchedule(scheduleFile):
+    scheduleEntries = []
+    with open(scheduleFile, 'r') as rateFile:
+        for fileLine in rateFile:
+            scheduleEntries += fileLine.partition('#')[0].replace(',', ' ').split()
+    
+    return parseRateSchedule(scheduleEntries)
+###############################################################################
+# Receive a file in binary mode. Replaces ftplib retrbinary for downloads:
+#   - local file is preallocated with posix_fallocate when the remote SIZE is known (where supported)
+#   - data is received with recv_into into reusable buffers from the pool
+#   - a buffer is written to the local file only when full, so writes are large and aligned
+#   - with bufferDepth > 0, the local file is written from a separate thread (see ftpTransferRing)
+# file2write must be an unbuffered binary file (buffering = 0), which can also be a pipe.
+# remoteSize saves the SIZE command when the caller already knows it.
+# rateBucket (ftpRateBucket) limits the rate data is received at, remote server is slowed down by TCP flow control.
+# Returns transfer status with the final response from remote server, bytes received and stall times.
+#
+def recvBinaryFile(ftpConn, remoteFile, file2write, bufferPool, restOffset = None, bufferDepth = 0, remoteSize = None, rateBucket = None):
+    ftpConn.voidcmd('TYPE I')
+
+    # Streams (stdout) can't be positioned or preallocated
+    startOffset = 0
+    if file2write.seekable():
+        startOffset = file2write.tell()
+    
+    if remoteSize == None and ftpConn.hasFeature('SIZE') == False:
+        ftpConn.roundTripsSaved += 1
+    elif remoteSize == None:
+        try:
+            remoteSize = ftpConn.size(remoteFile)
+        except ftplib.all_errors:
+            remoteSize = None
+    
+    # Not possible for files opened in append mode, as writes always go to the end of the preallocated space
+    fileAllocated = 0
+    if remoteSize != None and hasattr(os, 'posix_fallocate') and 'a' not in file2write.mode and file2write.seekable():
+        allocateSize = remoteSize - (restOffset or 0)
+        if allocateSize > 0:
+            try:
+                os.posix_fallocate(file2write.fileno(), startOffset, allocateSize)
+                fileAllocated = startOffset + allocateSize
+            except OSError:
+                fileAllocated = 0
+    
+    transferStatus = {'response': '', 'bytes': 0, 'dataopen': False}
+    transferRing = ftpTransferRing(bufferPool, bufferDepth)
+    transferRing.startWriter(lambda x: writeFileData(file2write, x))
+    try:
+        with ftpConn.transfercmd(f'RETR {remoteFile}', restOffset) as conn:
+            transferStatus['dataopen'] = True
+            # First chunk is shortened so that all subsequent writes start on a buffer boundary
+            chunkSize = bufferPool.bufferSize - startOffset % bufferPool.bufferSize
+            recvBytes = 1
+            while recvBytes > 0:
+                recvBuffer = transferRing.getBuffer()
+                bufferUsed = 0
+                with memoryview(recvBuffer) as recvView:
+                    try:
+                        while bufferUsed < chunkSize:
+                            recvEnd = chunkSize
+                            if rateBucket != None:
+                                recvEnd = bufferUsed + rateBucket.blockSize(chunkSize - bufferUsed)
+                            recvBytes = conn.recv_into(recvView[bufferUsed:recvEnd])
+                            if recvBytes == 0:
+                                break
+                            bufferUsed += recvBytes
+                            if rateBucket != None:
+                                rateBucket.throttle(recvBytes)
+                    except TimeoutError:
+                        # Stalled: keep the data received so far, the transfer can be resumed from there
+                        transferRing.putBuffer(recvBuffer, bufferUsed)
+                        transferStatus['bytes'] += bufferUsed
+                        raise
+                
+                transferRing.putBuffer(recvBuffer, bufferUsed)
+                transferStatus['bytes'] += bufferUsed
+                chunkSize = bufferPool.bufferSize
+            
+            # shutdown ssl layer
+            if hasattr(conn, 'unwrap'):
+                conn.unwrap()
+    except BaseException as err:
+        drainResponse(ftpConn, transferStatus, err)
+        raise
+    finally:
+        try:
+            transferRing.close()
+        finally:
+            # Release any preallocated space which was not used (remote file shrunk or transfer failed)
+            if fileAllocated > 0 and fileAllocated > file2write.tell():
+                os.ftruncate(file2write.fileno(), file2write.tell())
+    
+    if bufferDepth > 0:
+        transferStatus['diskstall'] = transferRing.diskStall
+        transferStatus['networkstall'] = transferRing.networkStall
+    
+    transferStatus['response'] = ftpConn.voidresp()
+    return transferStatus
+###############################################################################
+# Send a file in binary mode. Replaces ftplib storbinary for uploads: the local file is read with readinto
+# into reusable buffers from the pool, from a separate thread when bufferDepth > 0 (see ftpTransferRing).
+# remoteCmd is the complete STOR/APPE command. rateBucket and the transfer status returned are as for recvBinaryFile.
+#
+def sendBinaryFile(ftpConn, remoteCmd, file2send, bufferPool, bufferDepth = 0, restOffset = None, rateBucket = None):
+    ftpConn.voidcmd('TYPE I')
+
+    transferStatus = {'response': '', 'bytes': 0, 'dataopen': False}
+    transferRing = ftpTransferRing(bufferPool, bufferDepth)
+    try:
+        with ftpConn.transfercmd(remoteCmd, restOffset) as conn:
+            transferStatus['dataopen'] = True
+            transferRing.startReader(file2send.readinto)
+            while True:
+                sendBuffer, sendLength = transferRing.getData()
+                if sendLength == 0:
+                    break
+                
+                with memoryview(sendBuffer) as sendView:
+                    sendLimited(conn, sendView[:sendLength], rateBucket)
+                transferRing.putData(sendBuffer)
+                transferStatus['bytes'] += sendLength
+            
+            # shutdown ssl layer
+            if hasattr(conn, 'unwrap'):
+                conn.unwrap()
+    except BaseException as err:
+        drainResponse(ftpConn, transferStatus, err)
+        raise
+    finally:
+        transferRing.close()
+    
+    if bufferDepth > 0:
+        transferStatus['diskstall'] = transferRing.diskStall
+        transferStatus['networkstall'] = transferRing.networkStall
+    
+    transferStatus['response'] = ftpConn.voidresp()
+    return transferStatus
+###############################################################################
+# Send data in memory in binary mode (e.g. a memory mapped file shared by several uploads). Slices of the data
+# are sent directly, without copying. rateBucket and the transfer status returned are as for recvBinaryFile.
+#
+def sendBinaryData(ftpConn, remoteCmd, sendData, blockSize = 1048576, rateBucket = None):
+    ftpConn.voidcmd('TYPE I')
+
+    transferStatus = {'response': '', 'bytes': 0, 'dataopen': False}
+    try:
+        with ftpConn.transfercmd(remoteCmd) as conn, memoryview(sendData) as sendView:
+            transferStatus['dataopen'] = True
+            for blockOffset in range(0, len(sendView), blockSize):
+                sendLimited(conn, sendView[blockOffset:blockOffset + blockSize], rateBucket)
+                transferStatus['bytes'] += len(sendView[blockOffset:blockOffset + blockSize])
+            
+            # shutdown ssl layer
+            if hasattr(conn, 'unwrap'):
+                conn.unwrap()
+    except BaseException as err:
+        drainResponse(ftpConn, transferStatus, err)
+        raise
+    
+    transferStatus['response'] = ftpConn.voidresp()
+    return transferStatus
+###############################################################################
+# Send all data on a data connection. With a rateBucket the data is sent in blocks, each when the rate allows it.
+#
+def sendLimited(conn, dataView, rateBucket = None):
+    if rateBucket == None:
+        conn.sendall(dataView)
+        return
+    
+    dataSent = 0
+    while dataSent < len(dataView):
+        blockSize = rateBucket.blockSize(len(dataView) - dataSent)
+        rateBucket.throttle(blockSize)
+        conn.sendall(dataView[dataSent:dataSent + blockSize])
+        dataSent += blockSize
+###############################################################################
+# Upload one local file to many hosts, maxHosts at the same time. The file is memory mapped once and all uploads
+# send from the same memory. hostList has dicts with 'host', 'port', 'user', 'password' (and optional 'account').
+# sessionFunc() returns a new ftpClient with the settings to use (default ftpClient()).
+# Returns ftpResult per host, in the order of hostList: the upload result, or the failed open/login.
+#
+def fanoutPut(hostList, localFile, remoteFile, maxHosts = 16, sessionFunc = None):
+    import mmap
+
+    if sessionFunc == None:
+        sessionFunc = ftpClient
+    
+    def uploadHost(unusedSession, fanoutHost):
+        startTime = time.perf_counter()
+        ftpSession = sessionFunc()
+        cmdResult = ftpSession.open(fanoutHost['host'], fanoutHost.get('port', 0))
+        if cmdResult.success == True:
+            cmdResult = ftpSession.login(fanoutHost['user'], fanoutHost.get('password', ''), fanoutHost.get('account', ''))
+        if cmdResult.success == True:
+            cmdResult = ftpSession.put(fileData, remoteFile)
+        else:
+            cmdResult.elapsed = time.perf_counter() - startTime
+        
+        ftpSession.close()
+        return cmdResult
+    
+    with open(localFile, 'rb') as file2send:
+        # Empty files can't be mapped
+        fileData = b''
+        if os.fstat(file2send.fileno()).st_size > 0:
+            fileData = mmap.mmap(file2send.fileno(), 0, access = mmap.ACCESS_READ)
+        
+        try:
+            return runParallel([None] * max(1, maxHosts), hostList, uploadHost)
+        finally:
+            if isinstance(fileData, mmap.mmap):
+                fileData.close()
+###############################################################################
+# After a transfer failed with the data connection open (e.g. local disk full), the remote server still sends
+# the final response for the transfer. Read it so that the next command does not get it as its response.
+# Not when the transfer stalled (TimeoutError), remote server won't send it until the transfer is aborted.
+#
+def drainResponse(ftpConn, transferStatus, transferError = None):
+    if transferStatus['dataopen'] == False or isinstance(transferError, TimeoutError):
+        return
+    
+    try:
+        transferStatus['response'] = ftpConn.getresp()
+    except ftplib.all_errors as err:
+        transferStatus['response'] = str(err)
+###############################################################################
+# Write the complete buffer to an unbuffered file. Raw file writes may be partial.
+#
+def writeFileData(file2write, dataView):
+    dataWritten = 0
+    while dataWritten < len(dataView):
+        dataWritten += file2write.write(dataView[dataWritten:])
+###############################################################################
+# Numeric reply code of a response from remote server (0 if the response has none, e.g. a socket error)
+#
+def getResponseCode(ftpResponse):
+    responseCode = ftpResponse[0:3].strip()
+
+    if responseCode.isdigit() == False:
+        return 0
+    
+    return int(responseCode)
+###############################################################################
+# Facts of an MLSD/MLST entry in the form used by ftpClient.entries: 'type' in lower case, 'size' as int and
+# 'modify' as YYYYMMDDHHMMSS (fractions of seconds dropped), when present
+#
+def mlsxFacts(entryFacts):
+    entryFacts = {factName.lower(): factValue for factName, factValue in entryFacts.items()}
+    dirEntry = {'type': entryFacts.get('type', '').lower()}
+    entrySize = entryFacts.get('size', entryFacts.get('sizd', ''))
+    if entrySize.isdigit() == True:
+        dirEntry['size'] = int(entrySize)
+    if len(entryFacts.get('modify', '')) >= 14:
+        dirEntry['modify'] = entryFacts['modify'][:14]
+    return dirEntry
+###############################################################################
+# Parse a line of LIST output, in Unix (ls -l) or Windows/IIS (DOS) format, to (name, facts) as returned by
+# ftpClient.entries. Returns None for lines which are not entries (e.g. 'total 12').
+#
+listUnixPattern = re.compile(r'^([\-dlbcps])\S{9,10}\s+\d+\s+\S+(?:\s+\S+)?\s+(\d+)\s+(\w{3})\s+(\d{1,2})\s+(\d{1,2}:\d{2}|\d{4})\s(.+)$')
+listDosPattern = re.compile(r'^(\d{2})-(\d{2})-(\d{2,4})\s+(\d{1,2}):(\d{2})([AaPp][Mm])\s+(<DIR>|\d+)\s+(.+)$')
+listMonths = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
 
-        if response.isdigit() == False:
-            response = 0
+def parseListLine(listLine):
+    listMatch = listUnixPattern.match(listLine)
+    if listMatch != None:
+        entryType = {'-': 'file', 'd': 'dir', 'l': 'link'}.get(listMatch.group(1), 'other')
+        entryName = listMatch.group(6).lstrip(' ')
+        if entryType == 'link':
+            entryName = entryName.split(' -> ')[0]
+        
+        entryFacts = {'type': entryType, 'size': int(listMatch.group(2))}
+        if listMatch.group(3).lower() in listMonths:
+            entryMonth = listMonths.index(listMatch.group(3).lower()) + 1
+            entryDay = int(listMatch.group(4))
+            if ':' in listMatch.group(5):
+                # Recent files show the time instead of the year, they are less than 6 months old
+                timeNow = datetime.now()
+                entryYear = timeNow.year
+                if (entryMonth, entryDay) > (timeNow.month, timeNow.day + 1):
+                    entryYear -= 1
+                entryHour, entryMinute = listMatch.group(5).split(':')
+            else:
+                entryYear, entryHour, entryMinute = listMatch.group(5), 0, 0
+            entryFacts['modify'] = f'{int(entryYear):04}{entryMonth:02}{entryDay:02}{int(entryHour):02}{int(entryMinute):02}00'
+        return (entryName, entryFacts)
+    
+    listMatch = listDosPattern.match(listLine)
+    if listMatch != None:
+        entryYear = int(listMatch.group(3))
+        if entryYear < 100:
+            entryYear += 2000 if entryYear < 70 else 1900
+        entryHour = int(listMatch.group(4)) % 12
+        if listMatch.group(6).lower() == 'pm':
+            entryHour += 12
         
-        return int(response)
+        entryFacts = {'type': 'dir'}
+        if listMatch.group(7) != '<DIR>':
+            entryFacts = {'type': 'file', 'size': int(listMatch.group(7))}
+        entryFacts['modify'] = f'{entryYear:04}{listMatch.group(1)}{listMatch.group(2)}{entryHour:02}{listMatch.group(5)}00'
+        return (listMatch.group(8), entryFacts)
+    
+    return None
 ###############################################################################
+# Prompts are answered from this list (remaining script lines) when stdin is used for data
+promptInput = []
 def getUserInput(userPrompt = '', inputValue = '', getPassword = False, help = ''):
     defaultPrompt = 'pyFTP>'
     inputValue = inputValue.strip()
     if len(inputValue) > 0:
         return inputValue
+    
+    if len(promptInput) > 0:
+        return promptInput.pop(0).strip()
 
     userPrompt = userPrompt.strip()
     if len(userPrompt) > 0:
@@ -1097,6 +5218,7 @@ def getUserInput(userPrompt = '', inputValue = '', getPassword = False, help = '
     if getPassword == False:
         inputValue = input(f'{newPrompt} ').strip()
     else:
+        import getpass
         inputValue = getpass.getpass(f'{newPrompt} ').strip()
     
     if len(inputValue) == 0 and len(help) > 0:
@@ -1112,13 +5234,36 @@ def getYorN(userPrompt, validOptions = ['y', 'n', 'q']):
 
     return userOption
 ###############################################################################
+# Words, or text between double quotes (which may have spaces). Compiled once, commands are parsed for every line.
+inputParamsPattern = re.compile(r'(?<=")[\w\@\$\*\(\)\-\[\]\{\}\:\.\\/\? ]+(?=")|[\w\@\$\*\(\)\-\[\]\{\}\:\.\\/\?]+')
+
 def getInputParams(strInput = ''):
-    patternFile = "\w\@\$\*\(\)\-\[\]\{\}\:\.\\\/\?"
-    matchPattern = "(?<=\")[" + patternFile + " ]+(?=\")|" \
-                    "[" + patternFile + "]+"
-    return re.findall(matchPattern, strInput)
+    return inputParamsPattern.findall(strInput)
+###############################################################################
+# Report of --startup-benchmark, on stderr: wall time per phase and in total, then CPU time of the interpreter
+# before this module started loading, which is reported apart as its wall time is not known. phaseTimes has
+# (phase name, perf_counter value at the end of the phase), the first phase starting when this module started
+# loading. Returns False when the wall time took longer than timeBudget milliseconds (0 for no budget).
+#
+def startupReport(phaseTimes, timeBudget = 0):
+    reportLines = []
+    phaseStart = startupClock
+    for phaseName, phaseEnd in phaseTimes:
+        reportLines.append(f'{phaseName:<12}: {(phaseEnd - phaseStart) * 1000:>9.1f} ms')
+        phaseStart = phaseEnd
+    
+    totalTime = phaseStart - startupClock
+    reportLines.append(f'{"total":<12}: {totalTime * 1000:>9.1f} ms')
+    reportLines.append(f'{"interpreter":<12}: {startupCpu * 1000:>9.1f} ms (CPU, before loading)')
+    withinBudget = timeBudget == 0 or totalTime * 1000 <= timeBudget
+    if withinBudget == False:
+        reportLines.append(f'Over budget of {timeBudget} ms.')
+    
+    print('\n'.join(reportLines), file = sys.stderr)
+    return withinBudget
 ###############################################################################
 if __name__ == "__main__":
+    phaseTimes = [('imports', time.perf_counter())]
     defaultFolder = os.path.expanduser('~')
     ftpUser = ftpProcess()
 
@@ -1133,8 +5278,17 @@ if __name__ == "__main__":
     parser.add_argument('-d', dest='debug', default=False, action='store_true', help="Enables debugging")
     parser.add_argument('-t', dest='ssltls', default=False, action='store_true', help="Enables FTP over SSL/TLS (FTPS)")
     parser.add_argument('-s', dest='ftpcommandfile', metavar='filename', help="Specifies a text file containing FTP commands; the commands will automatically run after FTP starts.")
+    parser.add_argument('--profile', dest='profilefile', metavar='filename', help="Profiles every command, report of CPU time and wall time per command is written to filename on exit.")
+    parser.add_argument('--metrics', dest='metricsfile', metavar='filename', help="Appends a JSON line to filename for every command and every file transfer.")
+    parser.add_argument('--prometheus', dest='promfile', metavar='filename', help="Writes command and transfer counters to filename in Prometheus text format on exit (textfile collector).")
+    parser.add_argument('--tuning', dest='tuning', metavar='profile', help="Socket tuning profile: lan, wan or auto (buffers sized from round trip time, optionally followed by link speed in Mbit/s, e.g. \"auto 10000\").")
+    parser.add_argument('--bandwidth', dest='bandwidth', metavar='limit', help="Limits transfer rate of all transfers together, in bytes per second (e.g. 20M), optionally by time of day, e.g. \"08:00-18:00=20M 0\" (no limit at other times).")
+    parser.add_argument('--bandwidth-file', dest='bandwidthfile', metavar='filename', help="Reads bandwidth limits (as for --bandwidth) from filename, default ~/.pyftp/bandwidth.conf if it exists.")
+    parser.add_argument('--startup-benchmark', dest='startupbenchmark', default=False, action='store_true', help="Reports time spent on startup (imports, arguments, shell) and running the commands to stderr on exit.")
+    parser.add_argument('--startup-budget', dest='startupbudget', metavar='ms', type=int, default=0, help="With --startup-benchmark, exits with status 1 when the run took longer than ms milliseconds (wall time).")
     parser.add_argument('host', nargs='?', help="Specifies the host name or IP addess of the remote host to connect to.")
     args = parser.parse_args()
+    phaseTimes.append(('arguments', time.perf_counter()))
 
     if args.verbose:
         ftpUser.systStatus['verbose'] = False
@@ -1148,9 +5302,28 @@ if __name__ == "__main__":
     if args.ssltls:
         ftpUser.systStatus['secure'] = True
 
-    if args.host:
-        ftpUser.ftpCommand_open(args.host)
-    
+    if args.tuning:
+        ftpUser.ftpCommand_tuning(args.tuning)
+
+    bandwidthFile = os.path.join(defaultFolder, '.pyftp', 'bandwidth.conf')
+    if args.bandwidthfile:
+        ftpUser.ftpCommand_bandwidth(f'-file "{args.bandwidthfile}"')
+    elif os.path.isfile(bandwidthFile):
+        ftpUser.ftpCommand_bandwidth(f'-file "{bandwidthFile}"')
+
+    if args.bandwidth:
+        ftpUser.ftpCommand_bandwidth(args.bandwidth)
+
+    if args.profilefile:
+        ftpUser.ftpCommand_profile(f'on "{args.profilefile}"')
+
+    if args.metricsfile or args.promfile:
+        try:
+            ftpUser.commandMetrics = ftpMetrics(ftpUser, args.metricsfile, args.promfile)
+        except OSError as err:
+            print(f'Error opening metrics file: {err}')
+
+    scriptLines = []
     if args.ftpcommandfile:
         try:
             scriptFile = open(args.ftpcommandfile, 'r')
@@ -1158,10 +5331,41 @@ if __name__ == "__main__":
             print(f'Error opening script file {args.ftpcommandfile}.')
             ftpUser.ftpTerminate = True
         else:
-            for scriptLine in scriptFile:
-                ftpUser.ftpProcessCommand(scriptLine)
+            scriptLines = scriptFile.readlines()
             scriptFile.close()
+    
+    # When the script streams a file to stdout, all messages go to stderr so that they don't corrupt the data.
+    # When it streams a file from stdin, prompts (e.g. login) are answered from the script lines instead of stdin.
+    for scriptLine in scriptLines:
+        streamType = ftpUser.ftpCheckStream(scriptLine)
+        if streamType == 'stdout':
+            sys.stdout = sys.stderr
+        elif streamType == 'stdin':
+            promptInput = scriptLines
+    
+    phaseTimes.append(('shell', time.perf_counter()))
+    if args.host:
+        ftpUser.ftpCommand_open(args.host)
+    
+    while len(scriptLines) > 0:
+        ftpUser.ftpProcessCommand(scriptLines.pop(0))
         
     while(ftpUser.ftpTerminate == False):
-        getUserCommand = getUserInput()
-        ftpUser.ftpProcessCommand(getUserCommand)
\ No newline at end of file
+        try:
+            getUserCommand = getUserInput()
+        except EOFError:
+            # stdin closed (e.g. end of a pipeline) without bye/quit
+            ftpUser.ftpCommand_quit()
+        else:
+            ftpUser.ftpProcessCommand(getUserCommand)
+    
+    if ftpUser.commandProfile != None:
+        ftpUser.ftpCommand_profile('off')
+    
+    if ftpUser.commandMetrics != None:
+        ftpUser.commandMetrics.close()
+
+    if args.startupbenchmark == True:
+        phaseTimes.append(('commands', time.perf_counter()))
+        if startupReport(phaseTimes, args.startupbudget) == False:
+            sys.exit(1)
@@ -0,0 +1,245 @@
+###############################################################################
+# Unit tests of pyFTP parts which don't need a server: reply parsing of pipelined commands, bandwidth schedule
+# and sharing, and the local index of remote listings. Run from the repository with python -m pytest
+#
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pyFTP
+###############################################################################
+# Control connection on one end of a socket pair. The other end (serverSock) has the replies written to it before
+# the commands are sent; with answerNoop, a thread answers each NOOP received with a 200 reply.
+#
+class fakeConnection():
+    def __init__(self, answerNoop = True):
+        self.ftpConn = pyFTP.ftpConnection()
+        self.ftpConn.sock, self.serverSock = socket.socketpair()
+        self.ftpConn.sock.settimeout(5)
+        self.answerNoop = answerNoop
+        self.noopThread = threading.Thread(target = self.answerCommands, daemon = True)
+        self.noopThread.start()
+
+    def answerCommands(self):
+        commandData = b''
+        while True:
+            try:
+                receivedData = self.serverSock.recv(8192)
+            except OSError:
+                return
+            if len(receivedData) == 0:
+                return
+
+            commandData += receivedData
+            while b'\n' in commandData:
+                commandLine, commandData = commandData.split(b'\n', 1)
+                if commandLine.strip() == b'NOOP' and self.answerNoop == True:
+                    self.serverSock.sendall(b'200 NOOP ok.\r\n')
+
+    def reply(self, replyText):
+        self.serverSock.sendall(replyText.encode())
+
+    def close(self):
+        self.ftpConn.sock.close()
+        self.serverSock.close()
+        self.noopThread.join(1)
+###############################################################################
+class testReadReply(unittest.TestCase):
+    def setUp(self):
+        self.fakeConn = fakeConnection()
+
+    def tearDown(self):
+        self.fakeConn.close()
+
+    def test_single_line(self):
+        self.fakeConn.reply('250 DELE ok.\r\n')
+        replyBuffer = [b'']
+        self.assertEqual(self.fakeConn.ftpConn.readreply(replyBuffer), '250 DELE ok.')
+        self.assertEqual(replyBuffer[0], b'')
+
+    def test_multi_line_keeps_next_reply(self):
+        self.fakeConn.reply('211-Features:\r\n MDTM\r\n211x not the end\r\n211 End\r\n213 5\r\n')
+        replyBuffer = [b'']
+        self.assertEqual(self.fakeConn.ftpConn.readreply(replyBuffer), '211-Features:\n MDTM\n211x not the end\n211 End')
+        self.assertEqual(replyBuffer[0], b'213 5\r\n')
+        self.assertEqual(self.fakeConn.ftpConn.readreply(replyBuffer), '213 5')
+
+    def test_reply_from_buffer(self):
+        replyBuffer = [b'250 first\r\n250 second\r\n']
+        self.assertEqual(self.fakeConn.ftpConn.readreply(replyBuffer), '250 first')
+        self.assertEqual(self.fakeConn.ftpConn.readreply(replyBuffer), '250 second')
+
+    def test_reply_in_pieces(self):
+        replyBuffer = [b'250 DE']
+        self.fakeConn.reply('LE ok.\r\n')
+        self.assertEqual(self.fakeConn.ftpConn.readreply(replyBuffer), '250 DELE ok.')
+
+    def test_connection_closed(self):
+        self.fakeConn.serverSock.shutdown(socket.SHUT_WR)
+        with self.assertRaises(EOFError):
+            self.fakeConn.ftpConn.readreply([b''])
+###############################################################################
+class testPipelineCmd(unittest.TestCase):
+    def tearDown(self):
+        self.fakeConn.close()
+
+    def test_replies_in_sequence(self):
+        self.fakeConn = fakeConnection()
+        self.fakeConn.reply('250 DELE ok.\r\n213 5\r\n257 "/new" created.\r\n')
+        self.assertEqual(self.fakeConn.ftpConn.pipelinecmd(['DELE a', 'SIZE b', 'MKD new']),
+                         (['250 DELE ok.', '213 5', '257 "/new" created.'], True))
+
+    def test_error_replies_in_sequence(self):
+        self.fakeConn = fakeConnection()
+        self.fakeConn.reply('550 No such file.\r\n450 Busy.\r\n')
+        self.assertEqual(self.fakeConn.ftpConn.pipelinecmd(['DELE a', 'DELE b']), (['550 No such file.', '450 Busy.'], True))
+
+    def test_unexpected_reply_resyncs(self):
+        self.fakeConn = fakeConnection()
+        self.fakeConn.reply('250 DELE ok.\r\n200 Unexpected.\r\n')
+        self.assertEqual(self.fakeConn.ftpConn.pipelinecmd(['DELE a', 'DELE b', 'DELE c'], 1), (['250 DELE ok.'], True))
+
+    def test_extra_reply_resyncs(self):
+        self.fakeConn = fakeConnection()
+        self.fakeConn.reply('250 DELE ok.\r\n250 Extra.\r\n')
+        replyList, inSequence = self.fakeConn.ftpConn.pipelinecmd(['DELE a'], 1)
+        self.assertEqual((replyList, inSequence), (['250 DELE ok.'], True))
+        # The NOOP reply was taken by the resync, nothing is left for the next command
+        self.fakeConn.reply('213 7\r\n')
+        self.assertEqual(self.fakeConn.ftpConn.readreply([b'']), '213 7')
+
+    def test_missing_reply_without_resync(self):
+        self.fakeConn = fakeConnection(answerNoop = False)
+        self.fakeConn.reply('250 DELE ok.\r\n')
+        self.assertEqual(self.fakeConn.ftpConn.pipelinecmd(['DELE a', 'DELE b'], 0.05), (['250 DELE ok.'], False))
+
+    def test_connection_closed(self):
+        self.fakeConn = fakeConnection()
+        self.fakeConn.reply('250 DELE ok.\r\n')
+        self.fakeConn.serverSock.shutdown(socket.SHUT_WR)
+        self.assertEqual(self.fakeConn.ftpConn.pipelinecmd(['DELE a', 'DELE b'], 1), (['250 DELE ok.'], False))
+###############################################################################
+class testRateSchedule(unittest.TestCase):
+    def test_global_rate(self):
+        self.assertEqual(pyFTP.parseRateSchedule(['20M']), (20 * 1024 * 1024, []))
+        self.assertEqual(pyFTP.parseRateSchedule(['*=512K']), (512 * 1024, []))
+        self.assertEqual(pyFTP.parseRateSchedule([]), (0, []))
+
+    def test_time_windows(self):
+        self.assertEqual(pyFTP.parseRateSchedule(['08:00-18:30=20M', '22-6=1K', 'off']),
+                         (0, [(480, 1110, 20 * 1024 * 1024), (1320, 360, 1024)]))
+
+    def test_invalid_entries(self):
+        for scheduleEntry in ['fast', '08:00-18:00=fast', '08:00=1M', '08:00-09:00-10:00=1M', '25:00-26:00=1M',
+                              '08:60-09:00=1M', 'a:00-09:00=1M', '-1K']:
+            with self.subTest(scheduleEntry = scheduleEntry):
+                with self.assertRaises(ValueError):
+                    pyFTP.parseRateSchedule([scheduleEntry])
+
+    def test_current_rate(self):
+        def localTime(hourNow, minuteNow):
+            return time.mktime((2024, 1, 15, hourNow, minuteNow, 0, 0, 0, -1))
+
+        rateLimit = pyFTP.ftpBandwidth()
+        rateLimit.setLimit(*pyFTP.parseRateSchedule(['08:00-18:00=2K', '22:00-06:00=1K', '4K']))
+        self.assertEqual(rateLimit.currentRate(localTime(8, 0)), 2048)
+        self.assertEqual(rateLimit.currentRate(localTime(17, 59)), 2048)
+        self.assertEqual(rateLimit.currentRate(localTime(18, 0)), 4096)
+        self.assertEqual(rateLimit.currentRate(localTime(23, 30)), 1024)
+        self.assertEqual(rateLimit.currentRate(localTime(5, 59)), 1024)
+        self.assertEqual(rateLimit.currentRate(localTime(6, 0)), 4096)
+###############################################################################
+class testShareRate(unittest.TestCase):
+    def setUp(self):
+        self.rateLimit = pyFTP.ftpBandwidth()
+
+    def test_no_limit(self):
+        self.assertIsNone(self.rateLimit.start())
+        rateBucket = self.rateLimit.start(300)
+        self.assertEqual(self.rateLimit.shareRate(rateBucket), 300)
+
+    def test_equal_shares(self):
+        self.rateLimit.setLimit(1000)
+        firstBucket = self.rateLimit.start()
+        self.assertEqual(self.rateLimit.shareRate(firstBucket), 1000)
+        secondBucket = self.rateLimit.start()
+        self.assertEqual(self.rateLimit.shareRate(firstBucket), 500)
+        self.assertEqual(self.rateLimit.shareRate(secondBucket), 500)
+        self.rateLimit.end(secondBucket)
+        self.assertEqual(self.rateLimit.shareRate(firstBucket), 1000)
+
+    def test_weighted_shares(self):
+        self.rateLimit.setLimit(1000)
+        lightBucket = self.rateLimit.start(transferWeight = 1)
+        heavyBucket = self.rateLimit.start(transferWeight = 3)
+        self.assertEqual(self.rateLimit.shareRate(lightBucket), 250)
+        self.assertEqual(self.rateLimit.shareRate(heavyBucket), 750)
+
+    def test_capped_transfer_leaves_rest(self):
+        self.rateLimit.setLimit(1000)
+        cappedBucket = self.rateLimit.start(100)
+        firstBucket = self.rateLimit.start()
+        secondBucket = self.rateLimit.start()
+        self.assertEqual(self.rateLimit.shareRate(cappedBucket), 100)
+        self.assertEqual(self.rateLimit.shareRate(firstBucket), 450)
+        self.assertEqual(self.rateLimit.shareRate(secondBucket), 450)
+
+    def test_cap_above_share(self):
+        self.rateLimit.setLimit(1000)
+        cappedBucket = self.rateLimit.start(800)
+        otherBucket = self.rateLimit.start()
+        self.assertEqual(self.rateLimit.shareRate(cappedBucket), 500)
+        self.assertEqual(self.rateLimit.shareRate(otherBucket), 500)
+###############################################################################
+class testIndexStoreDir(unittest.TestCase):
+    def setUp(self):
+        self.homeDir = tempfile.TemporaryDirectory()
+        self.savedHome = os.environ.get('HOME')
+        os.environ['HOME'] = self.homeDir.name
+        self.remoteIndex = pyFTP.ftpIndex('u@localhost:21')
+
+    def tearDown(self):
+        self.remoteIndex.indexDb.close()
+        if self.savedHome == None:
+            os.environ.pop('HOME', None)
+        else:
+            os.environ['HOME'] = self.savedHome
+        self.homeDir.cleanup()
+
+    def test_new_subdirectories(self):
+        rootEntries = [('a.txt', {'type': 'file', 'size': 5, 'modify': '20240101000000'}),
+                       ('sub', {'type': 'dir', 'modify': '20240102000000'})]
+        self.assertEqual(self.remoteIndex.storeDir('/pub', '20240103000000', rootEntries), ['/pub/sub'])
+        self.assertEqual(self.remoteIndex.storeDir('/pub/sub', None, []), [])
+        self.assertEqual(self.remoteIndex.storeDir('/pub', '20240103000000', rootEntries), [])
+        self.assertEqual(self.remoteIndex.entries('/pub')[0], sorted(rootEntries))
+        # Modify time of a directory stored without one comes from its entry in the parent
+        self.assertEqual(self.remoteIndex.dirs('/pub'), {'/pub': '20240103000000', '/pub/sub': '20240102000000'})
+
+    def test_removed_subdirectory_tree(self):
+        self.remoteIndex.storeDir('/pub', None, [('sub', {'type': 'dir'}), ('subdir', {'type': 'dir'})])
+        self.remoteIndex.storeDir('/pub/sub', None, [('deep', {'type': 'dir'})])
+        self.remoteIndex.storeDir('/pub/sub/deep', None, [('b.txt', {'type': 'file'})])
+        self.remoteIndex.storeDir('/pub/subdir', None, [('c.txt', {'type': 'file'})])
+        self.assertEqual(self.remoteIndex.storeDir('/pub', None, [('subdir', {'type': 'dir'})]), [])
+        self.assertEqual(set(self.remoteIndex.dirs('/pub')), {'/pub', '/pub/subdir'})
+        self.assertIsNone(self.remoteIndex.entries('/pub/sub'))
+        self.assertIsNone(self.remoteIndex.entries('/pub/sub/deep'))
+        self.assertEqual(self.remoteIndex.entries('/pub/subdir')[0], [('c.txt', {'type': 'file'})])
+
+    def test_directory_replaced_by_file(self):
+        self.remoteIndex.storeDir('/pub', None, [('data', {'type': 'dir'})])
+        self.remoteIndex.storeDir('/pub/data', None, [('old.txt', {'type': 'file'})])
+        self.assertEqual(self.remoteIndex.storeDir('/pub', None, [('data', {'type': 'file', 'size': 9})]), [])
+        self.assertEqual(self.remoteIndex.entries('/pub')[0], [('data', {'type': 'file', 'size': 9})])
+        self.assertEqual(set(self.remoteIndex.dirs('/pub')), {'/pub'})
+        self.assertIsNone(self.remoteIndex.entries('/pub/data'))
+
+
+if __name__ == '__main__':
+    unittest.main()